@@ -0,0 +1,190 @@
+"""
+Cosmos DB 集計クエリ（サーバー側で集計し、必要な項目だけを受け取る）
+
+ドキュメント全体を取得してPython側で合計する代わりに、
+SELECT VALUE SUM(...) 形式のクエリを発行してサーバー側で集計する。
+azure-cosmos のクロスパーティションクエリは GROUP BY に対応していないため、
+グループ別の集計はグループごとのクエリを並列に実行して結果をマージする。
+コンテナは storage.get_container() のものを渡す。
+"""
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+# 並列実行する集計クエリの最大数
+MAX_CONCURRENCY = 8
+
+# グループ数がこれを超える場合はグループごとのクエリをやめ、
+# 必要な項目だけを射影して取得しPython側でマージする
+MAX_GROUP_FANOUT = 32
+
+# 集計の定義: 出力名 -> (関数, 項目名)
+# 関数は "COUNT" または "SUM"。COUNTの項目名はNoneでよい
+Metrics = Dict[str, Tuple[str, Optional[str]]]
+
+
+def _metric_expression(function: str, field: Optional[str]) -> str:
+    """集計関数のSQL式を組み立てる"""
+    if function == "COUNT":
+        return "COUNT(1)"
+    if function == "SUM":
+        # 数値でない値（nullなど）が混じるとSUM全体がundefinedになるため0として扱う
+        return f"SUM(IS_NUMBER(c.{field}) ? c.{field} : 0)"
+    raise ValueError(f"Unsupported aggregate function: {function}")
+
+
+def _where(conditions: Optional[List[str]]) -> str:
+    if not conditions:
+        return ""
+    return " WHERE " + " AND ".join(conditions)
+
+
+def build_scalar_query(function: str, field: Optional[str], conditions: Optional[List[str]] = None) -> str:
+    """単一の集計値を返すクエリを組み立てる"""
+    return f"SELECT VALUE {_metric_expression(function, field)} FROM c{_where(conditions)}"
+
+
+async def _run_scalar(container, query: str, parameters: List[dict], semaphore: asyncio.Semaphore):
+    # クロスパーティション集計ではSDKがパーティションごとの部分結果をまとめるが、
+    # 念のため返ってきた値をすべて合算する
+    total = 0
+    async with semaphore:
+        async for value in container.query_items(query=query, parameters=parameters):
+            if isinstance(value, (int, float)):
+                total += value
+    return total
+
+
+async def _gather(queries: Dict[object, tuple]) -> Dict[object, float]:
+    """キー -> (コンテナ, クエリ, パラメータ) を同時実行数を制限して並列に実行"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    values = await asyncio.gather(*(
+        _run_scalar(container, query, parameters, semaphore)
+        for container, query, parameters in queries.values()
+    ))
+    return dict(zip(queries, values))
+
+
+def _scalar_queries(container, metrics: Metrics, conditions, parameters) -> Dict[str, tuple]:
+    return {
+        name: (container, build_scalar_query(function, field, conditions), parameters or [])
+        for name, (function, field) in metrics.items()
+    }
+
+
+async def aggregate(
+    container,
+    metrics: Metrics,
+    conditions: Optional[List[str]] = None,
+    parameters: Optional[List[dict]] = None
+) -> Dict[str, float]:
+    """
+    複数の集計値を並列に取得
+
+    Args:
+        container: Cosmos DBコンテナ
+        metrics: 出力名 -> (関数, 項目名)
+        conditions: WHERE句の条件（ANDで結合）
+        parameters: クエリパラメータ
+
+    Returns:
+        出力名 -> 集計値
+    """
+    return await _gather(_scalar_queries(container, metrics, conditions, parameters))
+
+
+async def aggregate_many(
+    container,
+    batches: Dict[str, Tuple[Metrics, Optional[List[str]], Optional[List[dict]]]]
+) -> Dict[str, Dict[str, float]]:
+    """
+    条件の異なる複数の集計をまとめて並列に取得
+
+    Args:
+        batches: 名前 -> (metrics, conditions, parameters)
+
+    Returns:
+        名前 -> (出力名 -> 集計値)
+    """
+    queries = {
+        (key, name): query
+        for key, (metrics, conditions, parameters) in batches.items()
+        for name, query in _scalar_queries(container, metrics, conditions, parameters).items()
+    }
+    values = await _gather(queries)
+    return {
+        key: {name: values[(key, name)] for name in metrics}
+        for key, (metrics, _, _) in batches.items()
+    }
+
+
+async def distinct_values(
+    container,
+    field: str,
+    conditions: Optional[List[str]] = None,
+    parameters: Optional[List[dict]] = None
+) -> list:
+    """項目の値の一覧を取得"""
+    query = f"SELECT DISTINCT VALUE c.{field} FROM c{_where(conditions)}"
+    return [value async for value in container.query_items(query=query, parameters=parameters or [])]
+
+
+async def _aggregate_by_projection(container, group_field, metrics, conditions, parameters) -> List[dict]:
+    """必要な項目だけを射影して取得し、Python側でグループ別に集計"""
+    fields = {group_field} | {field for function, field in metrics.values() if field}
+    query = f"SELECT {', '.join(f'c.{f}' for f in sorted(fields))} FROM c{_where(conditions)}"
+    groups = {}
+    async for item in container.query_items(query=query, parameters=parameters):
+        key = item.get(group_field)
+        if key not in groups:
+            groups[key] = {group_field: key, **{name: 0 for name in metrics}}
+        for name, (function, field) in metrics.items():
+            if function == "COUNT":
+                groups[key][name] += 1
+            elif isinstance(item.get(field), (int, float)):
+                groups[key][name] += item[field]
+    return list(groups.values())
+
+
+async def aggregate_by(
+    container,
+    group_field: str,
+    metrics: Metrics,
+    conditions: Optional[List[str]] = None,
+    parameters: Optional[List[dict]] = None
+) -> List[dict]:
+    """
+    グループ別の集計（GROUP BY相当）
+
+    グループの値を DISTINCT で列挙し、グループ×集計ごとのクエリを並列に実行してマージする。
+    グループ数が多い場合は射影クエリ1本に切り替える。
+
+    Returns:
+        [{group_field: 値, 出力名: 集計値, ...}, ...]
+    """
+    conditions = conditions or []
+    parameters = parameters or []
+
+    keys = await distinct_values(container, group_field, conditions, parameters)
+    if len(keys) > MAX_GROUP_FANOUT:
+        return await _aggregate_by_projection(container, group_field, metrics, conditions, parameters)
+
+    queries = {}
+    for index, key in enumerate(keys):
+        if key is None:
+            group_conditions = conditions + [f"(NOT IS_DEFINED(c.{group_field}) OR IS_NULL(c.{group_field}))"]
+            group_parameters = parameters
+        else:
+            group_conditions = conditions + [f"c.{group_field} = @group{index}"]
+            group_parameters = parameters + [{"name": f"@group{index}", "value": key}]
+        for name, (function, field) in metrics.items():
+            query = build_scalar_query(function, field, group_conditions)
+            queries[(index, name)] = (container, query, group_parameters)
+
+    values = await _gather(queries)
+    results = []
+    for index, key in enumerate(keys):
+        row = {group_field: key}
+        for name in metrics:
+            row[name] = values[(index, name)]
+        results.append(row)
+    return results
@@ -0,0 +1,132 @@
+"""
+Cosmos DB アクセスの同時実行ベンチマーク（同期SDK と 非同期SDK の比較）
+
+async def のハンドラーから同期SDKを呼ぶと、1回の通信のあいだイベントループ全体が止まる。
+このスクリプトは同じ読み取りを同時に N 件発行し、以下の2通りでスループットを比べる。
+
+- blocking: 以前のルーターと同じく、コルーチンの中で同期SDK（azure.cosmos）を呼ぶ
+- async:    azure.cosmos.aio のクライアントを共有して await する（現在のルーター）
+
+あわせて、イベントループの遅延（10msごとのタイマーが何ms遅れたか）を計測し、
+他のリクエストがどれだけ待たされるかを示す。
+
+使い方:
+    python benchmark_cosmos_concurrency.py                          # timers の stopwatch-fixed をポイント読み取り
+    python benchmark_cosmos_concurrency.py --requests 500 --concurrency 64
+    python benchmark_cosmos_concurrency.py --container records --query "SELECT TOP 50 * FROM c"
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from dotenv import load_dotenv
+from azure.cosmos import CosmosClient
+from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+
+# 環境変数読み込み
+load_dotenv()
+
+# イベントループの遅延を計測する間隔（秒）
+LAG_PROBE_INTERVAL = 0.01
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def probe_loop_lag(stop: asyncio.Event, lags: list):
+    """一定間隔でsleepし、予定より遅れて再開した時間を記録する"""
+    while not stop.is_set():
+        expected = time.perf_counter() + LAG_PROBE_INTERVAL
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def run(label: str, operation, requests: int, concurrency: int) -> dict:
+    """operation を同時実行数 concurrency で requests 回実行して計測する"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await operation()
+            latencies.append(time.perf_counter() - started)
+
+    probe = asyncio.create_task(probe_loop_lag(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    result = {
+        "label": label,
+        "requests": requests,
+        "seconds": elapsed,
+        "rps": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "max_loop_lag_ms": max(lags, default=0.0) * 1000,
+    }
+    print(
+        f"{label:<9} {result['rps']:8.1f} req/s  "
+        f"p50 {result['p50_ms']:7.1f}ms  p95 {result['p95_ms']:7.1f}ms  "
+        f"max loop lag {result['max_loop_lag_ms']:7.1f}ms  ({elapsed:.2f}s)"
+    )
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="同期SDKと非同期SDKの同時実行スループットを比較")
+    parser.add_argument("--container", default="timers", help="対象コンテナ")
+    parser.add_argument("--item", default="stopwatch-fixed", help="ポイント読み取りするID（パーティションキーも同じ値）")
+    parser.add_argument("--query", default=None, help="指定するとポイント読み取りの代わりにこのクエリを実行")
+    parser.add_argument("--requests", type=int, default=200, help="発行する総数")
+    parser.add_argument("--concurrency", type=int, default=32, help="同時実行数")
+    args = parser.parse_args()
+
+    endpoint = os.getenv("COSMOS_ENDPOINT")
+    key = os.getenv("COSMOS_KEY")
+    database_name = os.getenv("COSMOS_DATABASE_NAME", "my-app-db")
+
+    sync_container = CosmosClient(endpoint, key).get_database_client(database_name).get_container_client(args.container)
+    async_client = AsyncCosmosClient(endpoint, key)
+    async_container = async_client.get_database_client(database_name).get_container_client(args.container)
+
+    if args.query:
+        async def blocking_operation():
+            list(sync_container.query_items(query=args.query, enable_cross_partition_query=True))
+
+        async def async_operation():
+            [item async for item in async_container.query_items(query=args.query)]
+    else:
+        async def blocking_operation():
+            sync_container.read_item(item=args.item, partition_key=args.item)
+
+        async def async_operation():
+            await async_container.read_item(item=args.item, partition_key=args.item)
+
+    target = args.query or f"read_item({args.item})"
+    print(f"=== {args.container}: {target} / {args.requests}件 / 同時実行数 {args.concurrency} ===\n")
+
+    try:
+        # 接続の確立やメタデータの取得を計測から除くため、先に1回ずつ実行する
+        await blocking_operation()
+        await async_operation()
+
+        before = await run("blocking", blocking_operation, args.requests, args.concurrency)
+        after = await run("async", async_operation, args.requests, args.concurrency)
+    finally:
+        await async_client.close()
+
+    print(f"\nスループット: {after['rps'] / before['rps']:.1f}倍")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,367 @@
+"""
+エンドポイントの負荷テスト（スループット・レイテンシ・メモリ）
+
+Cosmos DB の代わりに埋め込みSQLite（STORAGE_BACKEND=sqlite）で main.app を起動し、
+実運用に近い件数のデータを投入してから、主要なエンドポイントに同時にリクエストを送る。
+アプリはプロセス内で呼び出す（httpx の ASGITransport）ため、ネットワークは通らない。
+
+シナリオごとに以下を計測し、JSON で出力する（前回の結果と比べて性能の劣化を調べる）。
+
+- レイテンシ: p50 / p95 / p99 / 平均 / 最大（ミリ秒）
+- スループット: 1秒あたりのリクエスト数
+- メモリ: シナリオ前後の RSS と、プロセスのピーク RSS
+- エラー数（2xx・304 以外）とレスポンスの平均バイト数
+
+使い方:
+    python benchmark_endpoints.py                                   # 記録10万件・レシピ2千件・TODO5千件
+    python benchmark_endpoints.py --records 10000 --requests 200    # 小さめの構成で素早く
+    python benchmark_endpoints.py --output result.json              # 結果をファイルに保存
+    python benchmark_endpoints.py --compare result.json             # 前回の結果との比較も表示
+    python benchmark_endpoints.py --db bench.db --reuse             # 投入済みのデータベースを使い回す
+    python benchmark_endpoints.py --scenarios recipes_list todos_list
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+TAGS = ["作業", "勉強", "運動", "読書", "家事", None]
+RECIPE_WORDS = ["カレー", "パスタ", "味噌汁", "ハンバーグ", "サラダ", "唐揚げ", "オムライス", "鍋", "炒飯", "グラタン"]
+INGREDIENTS = ["玉ねぎ", "にんじん", "じゃがいも", "豚こま肉", "鶏もも肉", "卵", "キャベツ", "トマト", "しめじ", "豆腐"]
+
+# シナリオ: 名前 -> (パス, クエリパラメータ, 条件付きGETか)
+# {timer_id} は投入したタイマーのIDに置き換える
+SCENARIOS = {
+    "timers_list": ("/api/timers/", {}, False),
+    "timers_list_304": ("/api/timers/", {}, True),
+    "timer_records": ("/api/timers/{timer_id}/records", {}, False),
+    "records_page": ("/api/records/", {"pageSize": 100}, False),
+    "records_summary": ("/api/records/stats/summary", {}, False),
+    "records_heatmap": ("/api/records/stats/heatmap", {}, False),
+    "recipes_list": ("/api/recipes/", {}, False),
+    "recipes_list_304": ("/api/recipes/", {}, True),
+    "recipes_page": ("/api/recipes/", {"limit": 20, "fields": "name,tags,isFavorite,timesCooked"}, False),
+    "recipes_search": ("/api/recipes/", {"search": "カレー"}, False),
+    "recipes_search_ranked": ("/api/recipes/", {"search": "カレー", "sort": "relevance", "limit": 20}, False),
+    "todos_list": ("/api/todos", {"limit": 1000}, False),
+    "settings": ("/api/settings/", {}, False),
+}
+
+
+# ----------------------------------------------------------------------
+# データの投入
+# ----------------------------------------------------------------------
+
+def make_timers(count: int) -> List[dict]:
+    return [
+        {
+            "id": f"timer-bench-{index}",
+            "name": f"タイマー{index}",
+            "duration": 25 * 60,
+            "image": None,
+            "type": "countdown",
+            "order": index,
+            "isFavorite": index % 5 == 0,
+        }
+        for index in range(count)
+    ]
+
+
+def make_records(count: int, timers: List[dict]) -> List[dict]:
+    """直近1年に散らばった記録"""
+    now = datetime.now().replace(microsecond=0)
+    records = []
+    for index in range(count):
+        timer = timers[index % len(timers)]
+        started = now - timedelta(seconds=random.randint(0, 365 * 24 * 3600))
+        duration = random.randint(60, 3 * 3600)
+        tag = random.choice(TAGS)
+        records.append({
+            "id": f"record-bench-{index}",
+            "timerId": timer["id"],
+            "timerName": timer["name"],
+            "startTime": started.isoformat(),
+            "endTime": (started + timedelta(seconds=duration)).isoformat(),
+            "duration": duration,
+            "tag": tag,
+            "stamp": None,
+            "comment": "集中できた" if index % 7 == 0 else None,
+            "date": started.strftime("%Y-%m-%d"),
+        })
+    return records
+
+
+def make_recipes(count: int) -> List[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"{random.choice(RECIPE_WORDS)}{index}",
+            "ingredients": [f"{name} {random.randint(1, 300)}g" for name in random.sample(INGREDIENTS, 6)],
+            "steps": [f"手順{step}: 材料を切って{random.choice(['炒める', '煮込む', '焼く', '混ぜる'])}。" * 3 for step in range(6)],
+            "cookingTime": random.randint(5, 120),
+            "source": f"https://example.com/recipes/{index}",
+            "tags": random.sample(["和食", "洋食", "中華", "時短", "作り置き", "お弁当"], 2),
+            "isFavorite": index % 10 == 0,
+            "timesCooked": random.randint(0, 30),
+            "createdAt": (now - timedelta(minutes=index)).isoformat() + "Z",
+        }
+        for index in range(count)
+    ]
+
+
+def make_todos(count: int) -> List[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "title": f"TODO {index}",
+            "description": "詳細メモ" * 5 if index % 2 == 0 else None,
+            "priority": random.choice(["high", "medium", "low"]),
+            "dueDate": (now + timedelta(days=random.randint(-10, 30))).isoformat(),
+            "category": random.choice(["家事", "仕事", "買い物", None]),
+            "tags": random.sample(["急ぎ", "週末", "定期", "メモ"], 2),
+            "completed": index % 3 == 0,
+            "completedAt": None,
+            "createdAt": (now - timedelta(minutes=index)).isoformat(),
+            "subtasks": [{"id": str(uuid.uuid4()), "title": f"サブタスク{n}", "completed": False} for n in range(3)],
+            "recurring": None,
+        }
+        for index in range(count)
+    ]
+
+
+def seed(args) -> Dict[str, int]:
+    """テーブルを作り直してデータを投入する（件数を返す）"""
+    import rollups
+    import records_store
+    import sqlite_storage
+    from database import RECIPES_CONTAINER, RECORD_ROLLUPS_CONTAINER, TIMERS_CONTAINER, TODOS_CONTAINER
+
+    random.seed(args.seed)
+    timers = make_timers(args.timers)
+    records = make_records(args.records, timers)
+    counts = {}
+    for name, documents in (
+        (TIMERS_CONTAINER, timers),
+        (records_store.query_container().id, records),
+        (RECORD_ROLLUPS_CONTAINER, rollups.build_buckets(records)),
+        (RECIPES_CONTAINER, make_recipes(args.recipes)),
+        (TODOS_CONTAINER, make_todos(args.todos)),
+    ):
+        counts[name] = sqlite_storage.get_sync_container(name).bulk_upsert(documents)
+    return counts
+
+
+# ----------------------------------------------------------------------
+# 計測
+# ----------------------------------------------------------------------
+
+def percentile(values: List[float], p: float) -> float:
+    """線形補間のパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def rss_bytes() -> Optional[int]:
+    """現在の常駐メモリ（Linux以外は None）"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト、Linux はキロバイト
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def run_scenario(client, name: str, path: str, params: dict, conditional: bool, requests: int, concurrency: int) -> dict:
+    headers = {}
+    if conditional:
+        # 1回目の ETag を付けて送る（変更がなければすべて 304 になる）
+        response = await client.get(path, params=params)
+        headers["If-None-Match"] = response.headers.get("etag", "")
+
+    # 接続・キャッシュの準備を計測から除く
+    for _ in range(min(5, requests)):
+        await client.get(path, params=params, headers=headers)
+
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    total_bytes = 0
+    queue = iter(range(requests))
+    rss_before = rss_bytes()
+
+    async def worker():
+        nonlocal total_bytes
+        for _ in queue:
+            started = time.perf_counter()
+            response = await client.get(path, params=params, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            total_bytes += len(response.content)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    errors = sum(count for status, count in statuses.items() if not (200 <= status < 300 or status == 304))
+    return {
+        "scenario": name,
+        "path": path,
+        "params": params,
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "rps": requests / elapsed if elapsed > 0 else 0.0,
+        "latencyMs": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "max": max(latencies, default=0.0),
+        },
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": errors,
+        "meanResponseBytes": total_bytes / requests if requests else 0,
+        "memory": {
+            "rssBeforeBytes": rss_before,
+            "rssAfterBytes": rss_bytes(),
+            "peakRssBytes": peak_rss_bytes(),
+        },
+    }
+
+
+def compare(results: dict, baseline_path: str):
+    """前回の結果と比べて、p95 と rps の変化を表示する"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {scenario["scenario"]: scenario for scenario in json.load(f)["scenarios"]}
+    print(f"\n=== 比較: {baseline_path} ===", file=sys.stderr)
+    for scenario in results["scenarios"]:
+        before = baseline.get(scenario["scenario"])
+        if before is None:
+            continue
+        p95_ratio = scenario["latencyMs"]["p95"] / before["latencyMs"]["p95"] if before["latencyMs"]["p95"] else 0.0
+        rps_ratio = scenario["rps"] / before["rps"] if before["rps"] else 0.0
+        print(
+            f"  {scenario['scenario']:18} p95 {before['latencyMs']['p95']:8.1f} → {scenario['latencyMs']['p95']:8.1f}ms"
+            f"（{p95_ratio:.2f}倍）  rps {before['rps']:8.1f} → {scenario['rps']:8.1f}（{rps_ratio:.2f}倍）",
+            file=sys.stderr
+        )
+
+
+async def main_async(args) -> dict:
+    import main
+    import httpx
+    from jose import jwt
+
+    seed_seconds = None
+    counts = None
+    if not args.reuse:
+        started = time.perf_counter()
+        counts = seed(args)
+        seed_seconds = time.perf_counter() - started
+
+    token = jwt.encode({"sub": "benchmark"}, main.SECRET_KEY, algorithm=main.ALGORITHM)
+    async with main.app.router.lifespan_context(main.app):
+        await main.app.state.bootstrap_task
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://benchmark",
+            headers={"Authorization": f"Bearer {token}", "Accept-Encoding": args.accept_encoding},
+            timeout=None
+        ) as client:
+            timers = (await client.get("/api/timers/")).json()
+            timer_id = timers[0]["id"] if timers else "timer-bench-0"
+            scenarios = []
+            for name in args.scenarios:
+                path, params, conditional = SCENARIOS[name]
+                path = path.replace("{timer_id}", timer_id)
+                result = await run_scenario(client, name, path, params, conditional, args.requests, args.concurrency)
+                scenarios.append(result)
+                print(
+                    f"{name:22} p50 {result['latencyMs']['p50']:8.1f}ms  p95 {result['latencyMs']['p95']:8.1f}ms"
+                    f"  p99 {result['latencyMs']['p99']:8.1f}ms  {result['rps']:8.1f} req/s  errors {result['errors']}",
+                    file=sys.stderr
+                )
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storageBackend": os.environ["STORAGE_BACKEND"],
+            "database": os.environ["SQLITE_PATH"],
+            "seed": args.seed,
+            "seededCounts": counts,
+            "seedSeconds": seed_seconds,
+            "requestsPerScenario": args.requests,
+            "concurrency": args.concurrency,
+            "acceptEncoding": args.accept_encoding,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="主要エンドポイントの負荷テスト（SQLiteで起動）")
+    parser.add_argument("--records", type=int, default=100_000, help="投入する記録の件数")
+    parser.add_argument("--recipes", type=int, default=2_000, help="投入するレシピの件数")
+    parser.add_argument("--todos", type=int, default=5_000, help="投入するTODOの件数")
+    parser.add_argument("--timers", type=int, default=20, help="投入するタイマーの件数")
+    parser.add_argument("--requests", type=int, default=500, help="シナリオごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時リクエスト数")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS), help="実行するシナリオ")
+    parser.add_argument("--accept-encoding", default="identity", help="リクエストの Accept-Encoding（圧縮込みで計測する場合は gzip など）")
+    parser.add_argument("--db", default=None, help="SQLiteのファイル（省略時は一時ディレクトリ）")
+    parser.add_argument("--reuse", action="store_true", help="データを投入せず --db の内容をそのまま使う")
+    parser.add_argument("--seed", type=int, default=0, help="データ生成の乱数シード")
+    parser.add_argument("--output", default=None, help="結果のJSONの保存先（省略時は標準出力）")
+    parser.add_argument("--compare", default=None, help="比較する前回の結果のJSON")
+    args = parser.parse_args()
+    if args.reuse and not args.db:
+        parser.error("--reuse requires --db")
+
+    # main を読み込む前に、ストレージとファイルの保存先を切り替える
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.abspath(args.db) if args.db else os.path.join(workdir, "benchmark.db")
+    os.environ["CHANGE_FEED_STATE_PATH"] = os.path.join(workdir, "change_feed_state.json")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    results = asyncio.run(main_async(args))
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"\n結果を保存しました: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
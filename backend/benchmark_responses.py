@@ -0,0 +1,168 @@
+"""
+レスポンスのJSON変換と圧縮のベンチマーク
+
+一覧API（/api/records/・/api/recipes/・/api/todos）と同じ形のデータを生成し、
+以下を比較する（データベース・ネットワークは使わない）。
+
+- 変換時間: ハンドラーが dict を返した場合、FastAPI は jsonable_encoder を通してから
+  レスポンスクラスで変換する。以下の3通りを計測する
+    json:         jsonable_encoder + JSONResponse（以前のデフォルト）
+    orjson:       jsonable_encoder + ORJSONResponse（現在のデフォルト）
+    orjsonDirect: ハンドラーが ORJSONResponse を直接返す（jsonable_encoder を通らない。
+                  一覧APIはデータベースのドキュメントをそのまま返すためこちらを使う）
+- 転送量: 圧縮なし・gzip・brotli（インストールされている場合）のバイト数と圧縮時間
+
+使い方:
+    python benchmark_responses.py                 # 各100 / 1000 / 5000件
+    python benchmark_responses.py --sizes 200 2000 --repeat 50
+    python benchmark_responses.py --json          # 結果をJSONで出力
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from compression import compress, supported_encodings
+
+INGREDIENTS = ["玉ねぎ 1個", "にんじん 1本", "じゃがいも 2個", "豚こま肉 200g", "カレールー 1/2箱", "水 600ml", "サラダ油 大さじ1"]
+STEPS = [
+    "野菜は一口大に切る。玉ねぎはくし切りにする。",
+    "鍋にサラダ油を熱し、肉と玉ねぎを中火で炒める。",
+    "にんじん・じゃがいもを加えてさらに炒め、水を加えて沸騰したらアクを取る。",
+    "弱火で15分煮込み、火を止めてルーを溶かし入れる。",
+    "再び弱火でとろみがつくまで10分ほど煮込む。",
+]
+TAGS = ["作業", "勉強", "運動", "読書", "家事"]
+
+
+def make_records(count: int) -> list:
+    start = datetime(2024, 1, 1, 9, 0, 0)
+    records = []
+    for index in range(count):
+        started = start + timedelta(hours=index * 3)
+        duration = random.randint(300, 7200)
+        records.append({
+            "id": str(uuid.uuid4()),
+            "timerId": f"timer-{index % 8}",
+            "timerName": f"タイマー{index % 8}",
+            "startTime": started.isoformat(),
+            "endTime": (started + timedelta(seconds=duration)).isoformat(),
+            "duration": duration,
+            "date": started.date().isoformat(),
+            "tag": random.choice(TAGS),
+            "stamp": None,
+            "comment": "集中できた" if index % 3 == 0 else None,
+        })
+    return records
+
+
+def make_recipes(count: int) -> list:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"レシピ{index}",
+            "ingredients": random.sample(INGREDIENTS, 5),
+            "steps": STEPS,
+            "cookingTime": random.randint(10, 90),
+            "source": f"https://example.com/recipes/{index}",
+            "tags": random.sample(["和食", "洋食", "中華", "時短", "作り置き"], 2),
+            "isFavorite": index % 5 == 0,
+            "timesCooked": random.randint(0, 20),
+            "createdAt": (datetime(2024, 1, 1) + timedelta(days=index)).isoformat(),
+        }
+        for index in range(count)
+    ]
+
+
+def make_todos(count: int) -> list:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "title": f"TODO {index}",
+            "description": "買い物リストを確認して、足りないものを買う" if index % 2 == 0 else None,
+            "priority": random.choice(["high", "medium", "low"]),
+            "dueDate": (datetime(2024, 1, 1) + timedelta(days=index % 30)).isoformat(),
+            "category": random.choice(["家事", "仕事", None]),
+            "tags": random.sample(TAGS, 2),
+            "completed": index % 4 == 0,
+            "completedAt": None,
+            "createdAt": (datetime(2024, 1, 1) + timedelta(minutes=index)).isoformat(),
+            "subtasks": [{"id": str(uuid.uuid4()), "title": f"サブタスク{n}", "completed": False} for n in range(3)],
+            "recurring": None,
+        }
+        for index in range(count)
+    ]
+
+
+PAYLOADS = {
+    "records": lambda count: make_records(count),
+    "recipes": lambda count: {"data": make_recipes(count)},
+    "todos": lambda count: {"data": make_todos(count)},
+}
+
+
+def measure(function, repeat: int) -> float:
+    """repeat 回実行した中央値（ミリ秒）"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def benchmark(name: str, count: int, repeat: int) -> dict:
+    payload = PAYLOADS[name](count)
+    body = ORJSONResponse(jsonable_encoder(payload)).body
+    result = {
+        "payload": name,
+        "items": count,
+        "serializeMs": {
+            "json": measure(lambda: JSONResponse(jsonable_encoder(payload)), repeat),
+            "orjson": measure(lambda: ORJSONResponse(jsonable_encoder(payload)), repeat),
+            "orjsonDirect": measure(lambda: ORJSONResponse(payload), repeat),
+        },
+        "bytes": {"identity": len(body)},
+        "compressMs": {},
+    }
+    for encoding in supported_encodings():
+        result["bytes"][encoding] = len(compress(body, encoding))
+        result["compressMs"][encoding] = measure(lambda: compress(body, encoding), repeat)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="一覧APIのJSON変換時間と転送量を計測")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000], help="件数")
+    parser.add_argument("--repeat", type=int, default=20, help="各計測の繰り返し回数（中央値を使う）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    random.seed(0)
+    results = [benchmark(name, count, args.repeat) for name in PAYLOADS for count in args.sizes]
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    for result in results:
+        serialize = result["serializeMs"]
+        sizes = result["bytes"]
+        print(f"=== {result['payload']} {result['items']}件 ===")
+        print(
+            f"  変換:   json {serialize['json']:.1f}ms / orjson {serialize['orjson']:.1f}ms"
+            f" / orjsonDirect {serialize['orjsonDirect']:.1f}ms"
+        )
+        for encoding in supported_encodings():
+            print(
+                f"  {encoding:5}: {sizes['identity']:,} → {sizes[encoding]:,} bytes"
+                f"（{sizes[encoding] / sizes['identity']:.0%}、{result['compressMs'][encoding]:.1f}ms）"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+レシピのスクレイピングのパースのベンチマーク
+
+保存したページ（フィクスチャ）ごとに、以下を比較する（ネットワークは使わない）。
+
+    tree: ページ全体の BeautifulSoup（lxml）の木を作り、セレクター文字列で取り出す（以前の処理）
+    fast: RecipeScraper のパース（JSON-LD だけを取り出して読み、なければコンパイル済みの
+          セレクターで木から取り出す）
+
+フィクスチャのファイル名の先頭（cookpad / rakuten）でパーサーを選ぶ。それ以外は汎用のパーサー。
+--fixtures を省略した場合は、実際のページと同じくらいの大きさのページを生成して使う。
+
+使い方:
+    python benchmark_scraper.py                                  # 生成したページで計測
+    python benchmark_scraper.py --save URL [URL ...] --fixtures scraper_fixtures
+                                                                 # ページを取得してフィクスチャとして保存
+    python benchmark_scraper.py --fixtures scraper_fixtures      # 保存したページで計測
+    python benchmark_scraper.py --repeat 50 --json               # 結果をJSONで出力
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from bs4 import BeautifulSoup
+from recipe_scraper import RecipeScraper, extract_json_ld_recipe
+
+INGREDIENTS = [("玉ねぎ", "1個"), ("にんじん", "1本"), ("じゃがいも", "2個"), ("豚こま肉", "200g"), ("カレールー", "1/2箱"), ("水", "600ml")]
+STEPS = [
+    "野菜は一口大に切る。玉ねぎはくし切りにする。",
+    "鍋にサラダ油を熱し、肉と玉ねぎを中火で炒める。",
+    "にんじん・じゃがいもを加えてさらに炒め、水を加えて沸騰したらアクを取る。",
+    "弱火で15分煮込み、火を止めてルーを溶かし入れる。",
+]
+
+# 以前の処理（セレクター文字列）
+TREE_SELECTORS = {
+    "cookpad": ("h1.recipe-title", ".ingredient_row", ".ingredient_name", ".ingredient_quantity", ".step_text", ".cooking_time"),
+    "rakuten": ("h1.page_title__text", ".recipe_material__item", ".recipe_material__item_name", ".recipe_material__item_serving", ".recipe_howto__text", ".recipe_material__time"),
+}
+
+PARSERS = {
+    "cookpad": RecipeScraper._parse_cookpad,
+    "rakuten": RecipeScraper._parse_rakuten,
+    "generic": RecipeScraper._parse_generic,
+}
+
+
+# ----------------------------------------------------------------------
+# フィクスチャ
+# ----------------------------------------------------------------------
+
+def _json_ld(graph: bool) -> str:
+    recipe = {
+        "@context": "https://schema.org",
+        "@type": "Recipe",
+        "name": "基本のカレー",
+        "recipeIngredient": [f"{name} {amount}" for name, amount in INGREDIENTS],
+        "recipeInstructions": [{"@type": "HowToStep", "text": step} for step in STEPS],
+        "totalTime": "PT40M",
+    }
+    if graph:
+        recipe = {"@context": "https://schema.org", "@graph": [
+            {"@type": "WebSite", "name": "レシピサイト", "url": "https://example.com/"},
+            {"@type": "BreadcrumbList", "itemListElement": [{"@type": "ListItem", "position": 1, "name": "カレー"}]},
+            recipe,
+        ]}
+    return f'<script type="application/ld+json">{json.dumps(recipe, ensure_ascii=False)}</script>'
+
+
+def _page(body: str, json_ld: str = "") -> str:
+    """実際のレシピサイトと同じくらいの大きさ（ナビゲーション・インラインスクリプト・広告枠）のページ"""
+    rng = random.Random(0)
+    script = "".join(f"var v{index}=function(a,b){{return a*{rng.randint(1, 99)}+b}};" for index in range(3000))
+    navigation = "".join(
+        f'<li class="nav-item"><a href="/category/{index}" class="nav-link">カテゴリー{index}</a></li>'
+        for index in range(400)
+    )
+    related = "".join(
+        f'<div class="card"><img src="/img/{index}.jpg" alt=""><p class="card-title">関連レシピ{index}</p>'
+        f'<span class="card-meta">{rng.randint(1, 999)}人が作りました</span></div>'
+        for index in range(200)
+    )
+    return (
+        '<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"><title>基本のカレー</title>'
+        + "".join(f'<link rel="preload" href="/assets/{index}.js" as="script">' for index in range(40))
+        + f"<script>{script}</script></head><body>"
+        + f'<header><ul class="nav">{navigation}</ul></header><main>{body}</main>'
+        + f'<aside class="related">{related}</aside>{json_ld}<footer>フッター</footer></body></html>'
+    )
+
+
+def _cookpad_body() -> str:
+    rows = "".join(
+        f'<div class="ingredient_row"><div class="ingredient_name">{name}</div><div class="ingredient_quantity">{amount}</div></div>'
+        for name, amount in INGREDIENTS
+    )
+    steps = "".join(f'<li class="step"><p class="step_text">{step}</p></li>' for step in STEPS)
+    return f'<h1 class="recipe-title">基本のカレー</h1><div class="cooking_time">約40分</div>{rows}<ol>{steps}</ol>'
+
+
+def _rakuten_body() -> str:
+    rows = "".join(
+        f'<li class="recipe_material__item"><span class="recipe_material__item_name">{name}</span>'
+        f'<span class="recipe_material__item_serving">{amount}</span></li>'
+        for name, amount in INGREDIENTS
+    )
+    steps = "".join(f'<li><span class="recipe_howto__text">{step}</span></li>' for step in STEPS)
+    return (
+        '<h1 class="page_title__text">基本のカレー</h1><p class="recipe_material__time">約40分</p>'
+        f'<ul>{rows}</ul><ol>{steps}</ol>'
+    )
+
+
+def generated_fixtures() -> List[Tuple[str, bytes]]:
+    pages = {
+        "cookpad-jsonld.html": _page(_cookpad_body(), _json_ld(graph=False)),
+        "cookpad-markup.html": _page(_cookpad_body()),
+        "rakuten-jsonld.html": _page(_rakuten_body(), _json_ld(graph=False)),
+        "rakuten-markup.html": _page(_rakuten_body()),
+        "generic-graph.html": _page("<h1>基本のカレー</h1>", _json_ld(graph=True)),
+        "generic-h1.html": _page("<h1>基本のカレー</h1>"),
+    }
+    return [(name, page.encode("utf-8")) for name, page in pages.items()]
+
+
+def load_fixtures(directory: str) -> List[Tuple[str, bytes]]:
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith((".html", ".htm")):
+            with open(os.path.join(directory, name), "rb") as f:
+                fixtures.append((name, f.read()))
+    return fixtures
+
+
+def save_fixtures(urls: List[str], directory: str):
+    """ページを取得してフィクスチャとして保存（ファイル名の先頭はサイト名）"""
+    import httpx
+    os.makedirs(directory, exist_ok=True)
+    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+    with httpx.Client(headers=headers, follow_redirects=True, timeout=10) as client:
+        for url in urls:
+            host = urlsplit(url).netloc
+            site = "cookpad" if "cookpad.com" in host else "rakuten" if "recipe.rakuten.co.jp" in host else "generic"
+            name = f"{site}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]}.html"
+            response = client.get(url)
+            response.raise_for_status()
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(response.content)
+            print(f"saved {url} -> {name} ({len(response.content):,} bytes)")
+
+
+# ----------------------------------------------------------------------
+# 計測
+# ----------------------------------------------------------------------
+
+def site_of(name: str) -> str:
+    for site in ("cookpad", "rakuten"):
+        if name.startswith(site):
+            return site
+    return "generic"
+
+
+def tree_parse(site: str, content: bytes) -> Optional[str]:
+    """以前の処理: ページ全体の木を作って取り出す（比較用にレシピ名を返す）"""
+    soup = BeautifulSoup(content, "lxml")
+    if site in TREE_SELECTORS:
+        name_selector, row_selector, item_selector, amount_selector, step_selector, time_selector = TREE_SELECTORS[site]
+        for row in soup.select(row_selector):
+            row.select_one(item_selector)
+            row.select_one(amount_selector)
+        [elem.text.strip() for elem in soup.select(step_selector)]
+        soup.select_one(time_selector)
+        name_elem = soup.select_one(name_selector)
+        return name_elem.text.strip() if name_elem else ""
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(script.string)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(data, dict) and data.get("@type") == "Recipe":
+            return data.get("name", "")
+    name_elem = soup.select_one("h1")
+    return name_elem.text.strip() if name_elem else "取り込んだレシピ"
+
+
+def measure(function, repeat: int) -> float:
+    """repeat 回実行した中央値（ミリ秒）"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def benchmark(name: str, content: bytes, repeat: int) -> Dict:
+    site = site_of(name)
+    url = f"https://example.com/{name}"
+    parse = PARSERS[site]
+    recipe = parse(content, url)
+    return {
+        "fixture": name,
+        "parser": site,
+        "bytes": len(content),
+        "path": "json-ld" if extract_json_ld_recipe(content) is not None and recipe.get("steps") else "tree",
+        "treeMs": measure(lambda: tree_parse(site, content), repeat),
+        "fastMs": measure(lambda: parse(content, url), repeat),
+        "name": recipe.get("name") if recipe else None,
+        "treeName": tree_parse(site, content),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="レシピのスクレイピングのパース時間を計測")
+    parser.add_argument("--fixtures", default=None, help="保存したページ（*.html）のディレクトリ（省略時は生成したページ）")
+    parser.add_argument("--save", nargs="+", default=None, metavar="URL", help="ページを取得して --fixtures に保存する")
+    parser.add_argument("--repeat", type=int, default=20, help="各計測の繰り返し回数（中央値を使う）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    if args.save:
+        if not args.fixtures:
+            parser.error("--save requires --fixtures")
+        save_fixtures(args.save, args.fixtures)
+        return
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else generated_fixtures()
+    results = [benchmark(name, content, args.repeat) for name, content in fixtures]
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    for result in results:
+        same = "同じ" if result["name"] == result["treeName"] else f"違う（tree: {result['treeName']!r}）"
+        print(
+            f"{result['fixture']:24} {result['bytes'] / 1024:7.0f}KB  {result['path']:7}"
+            f"  tree {result['treeMs']:7.2f}ms  fast {result['fastMs']:7.2f}ms"
+            f"  ×{result['treeMs'] / max(result['fastMs'], 1e-6):5.1f}  名前: {same}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Cosmos DB 変更フィードの読み取り
+
+このSDKバージョンの変更フィードはパーティションキー範囲（物理パーティション）ごとに
+読む必要があるため、範囲ごとの継続トークンを辞書で管理する。
+"""
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 1回の読み取りで取得する件数
+PAGE_SIZE = 500
+
+
+def partition_key_range_ids(container) -> List[str]:
+    """コンテナのパーティションキー範囲のID一覧"""
+    ranges = container.client_connection._ReadPartitionKeyRanges(container.container_link)
+    return [r["id"] for r in ranges]
+
+
+def current_position(container, range_id: str) -> Optional[str]:
+    """
+    パーティションキー範囲の現在の位置（以降の変更を読むための継続トークン）
+
+    このSDKバージョンは is_start_from_beginning=False を If-None-Match: * に変換しないため、
+    継続トークンに "*" を直接渡して読む。変更は返らず（304）、ETag が現在の位置になる
+    """
+    etags = []
+
+    def hook(headers, _):
+        if headers and headers.get("etag"):
+            etags.append(headers["etag"])
+
+    pager = container.query_items_change_feed(
+        partition_key_range_id=range_id,
+        continuation="*",
+        max_item_count=1,
+        response_hook=hook
+    ).by_page()
+    for _ in pager:
+        pass
+    return etags[-1] if etags else None
+
+
+def read_changes(
+    container,
+    continuations: Dict[str, str],
+    page_size: int = PAGE_SIZE,
+    start_from_beginning: bool = True
+) -> Iterator[Tuple[str, List[dict], Optional[str]]]:
+    """
+    前回の位置から現在までの変更をページ単位で読む
+
+    削除は変更フィードに現れない点に注意。
+
+    Args:
+        container: コンテナ（storage.get_sync_container() のもの）
+        continuations: パーティションキー範囲ID -> 継続トークン（初回は空の辞書）
+        page_size: 1ページの件数
+        start_from_beginning: 継続トークンのない範囲を最初から読むか（Falseなら現在の位置を
+            変更なしの継続トークンとして返し、次回以降はそこから読む）
+
+    Yields:
+        (パーティションキー範囲ID, 変更されたドキュメント, 次の継続トークン)
+        呼び出し側は処理が終わったら continuations[範囲ID] に継続トークンを保存する
+    """
+    if hasattr(container, "read_changes"):
+        # 埋め込みSQLiteのコンテナ（sqlite_storage.py）は自前で変更を読む
+        yield from container.read_changes(continuations, page_size, start_from_beginning)
+        return
+    for range_id in partition_key_range_ids(container):
+        continuation = continuations.get(range_id)
+        if continuation is None and not start_from_beginning:
+            position = current_position(container, range_id)
+            if position is None:
+                # 最初から読み直さないよう、位置が分かるまでこの範囲は読まない
+                print(f"Warning: Failed to get change feed position of {container.id} (range {range_id})")
+                continue
+            yield range_id, [], position
+            continue
+        pager = container.query_items_change_feed(
+            partition_key_range_id=range_id,
+            is_start_from_beginning=continuation is None,
+            continuation=continuation,
+            max_item_count=page_size
+        ).by_page()
+        for page in pager:
+            yield range_id, list(page), pager.continuation_token
@@ -0,0 +1,176 @@
+"""
+変更フィードの購読（プロセス内のキャッシュ・インデックスの更新用）
+
+アプリの lifespan でバックグラウンドタスクとして起動し、主要なコンテナの変更フィードを
+ポーリングして、登録された購読者に変更されたドキュメントを渡す。
+ルーターの各ハンドラーでキャッシュを個別に無効化しなくても、派生データが
+他のプロセスや別経路での書き込みにも追従する。
+
+購読側の例:
+    import change_feed_processor
+
+    def on_recipes_changed(items):
+        for item in items:
+            ...
+
+    change_feed_processor.subscribe("recipes", on_recipes_changed)
+
+- 購読者はポーリング用のスレッドで呼ばれるため、重い処理や非同期処理は避ける
+- 同じ変更が2回以上届くことがある（処理後に継続トークンを保存するため）ので、購読者は冪等にする
+- 削除は変更フィードに現れない
+"""
+import asyncio
+import json
+import os
+from typing import Callable, Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+import change_feed
+import records_store
+from database import RECIPES_CONTAINER, SETTINGS_CONTAINER, TAGS_CONTAINER, TIMERS_CONTAINER, TODOS_CONTAINER
+from storage import get_sync_container
+
+# 継続トークンの保存先
+STATE_PATH = os.getenv("CHANGE_FEED_STATE_PATH", "change_feed_state.json")
+
+# ポーリング間隔（秒）
+POLL_INTERVAL = float(os.getenv("CHANGE_FEED_POLL_INTERVAL", "5"))
+
+# 購読対象のコンテナ（名前 -> コンテナの取得関数）
+# recordsはパーティション移行のモードに応じて読み取り先が変わる
+SOURCES: Dict[str, Callable] = {
+    "records": records_store.query_container,
+    "recipes": lambda: get_sync_container(RECIPES_CONTAINER),
+    "todos": lambda: get_sync_container(TODOS_CONTAINER),
+    "timers": lambda: get_sync_container(TIMERS_CONTAINER),
+    "settings": lambda: get_sync_container(SETTINGS_CONTAINER),
+    "tags": lambda: get_sync_container(TAGS_CONTAINER),
+}
+
+Subscriber = Callable[[List[dict]], None]
+
+_subscribers: Dict[str, List[Subscriber]] = {}
+
+
+def subscribe(source: str, subscriber: Subscriber):
+    """
+    変更の購読者を登録
+
+    Args:
+        source: コンテナ名（SOURCES のキー）
+        subscriber: 変更されたドキュメントのリストを受け取る関数
+    """
+    if source not in SOURCES:
+        raise ValueError(f"Unknown change feed source: {source}")
+    _subscribers.setdefault(source, []).append(subscriber)
+
+
+def unsubscribe(source: str, subscriber: Subscriber):
+    """購読者の登録を解除"""
+    if subscriber in _subscribers.get(source, []):
+        _subscribers[source].remove(subscriber)
+
+
+def publish(source: str, items: List[dict]):
+    """
+    購読者に変更を通知
+
+    1つの購読者の失敗で他の購読者や以降の変更の処理が止まらないよう、例外は警告にとどめる
+    """
+    for subscriber in list(_subscribers.get(source, [])):
+        try:
+            subscriber(items)
+        except Exception as e:
+            print(f"Warning: Change feed subscriber failed ({source}): {e}")
+
+
+class ChangeFeedProcessor:
+    """変更フィードをポーリングして購読者に配信する"""
+
+    def __init__(self, sources: Dict[str, Callable] = SOURCES, state_path: str = STATE_PATH, poll_interval: float = POLL_INTERVAL):
+        """
+        Args:
+            sources: 名前 -> コンテナの取得関数
+            state_path: 継続トークンの保存先
+            poll_interval: ポーリング間隔（秒）
+        """
+        self.sources = sources
+        self.state_path = state_path
+        self.poll_interval = poll_interval
+        self.state = self._load_state()
+        self._task: Optional[asyncio.Task] = None
+
+    def _load_state(self) -> Dict[str, Dict[str, str]]:
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Failed to load change feed state: {e}")
+            return {}
+
+    def _save_state(self):
+        # 書き込み途中で中断しても壊れないよう一時ファイル経由で置き換える
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def poll_once(self) -> Dict[str, int]:
+        """
+        各コンテナの変更を現在位置まで読み、購読者に配信する
+
+        継続トークンは読み取り先のコンテナIDごとに保存する（パーティション移行で
+        recordsの読み取り先が変わった場合は新しいコンテナの現在位置から読む）。
+        初回は過去の変更を配信せず、各パーティションキー範囲の現在の位置を保存して、
+        次回のポーリングからそれ以降の変更を配信する
+
+        Returns:
+            コンテナ名 -> 配信した件数
+        """
+        counts = {}
+        for name, get_container in self.sources.items():
+            if not _subscribers.get(name):
+                continue
+            container = get_container()
+            continuations = self.state.setdefault(container.id, {})
+            counts[name] = 0
+            changed = False
+            for range_id, items, continuation in change_feed.read_changes(
+                container, continuations, start_from_beginning=False
+            ):
+                if items:
+                    publish(name, items)
+                    counts[name] += len(items)
+                if continuation and continuations.get(range_id) != continuation:
+                    continuations[range_id] = continuation
+                    changed = True
+            if changed:
+                self._save_state()
+        return counts
+
+    async def run(self):
+        """停止されるまでポーリングを続ける"""
+        while True:
+            try:
+                await run_in_threadpool(self.poll_once)
+            except Exception as e:
+                # 一時的な接続エラーなどで処理を止めない
+                print(f"Warning: Failed to read change feed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        """バックグラウンドタスクとして起動"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """バックグラウンドタスクを停止"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
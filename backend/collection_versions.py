@@ -0,0 +1,231 @@
+"""
+コレクション（コンテナ）ごとのバージョンと条件付きGET（ETag / 304 Not Modified）
+
+フロントエンドは画面を移るたびにタイマー・レシピ・タグ・設定の一覧を取り直すが、
+これらはほとんど変わらない。コンテナごとにバージョンを持ち、書き込みのたびに上げる。
+一覧のレスポンスにはバージョンから作った ETag を付け、If-None-Match が一致すれば
+ハンドラーを呼ばずに（＝データベースに問い合わせずに）304 を返す。
+
+- このプロセスでの書き込みは storage.get_container() のコンテナ（VersionedContainer）で検知する
+- 他のプロセスでの書き込みは変更フィード（change_feed_processor）で検知する
+  （ポーリング間隔のあいだは古い一覧が返ることがある。削除は変更フィードに現れない）
+- バージョンはプロセスごとの値（起動時の乱数）を含むため、再起動や別プロセスの ETag とは一致しない
+"""
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import change_feed_processor
+from compression import negotiate
+from storage import Container
+
+# このプロセスの起動ごとに変わる値（再起動前の ETag と一致させない）
+EPOCH = uuid.uuid4().hex[:12]
+
+# 自分の書き込みが変更フィードで戻ってきたときに、もう一度バージョンを上げないよう
+# 覚えておく _etag の件数（コンテナごと）
+RECENT_WRITES_SIZE = 256
+
+_lock = threading.Lock()
+_versions: Dict[str, int] = {}
+_recent_writes: Dict[str, "OrderedDict[str, None]"] = {}
+_subscribed: set = set()
+
+
+def version(name: str) -> int:
+    with _lock:
+        return _versions.get(name, 0)
+
+
+def bump(name: str, written: Optional[Iterable[dict]] = None):
+    """
+    バージョンを上げる
+
+    Args:
+        written: このプロセスで書き込んだドキュメント（変更フィードでの重複を除くため _etag を覚える）
+    """
+    with _lock:
+        _versions[name] = _versions.get(name, 0) + 1
+        recent = _recent_writes.setdefault(name, OrderedDict())
+        for document in written or []:
+            if isinstance(document, dict) and document.get("_etag"):
+                recent[document["_etag"]] = None
+        while len(recent) > RECENT_WRITES_SIZE:
+            recent.popitem(last=False)
+
+
+def _on_changes(name: str, documents: List[dict]):
+    """変更フィードの購読者。このプロセスで書き込んだものだけなら何もしない"""
+    with _lock:
+        recent = _recent_writes.get(name, {})
+        if all(document.get("_etag") in recent for document in documents):
+            return
+    bump(name)
+
+
+def etag(names: Iterable[str], scope) -> str:
+    """
+    レスポンスの ETag（強いETag）
+
+    コレクションのバージョン・パス・クエリ文字列と、圧縮方式（Accept-Encoding）から作る。
+    圧縮方式が違えば本文のバイト列も違うため、ETag も別にする
+    """
+    accept_encoding = ""
+    for key, value in scope.get("headers", []):
+        if key == b"accept-encoding":
+            accept_encoding = value.decode("latin-1")
+            break
+    digest = hashlib.sha1()
+    digest.update(EPOCH.encode())
+    for name in names:
+        digest.update(f"|{name}={version(name)}".encode())
+    digest.update(b"|" + scope["path"].encode() + b"?" + scope.get("query_string", b""))
+    digest.update(b"|" + (negotiate(accept_encoding) or "identity").encode())
+    return f'"{digest.hexdigest()[:20]}"'
+
+
+def _matches(if_none_match: str, current: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # If-None-Match は弱い比較（W/ を除いて比べる）
+    return current in [candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates]
+
+
+def _is_no_store(message) -> bool:
+    for key, value in message.get("headers", []):
+        if key.lower() == b"cache-control" and b"no-store" in value.lower():
+            return True
+    return False
+
+
+class VersionedContainer(Container):
+    """書き込みのたびにコレクションのバージョンを上げるコンテナ"""
+
+    def __init__(self, name: str, container: Container):
+        self._name = name
+        self._container = container
+        self.id = container.id
+
+    def query_items(self, query, parameters=None, partition_key=None, max_item_count=None):
+        return self._container.query_items(
+            query=query,
+            parameters=parameters,
+            partition_key=partition_key,
+            max_item_count=max_item_count
+        )
+
+    async def read_item(self, item, partition_key):
+        return await self._container.read_item(item=item, partition_key=partition_key)
+
+    async def read_item_if_modified(self, item, partition_key, etag):
+        return await self._container.read_item_if_modified(item, partition_key, etag)
+
+    # 書き込みの結果が分からない場合（タイムアウトなど）も、反映された可能性があるので上げる。
+    # 書き込みの前に上げると、並行する一覧の取得が古い内容を新しいバージョンで返してしまうため、後で上げる
+
+    async def create_item(self, body):
+        document = None
+        try:
+            document = await self._container.create_item(body=body)
+            return document
+        finally:
+            bump(self._name, [document])
+
+    async def upsert_item(self, body):
+        document = None
+        try:
+            document = await self._container.upsert_item(body=body)
+            return document
+        finally:
+            bump(self._name, [document])
+
+    async def replace_item(self, item, body):
+        document = None
+        try:
+            document = await self._container.replace_item(item=item, body=body)
+            return document
+        finally:
+            bump(self._name, [document])
+
+    async def patch_item(self, item, partition_key, patch_operations, etag=None):
+        document = None
+        try:
+            document = await self._container.patch_item(
+                item=item,
+                partition_key=partition_key,
+                patch_operations=patch_operations,
+                etag=etag
+            )
+            return document
+        finally:
+            bump(self._name, [document])
+
+    async def delete_item(self, item, partition_key):
+        try:
+            await self._container.delete_item(item=item, partition_key=partition_key)
+        finally:
+            bump(self._name)
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        results = []
+        try:
+            results = await self._container.execute_item_batch(
+                batch_operations=batch_operations,
+                partition_key=partition_key
+            )
+            return results
+        finally:
+            bump(self._name, [result.get("resourceBody") for result in results or []])
+
+
+def wrap(name: str, container: Container) -> Container:
+    """バージョンを管理するコンテナにして返す（変更フィードの購読も始める）"""
+    if name not in _subscribed and name in change_feed_processor.SOURCES:
+        _subscribed.add(name)
+        change_feed_processor.subscribe(name, lambda documents: _on_changes(name, documents))
+    return VersionedContainer(name, container)
+
+
+class ConditionalGetMiddleware:
+    """
+    一覧のGETに ETag を付け、If-None-Match が一致すれば 304 を返すASGIミドルウェア
+
+    ETag を付けるのは 200 のレスポンスだけ。ハンドラーが取得の失敗を代わりの内容で返す場合は
+    Cache-Control: no-store を付けること（付けないと、次の書き込みまで 304 で返り続ける）
+
+    routes: パス -> レスポンスの内容が依存するコレクション名のリスト
+    """
+
+    def __init__(self, app, routes: Dict[str, List[str]]):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD") or scope["path"] not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        # ハンドラーを呼ぶ前のバージョンで作る（取得中に書き込みがあれば、次のリクエストで一致しない）
+        current = etag(self.routes[scope["path"]], scope)
+        headers = [(b"etag", current.encode("latin-1")), (b"cache-control", b"no-cache")]
+
+        if_none_match = None
+        for key, value in scope.get("headers", []):
+            if key == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+                break
+        if if_none_match is not None and _matches(if_none_match, current):
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_etag(message):
+            # 取得に失敗したときの代わりの内容など、ハンドラーが Cache-Control: no-store を
+            # 付けたレスポンスはバージョンと対応しないため ETag を付けない
+            if message["type"] == "http.response.start" and message["status"] == 200 and not _is_no_store(message):
+                message = {**message, "headers": list(message.get("headers", [])) + headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
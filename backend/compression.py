@@ -0,0 +1,218 @@
+"""
+レスポンスの圧縮（gzip / brotli）
+
+記録・レシピ・TODOの一覧はJSONが大きくなる（レシピは手順・材料を含む）ため、
+Accept-Encoding に応じて圧縮して返す。
+
+- brotli はパッケージ（brotli）がインストールされている場合だけ使い、なければ gzip
+- COMPRESSION_MIN_SIZE バイト未満のレスポンスは圧縮しない（小さいと効果がなくCPUの無駄）
+- テキスト・JSON・CSVなど圧縮が効く Content-Type だけを対象にする（画像はそのまま）
+- ストリーミングのレスポンス（エクスポート・一括取り込みなど）はためずにチャンクごとに圧縮して送る
+- Cache-Control: no-transform のレスポンスは圧縮しない
+"""
+import os
+import zlib
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# これ未満のサイズのレスポンスは圧縮しない（バイト）
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# 圧縮レベル（gzip: 1〜9、brotli: 0〜11）
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# 圧縮する Content-Type
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def supported_encodings() -> List[str]:
+    """サーバーが対応している圧縮方式（優先順）"""
+    return (["br"] if brotli is not None else []) + ["gzip"]
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """
+    Accept-Encoding から使う圧縮方式を選ぶ
+
+    q値の大きいものを優先し、同じならサーバーの優先順（br → gzip）で選ぶ。
+    どれも受け付けない場合は None
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in supported_encodings():
+        quality = accepted.get(coding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class _Compressor:
+    """gzip / brotli を同じインターフェースで扱う（ストリーミング対応）"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits=31: gzipヘッダー付き
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        """途中のチャンク（受け取った側ですぐに展開できるようフラッシュする）"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """一括で圧縮（計測用にも使う）"""
+    return _Compressor(encoding).finish(data)
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _is_compressible(headers: List[Tuple[bytes, bytes]]) -> bool:
+    if _header(headers, b"content-encoding") is not None:
+        return False
+    if b"no-transform" in (_header(headers, b"cache-control") or b"").lower():
+        return False
+    content_type = (_header(headers, b"content-type") or b"").decode("latin-1").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    Accept-Encoding に応じてレスポンスを圧縮するASGIミドルウェア
+
+    Content-Type と Content-Length（ストリーミングのレスポンスは最初のチャンクのサイズ）を見て
+    圧縮するか決める。ストリーミングのレスポンスは最小サイズまでためずに、最初のチャンクから送る
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        # Content-Length の分かっているレスポンスを、圧縮後のサイズが分かるまで保留している本文
+        pending: List[bytes] = []
+        content_length: Optional[int] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        def compressed_headers() -> List[Tuple[bytes, bytes]]:
+            headers = [(key, value) for key, value in start_message.get("headers", []) if key.lower() != b"content-length"]
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            vary = _header(headers, b"vary")
+            if vary is None:
+                headers.append((b"vary", b"Accept-Encoding"))
+            elif b"accept-encoding" not in vary.lower():
+                headers = [(key, value) for key, value in headers if key.lower() != b"vary"]
+                headers.append((b"vary", vary + b", Accept-Encoding"))
+            return headers
+
+        async def send_compressed(message):
+            nonlocal start_message, content_length, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = list(message.get("headers", []))
+                if not _is_compressible(headers):
+                    passthrough = True
+                    await send(message)
+                    return
+                length = _header(headers, b"content-length")
+                content_length = int(length) if length is not None and length.isdigit() else None
+                if content_length is not None and content_length < self.minimum_size:
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if content_length is not None:
+                # 本文全体のサイズが分かっているレスポンス（途中のミドルウェアが分割して送ることがある）は
+                # 最後までためて一括で圧縮し、圧縮後のサイズを Content-Length に入れる
+                pending.append(body)
+                if more_body:
+                    return
+                compressor = _Compressor(encoding)
+                compressed = compressor.finish(b"".join(pending))
+                pending.clear()
+                headers = compressed_headers()
+                headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                await send({**start_message, "headers": headers})
+                await send({"type": "http.response.body", "body": compressed})
+                return
+
+            if compressor is None:
+                # ストリーミングのレスポンスは最初のチャンクで決め、以降はためずにチャンクごとに送る
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                await send({**start_message, "headers": compressed_headers()})
+
+            chunk = compressor.compress(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+        if start_message is not None and compressor is None and not passthrough:
+            # 本文を送らずに終わったレスポンス
+            await send(start_message)
+            await send({"type": "http.response.body", "body": b"".join(pending)})
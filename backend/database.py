@@ -1,9 +1,19 @@
 """
 Cosmos DB database connection and initialization
+
+インポート時には通信しない。コンテナの作成はアプリ起動時に bootstrap() で行い、
+スクリプトは必要なコンテナの参照だけを取得する
 """
+import asyncio
+import hashlib
+import json
 import os
+import threading
+from datetime import datetime
 from azure.cosmos import CosmosClient, PartitionKey, exceptions
+from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
 from dotenv import load_dotenv
+import db_metrics
 
 # Load environment variables
 load_dotenv()
@@ -21,161 +31,246 @@ RECORDS_CONTAINER = "records"
 RECIPES_CONTAINER = "recipes"
 POMODORO_SESSIONS_CONTAINER = "pomodoro_sessions"
 TODOS_CONTAINER = "todos"
+RECORD_ROLLUPS_CONTAINER = "record_rollups"
+RECORDS_BY_TIMER_CONTAINER = "records_by_timer"
 
-# Initialize Cosmos Client
-cosmos_client = CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY)
+# recordsコンテナのパーティション移行モード（records_store.py を参照）
+# legacy: records（/id）のみ / dual: 両方に書き込み / partitioned: records_by_timer（/timerId）のみ
+RECORDS_PARTITION_MODE = os.getenv("RECORDS_PARTITION_MODE", "legacy")
+
+# 各コンテナのパーティションキー（bootstrap() で存在しなければ作成する）
+# サーバーレスではoffer_throughputを指定しない
+CONTAINER_PARTITION_KEYS = {
+    TIMERS_CONTAINER: "/id",
+    TAGS_CONTAINER: "/id",
+    SETTINGS_CONTAINER: "/id",
+    RECORDS_CONTAINER: "/id",
+    RECIPES_CONTAINER: "/id",
+    POMODORO_SESSIONS_CONTAINER: "/id",
+    TODOS_CONTAINER: "/id",
+    # 日別×タイマー×タグの集計バケット
+    RECORD_ROLLUPS_CONTAINER: "/id",
+    # タイマー単位のクエリを単一パーティションで処理するため
+    RECORDS_BY_TIMER_CONTAINER: "/timerId",
+}
+
+# 初期ドキュメント（存在しなければ作成する）
+DEFAULT_ITEMS = {
+    SETTINGS_CONTAINER: {
+        "id": "app-settings",
+        "theme": "purple"
+    },
+    TIMERS_CONTAINER: {
+        "id": "stopwatch-fixed",
+        "name": "ストップウォッチ",
+        "duration": 0,
+        "type": "stopwatch",
+        "image": None
+    },
+}
 
-# Database and container references
+# プロビジョニング済みマーカーの保存先
+# 接続先・コンテナ構成が前回と同じなら、再起動時の作成処理を省略する
+SCHEMA_MARKER_PATH = os.getenv("COSMOS_SCHEMA_MARKER_PATH", "cosmos_schema.json")
+
+# HTTP通信ごとに x-ms-request-charge と所要時間を記録するフック（db_metrics.py を参照）
+CLIENT_HOOKS = {
+    "raw_request_hook": db_metrics.on_request,
+    "raw_response_hook": db_metrics.on_response,
+}
+
+# Initialize Cosmos Client
+# 同期クライアントはスクリプト・バックグラウンドスレッド用。作成時に通信が発生するため、
+# 最初に使われるまで作成しない。
+# ルーターはイベントループをブロックしないよう非同期クライアント（get_async_container）を使う
+cosmos_client = None
 database = None
-timers_container = None
-tags_container = None
-settings_container = None
-records_container = None
-recipes_container = None
-pomodoro_sessions_container = None
-todos_container = None
+_sync_client_lock = threading.Lock()
+
+# 非同期クライアント（アプリ全体で1つを共有し、接続プールを使い回す）
+async_cosmos_client = None
+async_database = None
+
+
+def _schema_fingerprint() -> str:
+    """接続先・コンテナ構成・初期ドキュメントから、プロビジョニング内容を識別する値を作る"""
+    schema = {
+        "endpoint": COSMOS_ENDPOINT,
+        "database": COSMOS_DATABASE_NAME,
+        "containers": CONTAINER_PARTITION_KEYS,
+        "defaults": DEFAULT_ITEMS,
+    }
+    encoded = json.dumps(schema, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _is_provisioned(fingerprint: str) -> bool:
+    if not os.path.exists(SCHEMA_MARKER_PATH):
+        return False
+    try:
+        with open(SCHEMA_MARKER_PATH, "r", encoding="utf-8") as f:
+            return json.load(f).get("fingerprint") == fingerprint
+    except (OSError, ValueError) as e:
+        print(f"Warning: Failed to load schema marker: {e}")
+        return False
 
 
-def initialize_database():
+def _mark_provisioned(fingerprint: str):
+    # 書き込み途中で中断しても壊れないよう一時ファイル経由で置き換える
+    marker = {
+        "fingerprint": fingerprint,
+        "provisionedAt": datetime.utcnow().isoformat()
+    }
+    tmp_path = f"{SCHEMA_MARKER_PATH}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(marker, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, SCHEMA_MARKER_PATH)
+    except OSError as e:
+        # 次回の起動でもう一度プロビジョニングするだけなので、起動は止めない
+        print(f"Warning: Failed to save schema marker: {e}")
+
+
+async def _create_default_item(database_proxy, container_name: str, item: dict):
+    """初期ドキュメントを作成（既にあれば何もしない。読み取りを挟まず1往復で済ませる）"""
+    try:
+        await database_proxy.get_container_client(container_name).create_item(body=dict(item))
+        print(f"Default item '{item['id']}' created")
+    except exceptions.CosmosResourceExistsError:
+        pass
+
+
+async def bootstrap(force: bool = False) -> bool:
     """
     Initialize Cosmos DB database and containers
+
+    アプリの起動時（lifespan）に呼ぶ。コンテナの作成は並行して発行する。
+    前回と同じ構成でプロビジョニング済みなら、通信せずにすぐ戻る
+
+    Args:
+        force: マーカーを無視してプロビジョニングする
+
+    Returns:
+        プロビジョニングを実行した場合 True、マーカーにより省略した場合 False
     """
-    global database, timers_container, tags_container, settings_container, records_container, recipes_container, pomodoro_sessions_container, todos_container
-    
+    fingerprint = _schema_fingerprint()
+    if not force and _is_provisioned(fingerprint):
+        print(f"Database '{COSMOS_DATABASE_NAME}' already provisioned")
+        return False
+
     try:
-        # Create database if it doesn't exist
-        database = cosmos_client.create_database_if_not_exists(id=COSMOS_DATABASE_NAME)
+        database_proxy = await get_async_client().create_database_if_not_exists(id=COSMOS_DATABASE_NAME)
         print(f"Database '{COSMOS_DATABASE_NAME}' initialized")
-        
-        # Create timers container (サーバーレスではoffer_throughputを指定しない)
-        timers_container = database.create_container_if_not_exists(
-            id=TIMERS_CONTAINER,
-            partition_key=PartitionKey(path="/id")
-        )
-        print(f"Container '{TIMERS_CONTAINER}' initialized")
-        
-        # Create tags container
-        tags_container = database.create_container_if_not_exists(
-            id=TAGS_CONTAINER,
-            partition_key=PartitionKey(path="/id")
-        )
-        print(f"Container '{TAGS_CONTAINER}' initialized")
-        
-        # Create settings container
-        settings_container = database.create_container_if_not_exists(
-            id=SETTINGS_CONTAINER,
-            partition_key=PartitionKey(path="/id")
-        )
-        print(f"Container '{SETTINGS_CONTAINER}' initialized")
-        
-        # Create records container
-        records_container = database.create_container_if_not_exists(
-            id=RECORDS_CONTAINER,
-            partition_key=PartitionKey(path="/id")
-        )
-        print(f"Container '{RECORDS_CONTAINER}' initialized")
-        
-        # Create recipes container
-        recipes_container = database.create_container_if_not_exists(
-            id=RECIPES_CONTAINER,
-            partition_key=PartitionKey(path="/id")
-        )
-        print(f"Container '{RECIPES_CONTAINER}' initialized")
-        
-        # Create pomodoro_sessions container
-        pomodoro_sessions_container = database.create_container_if_not_exists(
-            id=POMODORO_SESSIONS_CONTAINER,
-            partition_key=PartitionKey(path="/id")
-        )
-        print(f"Container '{POMODORO_SESSIONS_CONTAINER}' initialized")
-        
-        # Create todos container
-        todos_container = database.create_container_if_not_exists(
-            id=TODOS_CONTAINER,
-            partition_key=PartitionKey(path="/id")
-        )
-        print(f"Container '{TODOS_CONTAINER}' initialized")
-        
-        # Initialize default settings if not exists
-        initialize_default_settings()
-        
-        # Initialize default stopwatch timer if not exists
-        initialize_default_stopwatch()
-        
+
+        await asyncio.gather(*(
+            database_proxy.create_container_if_not_exists(
+                id=name,
+                partition_key=PartitionKey(path=path)
+            )
+            for name, path in CONTAINER_PARTITION_KEYS.items()
+        ))
+        print(f"Containers initialized: {', '.join(CONTAINER_PARTITION_KEYS)}")
+
+        # Initialize default settings and stopwatch timer if not exists
+        await asyncio.gather(*(
+            _create_default_item(database_proxy, name, item)
+            for name, item in DEFAULT_ITEMS.items()
+        ))
     except exceptions.CosmosHttpResponseError as e:
         print(f"Failed to initialize database: {e.message}")
         raise
 
+    _mark_provisioned(fingerprint)
+    return True
 
-def initialize_default_settings():
-    """
-    Initialize default settings document
-    """
-    try:
-        settings_container.read_item(item="app-settings", partition_key="app-settings")
-        print("Settings already exist")
-    except exceptions.CosmosResourceNotFoundError:
-        default_settings = {
-            "id": "app-settings",
-            "theme": "purple"
-        }
-        settings_container.create_item(body=default_settings)
-        print("Default settings created")
-
-
-def initialize_default_stopwatch():
-    """
-    Initialize default stopwatch timer
-    """
-    try:
-        timers_container.read_item(item="stopwatch-fixed", partition_key="stopwatch-fixed")
-        print("Stopwatch timer already exists")
-    except exceptions.CosmosResourceNotFoundError:
-        stopwatch = {
-            "id": "stopwatch-fixed",
-            "name": "ストップウォッチ",
-            "duration": 0,
-            "type": "stopwatch",
-            "image": None
-        }
-        timers_container.create_item(body=stopwatch)
-        print("Default stopwatch created")
 
+def get_database():
+    """
+    Get sync database reference
 
-# Initialize on module import
-initialize_database()
+    クライアントは最初の呼び出し時に作成する（コンテナの作成は行わない。bootstrap() を参照）
+    """
+    global cosmos_client, database
+    with _sync_client_lock:
+        if cosmos_client is None:
+            cosmos_client = CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY, **CLIENT_HOOKS)
+            database = cosmos_client.get_database_client(COSMOS_DATABASE_NAME)
+    return database
 
 
 def get_timers_container():
     """Get timers container reference"""
-    return timers_container
+    return get_database().get_container_client(TIMERS_CONTAINER)
 
 
 def get_tags_container():
     """Get tags container reference"""
-    return tags_container
+    return get_database().get_container_client(TAGS_CONTAINER)
 
 
 def get_settings_container():
     """Get settings container reference"""
-    return settings_container
+    return get_database().get_container_client(SETTINGS_CONTAINER)
 
 
 def get_records_container():
     """Get records container reference"""
-    return records_container
+    return get_database().get_container_client(RECORDS_CONTAINER)
 
 
 def get_recipes_container():
     """Get recipes container reference"""
-    return recipes_container
+    return get_database().get_container_client(RECIPES_CONTAINER)
 
 
 def get_pomodoro_sessions_container():
     """Get pomodoro sessions container reference"""
-    return pomodoro_sessions_container
+    return get_database().get_container_client(POMODORO_SESSIONS_CONTAINER)
 
 
 def get_todos_container():
     """Get todos container reference"""
-    return todos_container
+    return get_database().get_container_client(TODOS_CONTAINER)
+
+
+def get_record_rollups_container():
+    """Get record rollups container reference"""
+    return get_database().get_container_client(RECORD_ROLLUPS_CONTAINER)
+
+
+def get_records_by_timer_container():
+    """Get records container partitioned by timerId"""
+    return get_database().get_container_client(RECORDS_BY_TIMER_CONTAINER)
+
+
+def get_async_client():
+    """
+    Get async client (azure.cosmos.aio)
+
+    クライアントは最初の呼び出し時に作成し、close_async_client() まで共有する。
+    イベントループ内（ルーターのハンドラーなど）から呼ぶこと
+    """
+    global async_cosmos_client, async_database
+    if async_cosmos_client is None:
+        async_cosmos_client = AsyncCosmosClient(COSMOS_ENDPOINT, COSMOS_KEY, **CLIENT_HOOKS)
+        async_database = async_cosmos_client.get_database_client(COSMOS_DATABASE_NAME)
+    return async_cosmos_client
+
+
+def get_async_container(name: str):
+    """
+    Get async container reference (azure.cosmos.aio)
+
+    コンテナの参照の取得自体は通信を伴わない
+    """
+    get_async_client()
+    return async_database.get_container_client(name)
+
+
+async def close_async_client():
+    """Close async client and its connection pool (アプリ終了時・スクリプト終了時)"""
+    global async_cosmos_client, async_database
+    if async_cosmos_client is not None:
+        await async_cosmos_client.close()
+        async_cosmos_client = None
+        async_database = None
@@ -0,0 +1,240 @@
+"""
+データベースアクセスの計測（RU消費・往復回数・DB時間）
+
+どのエンドポイントがRUを消費しているかを調べるため、リクエストごとに
+Cosmos DBへの往復回数・x-ms-request-charge の合計・DBの待ち時間を集計する。
+
+- DbMetricsMiddleware: リクエストごとの集計を開始し、Server-Timing ヘッダーで返す。
+  レスポンスを送り終えた時点でルート（パスのテンプレート）別のヒストグラムに記録する
+- on_request / on_response: Cosmos DBクライアントのHTTPパイプラインのフック（database.py）。
+  リトライを含む1回のHTTP通信ごとに呼ばれる
+- record: SQLite実装（sqlite_storage.py）など、HTTPを使わない実装からの記録用
+
+集計は contextvars でリクエストに紐づけるため、同時に処理中のリクエストが混ざらない
+（run_in_threadpool で実行した処理もコンテキストを引き継ぐ）。
+/metrics は Prometheus のテキスト形式で返す。
+"""
+import json
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# ヒストグラムのバケット
+CHARGE_BUCKETS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+DURATION_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+ROUND_TRIP_BUCKETS = [0, 1, 2, 3, 5, 8, 13, 21, 50, 100]
+
+# クエリ文字列のラベルの最大長
+MAX_QUERY_LABEL_LENGTH = 200
+
+# ルートに一致しなかったリクエストのラベル
+UNMATCHED_ROUTE = "<unmatched>"
+
+# リクエストの外（起動処理・変更フィードのポーリングなど）での通信のラベル
+BACKGROUND_ROUTE = "<background>"
+
+
+class RequestStats:
+    """1リクエスト分の集計"""
+
+    def __init__(self):
+        self.charge = 0.0
+        self.round_trips = 0
+        self.seconds = 0.0
+        # クエリ文字列（または操作名） -> [回数, RU, 秒]
+        self.operations: Dict[str, List[float]] = {}
+
+    def add(self, operation: str, charge: float, seconds: float):
+        self.charge += charge
+        self.round_trips += 1
+        self.seconds += seconds
+        totals = self.operations.setdefault(operation, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += charge
+        totals[2] += seconds
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("db_metrics_current", default=None)
+
+
+class Histogram:
+    """ラベルごとの累積ヒストグラム（Prometheus形式）"""
+
+    def __init__(self, name: str, help_text: str, buckets: List[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # ラベル -> (バケットごとの件数, 合計, 件数)
+        self.series: Dict[str, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, label: str, value: float):
+        counts, totals = self.series.setdefault(label, ([0] * len(self.buckets), [0.0, 0]))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def render(self, label_name: str) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label, (counts, (total, count)) in sorted(self.series.items()):
+            labels = f'{label_name}="{_escape(label)}"'
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+_lock = threading.Lock()
+_charge = Histogram("db_request_charge_ru", "Request units consumed per HTTP request, by route", CHARGE_BUCKETS)
+_duration = Histogram("db_request_duration_seconds", "Time spent waiting on the database per HTTP request, by route", DURATION_BUCKETS)
+_round_trips = Histogram("db_request_round_trips", "Database round trips per HTTP request, by route", ROUND_TRIP_BUCKETS)
+# (ルート, クエリ) -> [回数, RU, 秒]
+_operations: Dict[Tuple[str, str], List[float]] = {}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def normalize_query(query: str) -> str:
+    """ラベルが増え続けないよう、クエリに埋め込まれた文字列・数値を ? に置き換える"""
+    query = re.sub(r"'(?:[^'\\]|\\.)*'", "'?'", query)
+    query = re.sub(r"\b\d+(?:\.\d+)?\b", "?", query)
+    query = " ".join(query.split())
+    return query[:MAX_QUERY_LABEL_LENGTH]
+
+
+def _merge(route: str, stats: RequestStats, observe_request: bool):
+    with _lock:
+        if observe_request:
+            _charge.observe(route, stats.charge)
+            _duration.observe(route, stats.seconds)
+            _round_trips.observe(route, stats.round_trips)
+        for operation, (count, charge, seconds) in stats.operations.items():
+            totals = _operations.setdefault((route, operation), [0, 0.0, 0.0])
+            totals[0] += count
+            totals[1] += charge
+            totals[2] += seconds
+
+
+def record(operation: str, seconds: float, charge: float = 0.0):
+    """
+    データベースへの1回の往復を記録
+
+    Args:
+        operation: クエリ文字列または操作名（"GET docs" など）
+        seconds: 所要時間
+        charge: 消費したRU
+    """
+    stats = _current.get()
+    if stats is not None:
+        stats.add(operation, charge, seconds)
+        return
+    background = RequestStats()
+    background.add(operation, charge, seconds)
+    _merge(BACKGROUND_ROUTE, background, observe_request=False)
+
+
+# ----------------------------------------------------------------------
+# Cosmos DB クライアントのフック（azure.core の CustomHookPolicy）
+# ----------------------------------------------------------------------
+
+def _operation_name(http_request) -> str:
+    """クエリならクエリ文字列、それ以外は HTTPメソッドとリソースの種類"""
+    if str(http_request.headers.get("x-ms-documentdb-isquery", "")).lower() == "true":
+        body = http_request.body
+        try:
+            if isinstance(body, bytes):
+                body = body.decode("utf-8")
+            return normalize_query(json.loads(body)["query"])
+        except (TypeError, ValueError, KeyError):
+            pass
+    # /dbs/{db}/colls/{coll}/docs/{id} → docs
+    segments = [segment for segment in http_request.url.split("?")[0].split("/") if segment]
+    resource = segments[-2] if len(segments) % 2 == 0 and len(segments) >= 2 else (segments[-1] if segments else "")
+    if resource not in ("dbs", "colls", "docs", "pkranges", "offers", "sprocs", "udfs", "triggers"):
+        resource = "account"
+    return f"{http_request.method} {resource}"
+
+
+def on_request(pipeline_request):
+    pipeline_request.context["db_metrics_started"] = time.perf_counter()
+
+
+def on_response(pipeline_response):
+    started = pipeline_response.context.get("db_metrics_started")
+    seconds = time.perf_counter() - started if started is not None else 0.0
+    try:
+        charge = float(pipeline_response.http_response.headers.get("x-ms-request-charge", 0) or 0)
+    except ValueError:
+        charge = 0.0
+    record(_operation_name(pipeline_response.http_request), seconds, charge)
+
+
+# ----------------------------------------------------------------------
+# ミドルウェアと /metrics
+# ----------------------------------------------------------------------
+
+def server_timing(stats: RequestStats) -> str:
+    """Server-Timing ヘッダーの値"""
+    return (
+        f'db;dur={stats.seconds * 1000:.1f};desc="{stats.round_trips} round trips", '
+        f'ru;desc="{stats.charge:.2f} RU"'
+    )
+
+
+class DbMetricsMiddleware:
+    """
+    リクエストごとにデータベースアクセスを集計するASGIミドルウェア
+
+    ストリーミングのレスポンス（エクスポートなど）は、ヘッダー送信後の通信も
+    ヒストグラムには含める（Server-Timing にはヘッダー送信時点までの値が入る）
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(stats).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            _merge(getattr(route, "path", UNMATCHED_ROUTE), stats, observe_request=True)
+
+
+def render() -> str:
+    """/metrics の本文（Prometheus のテキスト形式）"""
+    with _lock:
+        lines = []
+        lines += _charge.render("route")
+        lines += _duration.render("route")
+        lines += _round_trips.render("route")
+        for name, index, help_text in (
+            ("db_query_calls_total", 0, "Database round trips, by route and query"),
+            ("db_query_charge_ru_total", 1, "Request units consumed, by route and query"),
+            ("db_query_duration_seconds_total", 2, "Time spent waiting on the database, by route and query"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (route, operation), totals in sorted(_operations.items()):
+                lines.append(f'{name}{{route="{_escape(route)}",query="{_escape(operation)}"}} {totals[index]}')
+        return "\n".join(lines) + "\n"
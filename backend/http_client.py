@@ -0,0 +1,109 @@
+"""
+外部APIへのHTTPクライアント（アプリ全体で1つを共有する）
+
+天気（Open-Meteo）・カレンダー（iCal）・レシピのスクレイピング・OpenAIへの通信は
+すべてこのクライアントを使う。
+
+- 非同期（httpx.AsyncClient）のため、応答待ちの間もイベントループをブロックしない
+- 接続はプールに残して使い回す（keep-alive）。h2 がインストールされていれば HTTP/2 も使う
+- 接続数はプール全体（HTTP_MAX_CONNECTIONS）とホストごと（HTTP_MAX_CONNECTIONS_PER_HOST）で制限する
+- クライアントはアプリの起動時（lifespan）に作成し、終了時に close() で閉じる
+"""
+import asyncio
+import os
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# 応答待ち（読み取り・書き込み・プールの空き待ち）のタイムアウト（秒）
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+
+# 接続のタイムアウト（秒）
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+# プール全体の接続数の上限
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+
+# 同じホストへの同時リクエスト数の上限（スクレイピング先などに負荷をかけすぎない）
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+
+# 使っていない接続をプールに残す時間（秒）
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+_client: Optional[httpx.AsyncClient] = None
+# ホスト -> 同時リクエスト数の制限
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+# APIキー -> OpenAIクライアント
+_openai_clients: Dict[str, object] = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Get shared HTTP client
+
+    クライアントは最初の呼び出し時に作成し、close() まで共有する。
+    イベントループ内（lifespan・ルーターのハンドラーなど）から呼ぶこと
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            ),
+            follow_redirects=True
+        )
+    return _client
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+    return _host_limits[host]
+
+
+async def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    ホストごとの同時リクエスト数を制限してリクエストを送る
+
+    失敗した場合は httpx.HTTPError（タイムアウト・接続エラーなど）。
+    ステータスコードの確認は呼び出し側で行う（response.raise_for_status()）
+    """
+    async with _host_limit(url):
+        return await get_client().request(method, url, **kwargs)
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+def get_openai_client(api_key: str):
+    """
+    Get OpenAI client (AsyncOpenAI)
+
+    共有のHTTPクライアントを使うため、OpenAI APIへの接続も使い回される
+    """
+    if api_key not in _openai_clients:
+        from openai import AsyncOpenAI
+        _openai_clients[api_key] = AsyncOpenAI(api_key=api_key, http_client=get_client())
+    return _openai_clients[api_key]
+
+
+async def close():
+    """クライアントを閉じる（アプリ終了時）"""
+    global _client
+    _openai_clients.clear()
+    _host_limits.clear()
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,40 @@
+"""
+記録ロールアップ初期化スクリプト
+既存の全記録から日別×タイマー×タグの集計バケットを作り直します。
+初回セットアップ時、または集計がずれた場合に実行してください。
+
+使い方:
+    python init_rollups.py
+"""
+
+import asyncio
+import sys
+from storage import bootstrap, close
+from rollups import rebuild_rollups
+
+async def init_rollups():
+    """既存記録からロールアップを再構築"""
+    print("記録ロールアップを再構築しています...")
+
+    try:
+        # record_rollups コンテナがまだ無い場合に備えて作成しておく
+        await bootstrap()
+        result = await rebuild_rollups()
+
+        print(f"\n✅ 再構築完了:")
+        print(f"   - 書き込んだバケット: {result['bucketsWritten']}件")
+        print(f"   - 削除したバケット: {result['bucketsDeleted']}件")
+
+        return result
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+    finally:
+        await close()
+
+if __name__ == "__main__":
+    asyncio.run(init_rollups())
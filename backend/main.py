@@ -1,13 +1,23 @@
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
+import asyncio
 import os
 from jose import JWTError, jwt
 
-# データベース初期化
-import database
+# データベース（接続・コンテナ作成は起動後に storage.bootstrap() で行う）
+import storage
+import change_feed_processor
+import point_read_cache
+import recipe_index
+import db_metrics
+import http_client
+from scrape_cache import get_scrape_cache
+from compression import CompressionMiddleware
+from collection_versions import ConditionalGetMiddleware
+from database import RECIPES_CONTAINER, SETTINGS_CONTAINER, TAGS_CONTAINER, TIMERS_CONTAINER
 
 # ルーター
 from routers import auth, recipes, timers, fashion, home, upload, settings, records, pomodoro, todos
@@ -20,24 +30,73 @@ ALGORITHM = "HS256"
 PUBLIC_PATHS = [
     "/",
     "/health",
+    "/ready",
+    "/metrics",
     "/docs",
     "/openapi.json",
     "/api/auth/login",
     "/uploads",  # 静的ファイル
 ]
 
+async def bootstrap(processor: change_feed_processor.ChangeFeedProcessor):
+    """データベースの初期化が終わってから、変更フィードの購読を始める"""
+    try:
+        provisioned = await storage.bootstrap()
+    except Exception as e:
+        print(f"❌ データベース初期化失敗: {e}")
+        raise
+    print("✅ データベース初期化完了" if provisioned else "✅ データベース初期化済み（省略）")
+    # レシピ検索のインデックス（失敗しても最初の検索で作り直す）
+    try:
+        await recipe_index.get_recipe_index().build()
+    except Exception as e:
+        print(f"Warning: Failed to build recipe search index: {e}")
+    processor.start()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 アプリケーション起動")
-    print("✅ Cosmos DB 初期化完了")
+    # 外部APIへのHTTPクライアント（接続プールを共有する）
+    http_client.get_client()
+    # 変更フィードの購読（キャッシュ・インデックスの更新）
+    processor = change_feed_processor.ChangeFeedProcessor()
+    # 初期化はバックグラウンドで行い、その間もポートを開いて /health に応答する
+    # 完了するまで /ready は503を返す
+    app.state.bootstrap_task = asyncio.create_task(bootstrap(processor))
     yield
+    app.state.bootstrap_task.cancel()
+    try:
+        await app.state.bootstrap_task
+    except asyncio.CancelledError:
+        pass
+    except Exception:
+        # 失敗内容は /ready で返しているので、終了時は無視する
+        pass
+    await processor.stop()
+    # 非同期Cosmosクライアントの接続プール（SQLiteの場合は接続）を閉じる
+    await storage.close()
+    await http_client.close()
     print("🛑 アプリケーション終了")
 
 app = FastAPI(
     title="My App API",
     description="個人用趣味アプリケーション",
     version="0.1.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # 一覧のJSONが大きいため、標準の json より速い orjson で変換する
+    default_response_class=ORJSONResponse
+)
+
+# 一覧の条件付きGET（ETag / 304。collection_versions.py を参照）
+# 認証の後に判定するよう、認証ミドルウェアより先に登録する（後に登録したものほど外側になる）
+app.add_middleware(
+    ConditionalGetMiddleware,
+    routes={
+        "/api/timers/": [TIMERS_CONTAINER],
+        "/api/timers/tags/all": [TAGS_CONTAINER],
+        "/api/recipes/": [RECIPES_CONTAINER],
+        "/api/settings/": [SETTINGS_CONTAINER],
+    },
 )
 
 # 認証ミドルウェア
@@ -85,6 +144,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# DBアクセスの計測（RU・往復回数・DB時間。Server-Timing ヘッダーと /metrics）
+app.add_middleware(db_metrics.DbMetricsMiddleware)
+
+# レスポンスの圧縮（Accept-Encoding に応じて brotli / gzip。compression.py を参照）
+app.add_middleware(CompressionMiddleware)
+
 # ルーター登録
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(recipes.router, prefix="/api/recipes", tags=["recipes"])
@@ -112,6 +177,33 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """ポイント読み取りキャッシュのヒット数・ミス数（コンテナ別）と、スクレイピングのキャッシュ"""
+    return {**point_read_cache.stats(), "scrape": get_scrape_cache().stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """ルート別のRU・DB時間・往復回数のヒストグラムと、クエリ別の合計（Prometheus形式）"""
+    return PlainTextResponse(db_metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+async def ready():
+    """データベースの初期化が完了し、リクエストを処理できるか（/health はプロセスの生存確認のみ）"""
+    task = app.state.bootstrap_task
+    if not task.done():
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "starting"},
+        )
+    if task.cancelled() or task.exception() is not None:
+        error = "cancelled" if task.cancelled() else str(task.exception())
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "failed", "detail": error},
+        )
+    return {"status": "ready"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,45 @@
+"""
+一覧APIのページング用カーソル
+
+クライアントには継続トークン（Cosmos DB）やオフセット（プロセス内のインデックス）を
+そのまま見せず、URLセーフな不透明な文字列にして返す。
+"""
+import base64
+from typing import Optional
+from fastapi import HTTPException
+
+
+def encode_cursor(continuation_token: Optional[str]) -> Optional[str]:
+    """Cosmos DBの継続トークンをURLセーフな不透明カーソルに変換"""
+    if not continuation_token:
+        return None
+    return base64.urlsafe_b64encode(continuation_token.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[str]:
+    """不透明カーソルをCosmos DBの継続トークンに戻す"""
+    if not cursor:
+        return None
+    try:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_offset(offset: Optional[int]) -> Optional[str]:
+    """結果の先頭からのオフセットをカーソルに変換（None なら続きがない）"""
+    return encode_cursor(str(offset)) if offset is not None else None
+
+
+def decode_offset(cursor: Optional[str]) -> int:
+    """カーソルをオフセットに戻す（カーソルがなければ 0）"""
+    token = decode_cursor(cursor)
+    if token is None:
+        return 0
+    try:
+        offset = int(token)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
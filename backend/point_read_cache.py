@@ -0,0 +1,217 @@
+"""
+ポイント読み取りのキャッシュ（プロセス内、読み取り時に取得して保持する）
+
+設定（app-settings）・タイマー・レシピのように、同じドキュメントを何度も読むコンテナの
+read_item() をキャッシュする。storage.get_container() が CACHED_CONTAINERS のコンテナを
+CachedContainer で包んで返すため、呼び出し側の変更は不要。
+
+- TTL内のドキュメントは通信せずに返す
+- TTLを過ぎたドキュメントはETagで再検証する（変更がなければ本文を受け取らない）
+- 件数の上限を超えたら最も長く使われていないものから捨てる（LRU）
+- このプロセスでの書き込みは結果をそのままキャッシュし、削除は取り除く
+- 他のプロセスでの書き込みは変更フィード（change_feed_processor）で取り除く
+"""
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from azure.cosmos import exceptions
+import change_feed_processor
+from database import RECIPES_CONTAINER, SETTINGS_CONTAINER, TIMERS_CONTAINER
+from storage import Container
+
+# キャッシュしたドキュメントを再検証せずに返す時間（秒）
+TTL = float(os.getenv("POINT_READ_CACHE_TTL", "30"))
+
+# コンテナごとのキャッシュ件数の上限
+MAX_ENTRIES = int(os.getenv("POINT_READ_CACHE_SIZE", "1024"))
+
+# キャッシュするコンテナ（名前 -> 変更フィードの購読名）
+CACHED_CONTAINERS = {
+    SETTINGS_CONTAINER: "settings",
+    TIMERS_CONTAINER: "timers",
+    RECIPES_CONTAINER: "recipes",
+}
+
+
+class PointReadCache:
+    """TTLとLRUで管理するドキュメントのキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, ttl: float = TTL, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (id, パーティションキー) -> (ドキュメント, 保存または再検証した時刻)
+        self._entries: "OrderedDict[Tuple[str, Any], Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, Any]) -> Tuple[Optional[dict], bool]:
+        """
+        Returns:
+            (ドキュメントのコピー, TTL内か)。キャッシュにない場合は (None, False)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(key)
+            document, stored_at = entry
+            return copy.deepcopy(document), time.monotonic() - stored_at < self.ttl
+
+    def put(self, key: Tuple[str, Any], document: dict):
+        with self._lock:
+            self._entries[key] = (copy.deepcopy(document), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def touch(self, key: Tuple[str, Any]):
+        """再検証で変更がなかったドキュメントのTTLを延ばす"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], time.monotonic())
+
+    def discard(self, key: Tuple[str, Any]):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_changed(self, documents: List[dict]):
+        """変更されたドキュメントを取り除く（ETagが同じ＝このプロセスで書き込んだものは残す）"""
+        changed = {document.get("id"): document.get("_etag") for document in documents}
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in changed]:
+                if self._entries[key][0].get("_etag") != changed[key[0]]:
+                    del self._entries[key]
+
+    def discard_partition(self, partition_key: Any):
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == partition_key]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.revalidations
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class CachedContainer(Container):
+    """read_item() をキャッシュし、書き込みでキャッシュを更新するコンテナ"""
+
+    def __init__(self, container: Container, cache: PointReadCache):
+        self._container = container
+        self._cache = cache
+        self.id = container.id
+
+    def query_items(self, query, parameters=None, partition_key=None, max_item_count=None):
+        return self._container.query_items(
+            query=query,
+            parameters=parameters,
+            partition_key=partition_key,
+            max_item_count=max_item_count
+        )
+
+    async def read_item(self, item, partition_key):
+        key = (item, partition_key)
+        cached, fresh = self._cache.get(key)
+        if fresh:
+            self._cache.hits += 1
+            return cached
+
+        if cached is not None and cached.get("_etag"):
+            self._cache.revalidations += 1
+            try:
+                document = await self._container.read_item_if_modified(item, partition_key, cached["_etag"])
+            except exceptions.CosmosResourceNotFoundError:
+                self._cache.discard(key)
+                raise
+            if document is None:
+                self._cache.touch(key)
+                return cached
+        else:
+            self._cache.misses += 1
+            document = await self._container.read_item(item=item, partition_key=partition_key)
+        self._cache.put(key, document)
+        return document
+
+    async def read_item_if_modified(self, item, partition_key, etag):
+        return await self._container.read_item_if_modified(item, partition_key, etag)
+
+    def _store(self, document: dict) -> dict:
+        # キャッシュするコンテナはすべて /id パーティション
+        self._cache.put((document["id"], document["id"]), document)
+        return document
+
+    async def create_item(self, body):
+        return self._store(await self._container.create_item(body=body))
+
+    async def upsert_item(self, body):
+        return self._store(await self._container.upsert_item(body=body))
+
+    async def replace_item(self, item, body):
+        return self._store(await self._container.replace_item(item=item, body=body))
+
+    async def patch_item(self, item, partition_key, patch_operations, etag=None):
+        try:
+            document = await self._container.patch_item(
+                item=item,
+                partition_key=partition_key,
+                patch_operations=patch_operations,
+                etag=etag
+            )
+        except Exception:
+            self._cache.discard((item, partition_key))
+            raise
+        self._cache.put((item, partition_key), document)
+        return document
+
+    async def delete_item(self, item, partition_key):
+        self._cache.discard((item, partition_key))
+        await self._container.delete_item(item=item, partition_key=partition_key)
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        self._cache.discard_partition(partition_key)
+        return await self._container.execute_item_batch(
+            batch_operations=batch_operations,
+            partition_key=partition_key
+        )
+
+
+# コンテナ名 -> キャッシュ（プロセスで1つ）
+_caches: Dict[str, PointReadCache] = {}
+
+
+def get_cache(name: str) -> PointReadCache:
+    if name not in _caches:
+        _caches[name] = PointReadCache()
+        change_feed_processor.subscribe(CACHED_CONTAINERS[name], _caches[name].discard_changed)
+    return _caches[name]
+
+
+def wrap(name: str, container: Container) -> Container:
+    """CACHED_CONTAINERS のコンテナならキャッシュ付きにして返す"""
+    if name not in CACHED_CONTAINERS or TTL <= 0:
+        return container
+    return CachedContainer(container, get_cache(name))
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """コンテナ名 -> ヒット数・ミス数など"""
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -0,0 +1,321 @@
+"""
+レシピ検索の転置インデックス（プロセス内、文字n-gram）
+
+レシピ一覧の search= は、以前は全レシピを取得して名前・材料・タグ・手順を
+毎回小文字にして部分一致を調べていた（1回の検索でレシピの全テキストに比例するコスト）。
+
+このモジュールはレシピのテキストを文字の 1〜3-gram に分けた転置インデックスを持つ。
+日本語は単語の区切りがないが、文字n-gramなら形態素解析なしで部分一致の候補を絞れる。
+
+- 検索語のn-gram（3文字以上なら3-gram、2文字なら2-gram、1文字なら1-gram）の
+  ポスティングリストの積集合で候補を絞り、最後に実際に部分一致するかを確かめる
+- インデックスはレシピ本体のコピーも持つため、検索ではデータベースに問い合わせない
+- アプリの起動時（main.bootstrap）に全レシピから作り、このプロセスでの作成・更新・削除は
+  ルーターから反映する。他のプロセスでの書き込みは変更フィードで反映する
+  （変更フィードに削除は現れないため、他のプロセスでの削除は再起動まで残る）
+- 変更フィードは遅れて届くため、このプロセスで削除したレシピや、すでに新しい内容（_ts）を
+  持っているレシピの古いドキュメントは反映しない
+
+関連度順の検索（search_ranked）は、同じポスティングリストに持たせたフィールドごとの出現回数と
+フィールドの長さから BM25F でスコアを計算し、上位 k 件をヒープで取り出す。
+語は2-gram（1文字の語は1-gram）で、名前 > タグ > 材料 > 手順 の順に重みを付ける。
+計算量はクエリの語のポスティングリストの長さに比例し、レシピ全体のテキスト量には比例しない。
+"""
+import copy
+import heapq
+import math
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import change_feed_processor
+from database import RECIPES_CONTAINER
+from storage import get_container
+
+# インデックスに使うn-gramの長さ
+MIN_GRAM = 1
+MAX_GRAM = 3
+
+# 検索対象のフィールドと BM25F の重み（名前に一致したレシピを手順だけに一致したものより上にする）
+FIELDS = ("name", "tags", "ingredients", "steps")
+FIELD_BOOSTS = {"name": 3.0, "tags": 2.0, "ingredients": 1.5, "steps": 1.0}
+
+# BM25 のパラメータ（k1: 出現回数の飽和、b: フィールドの長さによる正規化）
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# ポスティングにはフィールドごとの出現回数を1つの整数に詰めて持つ（フィールドあたり16ビット）
+_TF_BITS = 16
+_TF_MASK = (1 << _TF_BITS) - 1
+
+
+def ngrams(text: str, n: int) -> Set[str]:
+    """文字n-gramの集合（text が n 文字未満なら空）"""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def field_texts(recipe: dict) -> Dict[str, List[str]]:
+    """フィールド -> 検索対象のテキスト（小文字）"""
+    texts = {"name": [str(recipe.get("name") or "")]}
+    for field in ("tags", "ingredients", "steps"):
+        texts[field] = [str(value) for value in recipe.get(field) or [] if value is not None]
+    return {field: [text.lower() for text in values if text] for field, values in texts.items()}
+
+
+def searchable_texts(recipe: dict) -> List[str]:
+    """検索対象のテキスト（名前・材料・タグ・手順、小文字）"""
+    return [text for values in field_texts(recipe).values() for text in values]
+
+
+def query_terms(query: str) -> Set[str]:
+    """関連度の計算に使う語（空白で区切った部分ごとの2-gram。1文字の部分はそのまま）"""
+    terms = set()
+    for part in query.lower().split():
+        terms |= {part} if len(part) == 1 else ngrams(part, 2)
+    return terms
+
+
+class RecipeIndex:
+    """レシピの文字n-gram転置インデックス（スレッドセーフ）"""
+
+    def __init__(self):
+        # レシピID -> レシピ
+        self._recipes: Dict[str, dict] = {}
+        # レシピID -> フィールド -> 検索対象のテキスト（小文字）
+        self._texts: Dict[str, Dict[str, List[str]]] = {}
+        # レシピID -> フィールドごとの長さ（文字数）
+        self._lengths: Dict[str, Tuple[int, ...]] = {}
+        # フィールドごとの長さの合計（平均の計算用）
+        self._total_lengths = [0] * len(FIELDS)
+        # n-gram -> レシピID -> フィールドごとの出現回数（詰めた整数）
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self.built = False
+        # 作成中に更新されたレシピID（作成時に読み込んだ古い内容で上書きしない）
+        self._building = False
+        self._updated_while_building: Set[str] = set()
+        # このプロセスで削除したレシピID（変更フィードに残っている古いドキュメントで復活させない）
+        self._deleted: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._recipes)
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+
+    def _term_frequencies(self, texts: Dict[str, List[str]]) -> Counter:
+        """n-gram -> フィールドごとの出現回数（詰めた整数）"""
+        frequencies = Counter()
+        for index, field in enumerate(FIELDS):
+            counts = Counter()
+            for text in texts.get(field, []):
+                for n in range(MIN_GRAM, MAX_GRAM + 1):
+                    for i in range(len(text) - n + 1):
+                        counts[text[i:i + n]] += 1
+            shift = _TF_BITS * index
+            for gram, count in counts.items():
+                # 隣のフィールドに桁あふれしないよう上限で切る
+                frequencies[gram] += min(count, _TF_MASK) << shift
+        return frequencies
+
+    def _remove_locked(self, recipe_id: str):
+        texts = self._texts.pop(recipe_id, None)
+        self._recipes.pop(recipe_id, None)
+        if texts is None:
+            return
+        for index, length in enumerate(self._lengths.pop(recipe_id)):
+            self._total_lengths[index] -= length
+        for gram in self._term_frequencies(texts):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.pop(recipe_id, None)
+                if not posting:
+                    del self._postings[gram]
+
+    def _add_locked(self, recipe: dict):
+        recipe_id = recipe["id"]
+        self._remove_locked(recipe_id)
+        texts = field_texts(recipe)
+        lengths = tuple(sum(len(text) for text in texts.get(field, [])) for field in FIELDS)
+        self._recipes[recipe_id] = copy.deepcopy(recipe)
+        self._texts[recipe_id] = texts
+        self._lengths[recipe_id] = lengths
+        for index, length in enumerate(lengths):
+            self._total_lengths[index] += length
+        for gram, frequency in self._term_frequencies(texts).items():
+            self._postings.setdefault(gram, {})[recipe_id] = frequency
+
+    def add_recipe(self, recipe: dict):
+        """レシピを追加または置き換える"""
+        with self._lock:
+            self._deleted.discard(recipe["id"])
+            if self._building:
+                self._updated_while_building.add(recipe["id"])
+            self._add_locked(recipe)
+
+    def _is_stale_locked(self, recipe: dict) -> bool:
+        """変更フィードのドキュメントが、削除済みまたはインデックスの内容より古いか"""
+        if recipe["id"] in self._deleted:
+            return True
+        current = self._recipes.get(recipe["id"])
+        if current is None or current.get("_ts") is None or recipe.get("_ts") is None:
+            return False
+        return recipe["_ts"] < current["_ts"]
+
+    def add_recipes(self, recipes: List[dict]):
+        """変更フィードの購読者（古いドキュメントは反映しない）"""
+        with self._lock:
+            for recipe in recipes:
+                if not recipe.get("id") or self._is_stale_locked(recipe):
+                    continue
+                if self._building:
+                    self._updated_while_building.add(recipe["id"])
+                self._add_locked(recipe)
+
+    def delete_recipe(self, recipe_id: str):
+        with self._lock:
+            self._deleted.add(recipe_id)
+            if self._building:
+                self._updated_while_building.add(recipe_id)
+            self._remove_locked(recipe_id)
+
+    async def build(self):
+        """全レシピからインデックスを作り直す"""
+        with self._lock:
+            self._building = True
+            self._updated_while_building = set()
+        try:
+            container = get_container(RECIPES_CONTAINER)
+            recipes = [recipe async for recipe in container.query_items(query="SELECT * FROM c")]
+        except Exception:
+            with self._lock:
+                self._building = False
+            raise
+        with self._lock:
+            updated = self._updated_while_building
+            kept = {recipe_id: self._recipes[recipe_id] for recipe_id in updated if recipe_id in self._recipes}
+            self._recipes, self._texts, self._lengths, self._postings = {}, {}, {}, {}
+            self._total_lengths = [0] * len(FIELDS)
+            for recipe in recipes:
+                if recipe["id"] not in updated:
+                    self._add_locked(recipe)
+            for recipe in kept.values():
+                self._add_locked(recipe)
+            self._building = False
+            self.built = True
+
+    async def ensure_built(self):
+        """起動時に作れなかった場合（初期化の失敗など）は最初の検索で作る"""
+        if not self.built:
+            await self.build()
+
+    # ------------------------------------------------------------------
+    # 検索
+    # ------------------------------------------------------------------
+
+    def _candidates_locked(self, query: str) -> Set[str]:
+        n = min(len(query), MAX_GRAM)
+        postings = []
+        for gram in ngrams(query, n):
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        # 小さいリストから積集合をとる
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting.keys()
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, query: str) -> List[dict]:
+        """
+        名前・材料・タグ・手順のいずれかに query を含むレシピ（大文字小文字を区別しない）
+
+        Returns:
+            レシピのコピーのリスト（順序は不定）
+        """
+        query = query.lower()
+        with self._lock:
+            if not query:
+                recipe_ids = list(self._recipes)
+            else:
+                # n-gramは同じテキストの中で連続しているとは限らないため、実際に含むかを確かめる
+                recipe_ids = [
+                    recipe_id for recipe_id in self._candidates_locked(query)
+                    if any(query in text for texts in self._texts[recipe_id].values() for text in texts)
+                ]
+            return [copy.deepcopy(self._recipes[recipe_id]) for recipe_id in recipe_ids]
+
+    def search_ranked(self, query: str, limit: Optional[int] = None, accept: Optional[Callable[[dict], bool]] = None) -> List[dict]:
+        """
+        関連度（BM25F）の高い順にレシピを返す
+
+        クエリの語を1つでも含むレシピが対象（すべての語を含むものほど上位になる）。
+
+        Args:
+            limit: 返す件数（上位 k 件をヒープで取り出す。None ならすべて）
+            accept: 絞り込みの条件（お気に入り・タグなど）。False のレシピは除く
+
+        Returns:
+            レシピのコピーのリスト（スコアの高い順、同点は新しい順）
+        """
+        terms = query_terms(query)
+        with self._lock:
+            count = len(self._recipes)
+            if not terms or count == 0:
+                return []
+            average_lengths = [max(total / count, 1.0) for total in self._total_lengths]
+            boosts = [FIELD_BOOSTS[field] for field in FIELDS]
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for recipe_id, packed in posting.items():
+                    lengths = self._lengths[recipe_id]
+                    weighted = 0.0
+                    for index in range(len(FIELDS)):
+                        frequency = (packed >> (_TF_BITS * index)) & _TF_MASK
+                        if frequency:
+                            normalization = 1 - BM25_B + BM25_B * lengths[index] / average_lengths[index]
+                            weighted += boosts[index] * frequency / normalization
+                    scores[recipe_id] = scores.get(recipe_id, 0.0) + idf * weighted * (BM25_K1 + 1) / (BM25_K1 + weighted)
+
+            ranked = (
+                (score, self._recipes[recipe_id].get("createdAt") or "", recipe_id)
+                for recipe_id, score in scores.items()
+                if accept is None or accept(self._recipes[recipe_id])
+            )
+            top = heapq.nlargest(limit, ranked) if limit is not None else sorted(ranked, reverse=True)
+            return [copy.deepcopy(self._recipes[recipe_id]) for _, _, recipe_id in top]
+
+    def get(self, recipe_id: str) -> Optional[dict]:
+        with self._lock:
+            recipe = self._recipes.get(recipe_id)
+            return copy.deepcopy(recipe) if recipe is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "recipes": len(self._recipes),
+                "grams": len(self._postings),
+                "postings": sum(len(posting) for posting in self._postings.values()),
+            }
+
+
+# グローバルインスタンス
+_recipe_index = None
+
+
+def get_recipe_index() -> RecipeIndex:
+    """レシピ検索インデックスのシングルトンインスタンスを取得"""
+    global _recipe_index
+    if _recipe_index is None:
+        _recipe_index = RecipeIndex()
+        change_feed_processor.subscribe("recipes", _recipe_index.add_recipes)
+    return _recipe_index
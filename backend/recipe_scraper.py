@@ -1,17 +1,181 @@
 """
 外部レシピサイトからレシピ情報をスクレイピングするモジュール
+
+多くのレシピサイトは schema.org/Recipe の JSON-LD を埋め込んでいるため、まずページから
+<script type="application/ld+json"> だけを取り出して読む（BeautifulSoup の木は作らない）。
+JSON-LD にレシピがない場合だけ、ページ全体の木を作ってサイトごとのCSSセレクター
+（読み込み時にコンパイル済み）で取り出す。
+パースの速さは benchmark_scraper.py で計測できる。
 """
-import requests
-from bs4 import BeautifulSoup
-from typing import Dict, List, Optional
+from bs4 import BeautifulSoup, SoupStrainer
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import codecs
+import json
+import os
 import re
+import time
+import soupsieve
+from scrape_cache import get_scrape_cache
+
+# パース結果のキャッシュのキーに含める版（パースの処理を変えたら上げる）
+PARSER_VERSION = 2
+
+# まとめて取り込むときの同時取得数（全体・同じドメインごと）
+IMPORT_MAX_CONCURRENCY = int(os.getenv("IMPORT_MAX_CONCURRENCY", "32"))
+IMPORT_MAX_CONCURRENCY_PER_DOMAIN = int(os.getenv("IMPORT_MAX_CONCURRENCY_PER_DOMAIN", "4"))
+
+# まとめて取り込むときの全体の制限時間（秒）。過ぎたら残りは打ち切る
+IMPORT_DEADLINE = float(os.getenv("IMPORT_DEADLINE", "60"))
+
+
+# JSON-LD の <script>（ページ全体の木を作らずに、この部分だけを取り出す）
+_JSON_LD_SCRIPT = re.compile(
+    r'<script\b[^>]*?\btype\s*=\s*["\']?application/ld\+json["\']?[^>]*>(.*?)</script\s*>',
+    re.IGNORECASE | re.DOTALL
+)
+_JSON_LD_MARKER = re.compile(rb'ld\+json', re.IGNORECASE)
+# <meta charset="..."> / <meta http-equiv="Content-Type" content="...; charset=...">
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([A-Za-z0-9_\-]+)', re.IGNORECASE)
+# 文字コードを探す範囲（先頭からのバイト数）
+_CHARSET_SCAN_BYTES = 4096
+# ISO 8601形式（例: PT30M）の分
+_ISO_MINUTES = re.compile(r'PT(\d+)M')
+_DIGITS = re.compile(r'(\d+)')
+
+
+class SiteSelectors(NamedTuple):
+    """サイトごとのCSSセレクター（モジュールの読み込み時に1回だけコンパイルする）"""
+    name: Any
+    ingredient: Any
+    ingredient_name: Any
+    ingredient_quantity: Any
+    step: Any
+    cooking_time: Any
+
+
+def _compile_selectors(**selectors: str) -> SiteSelectors:
+    return SiteSelectors(**{key: soupsieve.compile(selector) for key, selector in selectors.items()})
+
+
+COOKPAD_SELECTORS = _compile_selectors(
+    name='h1.recipe-title',
+    ingredient='.ingredient_row',
+    ingredient_name='.ingredient_name',
+    ingredient_quantity='.ingredient_quantity',
+    step='.step_text',
+    cooking_time='.cooking_time',
+)
+
+RAKUTEN_SELECTORS = _compile_selectors(
+    name='h1.page_title__text',
+    ingredient='.recipe_material__item',
+    ingredient_name='.recipe_material__item_name',
+    ingredient_quantity='.recipe_material__item_serving',
+    step='.recipe_howto__text',
+    cooking_time='.recipe_material__time',
+)
+
+
+def _decode(content: bytes) -> str:
+    """ページの本文を文字列にする（<meta charset> があればその文字コード、なければ UTF-8）"""
+    encoding = "utf-8"
+    match = _META_CHARSET.search(content, 0, _CHARSET_SCAN_BYTES)
+    if match:
+        try:
+            encoding = codecs.lookup(match.group(1).decode("ascii")).name
+        except LookupError:
+            pass
+    return content.decode(encoding, errors="replace")
+
+
+def _find_recipe(data: Any) -> Optional[dict]:
+    """JSON-LD の値から @type が Recipe のオブジェクトを探す（配列・@graph の中も探す）"""
+    if isinstance(data, list):
+        for item in data:
+            recipe = _find_recipe(item)
+            if recipe is not None:
+                return recipe
+        return None
+    if not isinstance(data, dict):
+        return None
+    types = data.get('@type')
+    if types == 'Recipe' or (isinstance(types, list) and 'Recipe' in types):
+        return data
+    if '@graph' in data:
+        return _find_recipe(data['@graph'])
+    return None
+
+
+def extract_json_ld_recipe(content: bytes) -> Optional[dict]:
+    """
+    ページの JSON-LD からレシピのオブジェクトを取り出す
+
+    BeautifulSoup の木は作らず、<script type="application/ld+json"> の中身だけを
+    正規表現で取り出して順に読む。レシピが見つかった時点で残りは読まない
+    """
+    # JSON-LD がないページは文字列に変換する前に除外する
+    if not _JSON_LD_MARKER.search(content):
+        return None
+    for match in _JSON_LD_SCRIPT.finditer(_decode(content)):
+        try:
+            data = json.loads(match.group(1))
+        except ValueError:
+            continue
+        recipe = _find_recipe(data)
+        if recipe is not None:
+            return recipe
+    return None
+
+
+def recipe_from_json_ld(data: dict, url: str, tags: List[str]) -> Dict:
+    """JSON-LD のレシピ（schema.org/Recipe）をレシピ情報の辞書にする"""
+    name = data.get('name', '')
+    
+    # 材料
+    ingredients = []
+    recipe_ingredients = data.get('recipeIngredient', [])
+    if isinstance(recipe_ingredients, list):
+        ingredients = recipe_ingredients
+    
+    # 手順
+    steps = []
+    recipe_instructions = data.get('recipeInstructions', [])
+    if isinstance(recipe_instructions, list):
+        for instruction in recipe_instructions:
+            if isinstance(instruction, dict):
+                step_text = instruction.get('text', '')
+                if step_text:
+                    steps.append(step_text)
+            elif isinstance(instruction, str):
+                steps.append(instruction)
+    
+    # 調理時間
+    cooking_time = None
+    total_time = data.get('totalTime', '')
+    if total_time and isinstance(total_time, str):
+        # ISO 8601形式（例: PT30M）から分を抽出
+        match = _ISO_MINUTES.search(total_time)
+        if match:
+            cooking_time = int(match.group(1))
+    
+    return {
+        "name": name,
+        "ingredients": ingredients,
+        "steps": steps,
+        "cookingTime": cooking_time,
+        "source": url,
+        "tags": list(tags)
+    }
 
 
 class RecipeScraper:
     """レシピスクレイピングクラス"""
     
     @staticmethod
-    def scrape(url: str) -> Optional[Dict]:
+    async def scrape(url: str) -> Optional[Dict]:
         """
         URLからレシピ情報を取得
         
@@ -24,207 +188,218 @@ class RecipeScraper:
         try:
             # URLのドメインを判定
             if "cookpad.com" in url:
-                return RecipeScraper._scrape_cookpad(url)
+                return await RecipeScraper._scrape_cookpad(url)
             elif "recipe.rakuten.co.jp" in url:
-                return RecipeScraper._scrape_rakuten(url)
+                return await RecipeScraper._scrape_rakuten(url)
             else:
                 # その他のサイトは汎用スクレイパーで試行
-                return RecipeScraper._scrape_generic(url)
+                return await RecipeScraper._scrape_generic(url)
         except Exception as e:
             print(f"スクレイピングエラー: {e}")
             return None
     
     @staticmethod
-    def _scrape_cookpad(url: str) -> Optional[Dict]:
+    async def scrape_many(
+        urls: List[str],
+        deadline: float = IMPORT_DEADLINE
+    ) -> AsyncIterator[Tuple[int, str, Optional[Dict], Optional[str]]]:
+        """
+        複数のURLから並行してレシピ情報を取得し、取得できた順に返す
+
+        同時取得数は全体で IMPORT_MAX_CONCURRENCY、同じドメインへは
+        IMPORT_MAX_CONCURRENCY_PER_DOMAIN までに抑える（ブックマークが同じサイトに偏っていても
+        相手のサイトに負荷をかけすぎない）。deadline 秒を過ぎたら残りを打ち切る。
+
+        Args:
+            urls: レシピのURL
+            deadline: 全体の制限時間（秒）
+
+        Yields:
+            (urls での位置, URL, レシピ情報または None, エラーの内容または None)
+        """
+        limit = asyncio.Semaphore(IMPORT_MAX_CONCURRENCY)
+        domain_limits: Dict[str, asyncio.Semaphore] = {}
+
+        async def scrape_one(index: int, url: str):
+            domain = urlsplit(url).hostname or ""
+            if domain not in domain_limits:
+                domain_limits[domain] = asyncio.Semaphore(IMPORT_MAX_CONCURRENCY_PER_DOMAIN)
+            async with domain_limits[domain], limit:
+                return index, url, await RecipeScraper.scrape(url)
+
+        tasks = {}
+        for index, url in enumerate(urls):
+            if urlsplit(url).scheme not in ("http", "https"):
+                yield index, url, None, "URLが正しくありません"
+                continue
+            tasks[asyncio.ensure_future(scrape_one(index, url))] = (index, url)
+
+        expires_at = time.monotonic() + deadline
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(0.0, expires_at - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    index, url = tasks[task]
+                    try:
+                        _, _, recipe_data = task.result()
+                    except Exception as e:
+                        yield index, url, None, str(e)
+                        continue
+                    if recipe_data:
+                        yield index, url, recipe_data, None
+                    else:
+                        yield index, url, None, "レシピ情報を取得できませんでした"
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                index, url = tasks[task]
+                yield index, url, None, "制限時間内に取得できませんでした"
+        finally:
+            # 途中でクライアントが切断した場合なども、残りの取得を止める
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def _fetch_and_parse(url: str, parser: str, parse: Callable[[bytes, str], Optional[Dict]]) -> Optional[Dict]:
+        """
+        ページを取得してパースする（scrape_cache.py のキャッシュを使う）
+
+        ページの本文が前回と同じなら、保存済みのパース結果を返す（パースしない）
+        """
+        cache = get_scrape_cache()
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        content, digest = await cache.fetch(url, headers=headers)
+        
+        parser_key = f"{parser}-v{PARSER_VERSION}"
+        recipe = cache.get_parsed(parser_key, digest)
+        if recipe is not None:
+            # 同じ本文の別のURL（転送元など）でも使い回すため、取得元はこのURLにする
+            return {**recipe, "source": url}
+        
+        # パースはCPUを使うため、イベントループを止めないようスレッドで行う
+        recipe = await run_in_threadpool(parse, content, url)
+        if recipe is not None:
+            cache.put_parsed(parser_key, digest, recipe)
+        return recipe
+    
+    @staticmethod
+    async def _scrape_cookpad(url: str) -> Optional[Dict]:
         """クックパッドからスクレイピング"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'lxml')
-            
-            # レシピ名
-            name_elem = soup.select_one('h1.recipe-title')
-            name = name_elem.text.strip() if name_elem else ""
-            
-            # 材料
-            ingredients = []
-            ingredient_elems = soup.select('.ingredient_row')
-            for elem in ingredient_elems:
-                ingredient_name = elem.select_one('.ingredient_name')
-                ingredient_quantity = elem.select_one('.ingredient_quantity')
-                if ingredient_name and ingredient_quantity:
-                    ingredients.append(
-                        f"{ingredient_name.text.strip()} {ingredient_quantity.text.strip()}"
-                    )
-            
-            # 手順
-            steps = []
-            step_elems = soup.select('.step_text')
-            for elem in step_elems:
-                step_text = elem.text.strip()
-                if step_text:
-                    steps.append(step_text)
-            
-            # 調理時間（目安）
-            cooking_time = None
-            time_elem = soup.select_one('.cooking_time')
-            if time_elem:
-                time_text = time_elem.text
-                # "約30分"のような形式から数値を抽出
-                match = re.search(r'(\d+)', time_text)
-                if match:
-                    cooking_time = int(match.group(1))
-            
-            return {
-                "name": name,
-                "ingredients": ingredients,
-                "steps": steps,
-                "cookingTime": cooking_time,
-                "source": url,
-                "tags": ["クックパッド"]
-            }
-            
+            return await RecipeScraper._fetch_and_parse(url, "cookpad", RecipeScraper._parse_cookpad)
         except Exception as e:
             print(f"クックパッドスクレイピングエラー: {e}")
             return None
     
     @staticmethod
-    def _scrape_rakuten(url: str) -> Optional[Dict]:
+    def _parse_cookpad(content: bytes, url: str) -> Optional[Dict]:
+        return RecipeScraper._parse_site(content, url, COOKPAD_SELECTORS, ["クックパッド"])
+    
+    @staticmethod
+    async def _scrape_rakuten(url: str) -> Optional[Dict]:
         """楽天レシピからスクレイピング"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'lxml')
-            
-            # レシピ名
-            name_elem = soup.select_one('h1.page_title__text')
-            name = name_elem.text.strip() if name_elem else ""
-            
-            # 材料
-            ingredients = []
-            ingredient_elems = soup.select('.recipe_material__item')
-            for elem in ingredient_elems:
-                name_elem = elem.select_one('.recipe_material__item_name')
-                serving_elem = elem.select_one('.recipe_material__item_serving')
-                if name_elem and serving_elem:
-                    ingredients.append(
-                        f"{name_elem.text.strip()} {serving_elem.text.strip()}"
-                    )
-            
-            # 手順
-            steps = []
-            step_elems = soup.select('.recipe_howto__text')
-            for elem in step_elems:
-                step_text = elem.text.strip()
-                if step_text:
-                    steps.append(step_text)
-            
-            # 調理時間
-            cooking_time = None
-            time_elem = soup.select_one('.recipe_material__time')
-            if time_elem:
-                time_text = time_elem.text
-                # "約30分"のような形式から数値を抽出
-                match = re.search(r'(\d+)', time_text)
-                if match:
-                    cooking_time = int(match.group(1))
-            
-            return {
-                "name": name,
-                "ingredients": ingredients,
-                "steps": steps,
-                "cookingTime": cooking_time,
-                "source": url,
-                "tags": ["楽天レシピ"]
-            }
-            
+            return await RecipeScraper._fetch_and_parse(url, "rakuten", RecipeScraper._parse_rakuten)
         except Exception as e:
             print(f"楽天レシピスクレイピングエラー: {e}")
             return None
     
     @staticmethod
-    def _scrape_generic(url: str) -> Optional[Dict]:
+    def _parse_rakuten(content: bytes, url: str) -> Optional[Dict]:
+        return RecipeScraper._parse_site(content, url, RAKUTEN_SELECTORS, ["楽天レシピ"])
+    
+    @staticmethod
+    async def _scrape_generic(url: str) -> Optional[Dict]:
         """汎用スクレイパー（schema.org対応）"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'lxml')
-            
-            # JSON-LDからレシピ情報を探す
-            scripts = soup.find_all('script', type='application/ld+json')
-            for script in scripts:
-                try:
-                    import json
-                    data = json.loads(script.string)
-                    
-                    # @typeがRecipeの場合
-                    if isinstance(data, dict) and data.get('@type') == 'Recipe':
-                        name = data.get('name', '')
-                        
-                        # 材料
-                        ingredients = []
-                        recipe_ingredients = data.get('recipeIngredient', [])
-                        if isinstance(recipe_ingredients, list):
-                            ingredients = recipe_ingredients
-                        
-                        # 手順
-                        steps = []
-                        recipe_instructions = data.get('recipeInstructions', [])
-                        if isinstance(recipe_instructions, list):
-                            for instruction in recipe_instructions:
-                                if isinstance(instruction, dict):
-                                    step_text = instruction.get('text', '')
-                                    if step_text:
-                                        steps.append(step_text)
-                                elif isinstance(instruction, str):
-                                    steps.append(instruction)
-                        
-                        # 調理時間
-                        cooking_time = None
-                        total_time = data.get('totalTime', '')
-                        if total_time:
-                            # ISO 8601形式（例: PT30M）から分を抽出
-                            match = re.search(r'PT(\d+)M', total_time)
-                            if match:
-                                cooking_time = int(match.group(1))
-                        
-                        return {
-                            "name": name,
-                            "ingredients": ingredients,
-                            "steps": steps,
-                            "cookingTime": cooking_time,
-                            "source": url,
-                            "tags": []
-                        }
-                        
-                except:
-                    continue
-            
-            # JSON-LDで取得できない場合は基本的なスクレイピング
-            name_elem = soup.select_one('h1')
-            name = name_elem.text.strip() if name_elem else "取り込んだレシピ"
-            
-            return {
-                "name": name,
-                "ingredients": [],
-                "steps": [],
-                "cookingTime": None,
-                "source": url,
-                "tags": []
-            }
-            
+            return await RecipeScraper._fetch_and_parse(url, "generic", RecipeScraper._parse_generic)
         except Exception as e:
             print(f"汎用スクレイピングエラー: {e}")
             return None
+    
+    @staticmethod
+    def _parse_generic(content: bytes, url: str) -> Optional[Dict]:
+        # JSON-LDからレシピ情報を探す
+        data = extract_json_ld_recipe(content)
+        if data is not None:
+            return recipe_from_json_ld(data, url, [])
+        
+        # JSON-LDで取得できない場合は h1 だけを木にする
+        soup = BeautifulSoup(content, 'lxml', parse_only=SoupStrainer('h1'))
+        name_elem = soup.find('h1')
+        name = name_elem.text.strip() if name_elem else "取り込んだレシピ"
+        
+        return {
+            "name": name,
+            "ingredients": [],
+            "steps": [],
+            "cookingTime": None,
+            "source": url,
+            "tags": []
+        }
+    
+    @staticmethod
+    def _parse_site(content: bytes, url: str, selectors: "SiteSelectors", tags: List[str]) -> Dict:
+        """
+        サイト別のパース。ページに JSON-LD のレシピがあればそれを使い、
+        なければ（名前・材料または手順が取れなければ）CSSセレクターで木から取り出す
+        """
+        data = extract_json_ld_recipe(content)
+        if data is not None:
+            recipe = recipe_from_json_ld(data, url, tags)
+            if recipe["name"] and (recipe["ingredients"] or recipe["steps"]):
+                return recipe
+        return RecipeScraper._parse_tree(content, url, selectors, tags)
+    
+    @staticmethod
+    def _parse_tree(content: bytes, url: str, selectors: "SiteSelectors", tags: List[str]) -> Dict:
+        """ページ全体の木を作り、サイトごとのCSSセレクター（コンパイル済み）で取り出す"""
+        soup = BeautifulSoup(content, 'lxml')
+        
+        # レシピ名
+        name_elem = selectors.name.select_one(soup)
+        name = name_elem.text.strip() if name_elem else ""
+        
+        # 材料
+        ingredients = []
+        for elem in selectors.ingredient.select(soup):
+            ingredient_name = selectors.ingredient_name.select_one(elem)
+            ingredient_quantity = selectors.ingredient_quantity.select_one(elem)
+            if ingredient_name and ingredient_quantity:
+                ingredients.append(
+                    f"{ingredient_name.text.strip()} {ingredient_quantity.text.strip()}"
+                )
+        
+        # 手順
+        steps = []
+        for elem in selectors.step.select(soup):
+            step_text = elem.text.strip()
+            if step_text:
+                steps.append(step_text)
+        
+        # 調理時間（目安）
+        cooking_time = None
+        time_elem = selectors.cooking_time.select_one(soup)
+        if time_elem:
+            # "約30分"のような形式から数値を抽出
+            match = _DIGITS.search(time_elem.text)
+            if match:
+                cooking_time = int(match.group(1))
+        
+        return {
+            "name": name,
+            "ingredients": ingredients,
+            "steps": steps,
+            "cookingTime": cooking_time,
+            "source": url,
+            "tags": list(tags)
+        }
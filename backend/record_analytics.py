@@ -0,0 +1,110 @@
+"""
+記録の集計（NumPyによるベクトル化）
+
+開始時刻と時間を一度だけ配列に変換し、曜日×時間帯のヒートマップと
+日別合計をループなしで計算する。1時間の境界（日付の境界）をまたぐ記録は
+時間帯ごとに分割して集計する。
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from zoneinfo import ZoneInfo
+import numpy as np
+
+# 集計に使うタイムゾーン（タイムゾーン情報のない時刻はこの時刻とみなす）
+DEFAULT_TIMEZONE = "Asia/Tokyo"
+
+# 1件の記録として扱う最大時間（秒）。誤った値で配列が膨らまないよう制限する
+MAX_SESSION_SECONDS = 7 * 24 * 3600
+
+WEEKDAY_LABELS = ["月", "火", "水", "木", "金", "土", "日"]
+
+_EPOCH = datetime(1970, 1, 1)
+
+# 1970-01-01 は木曜日（月曜日=0 とした曜日番号で3）
+_EPOCH_WEEKDAY = 3
+
+
+def to_local_seconds(start_times: Iterable[Optional[str]], tz_name: str = DEFAULT_TIMEZONE) -> np.ndarray:
+    """
+    ISO形式の開始時刻を tz_name のローカル時刻のエポック秒の配列に変換
+
+    タイムゾーン情報のない時刻は DEFAULT_TIMEZONE の時刻として変換する。解析できない値はNaNになる
+    """
+    tz = ZoneInfo(tz_name)
+    default_tz = ZoneInfo(DEFAULT_TIMEZONE)
+    values = []
+    for value in start_times:
+        try:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            values.append(np.nan)
+            continue
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=default_tz)
+        dt = dt.astimezone(tz).replace(tzinfo=None)
+        values.append((dt - _EPOCH).total_seconds())
+    return np.asarray(values, dtype=np.float64)
+
+
+def compute_heatmap(starts: np.ndarray, durations: np.ndarray) -> Dict:
+    """
+    曜日×時間帯のヒートマップと日別合計を計算
+
+    Args:
+        starts: 開始時刻（ローカル時刻のエポック秒）
+        durations: 時間（秒）
+
+    Returns:
+        {"heatmap": 7×24の秒数（月曜始まり）, "daily": 日別の合計, "totalDuration": 合計秒数}
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    durations = np.clip(np.nan_to_num(np.asarray(durations, dtype=np.float64)), 0, MAX_SESSION_SECONDS)
+    valid = ~np.isnan(starts)
+    starts = starts[valid]
+    durations = durations[valid]
+
+    if starts.size == 0:
+        return {"weekdays": WEEKDAY_LABELS, "heatmap": np.zeros((7, 24), dtype=np.int64).tolist(), "daily": [], "totalDuration": 0}
+
+    ends = starts + durations
+
+    # 各記録がまたぐ時間帯（エポックからの通算時間）の範囲
+    first_hour = np.floor(starts / 3600).astype(np.int64)
+    last_hour = np.maximum(np.ceil(ends / 3600).astype(np.int64) - 1, first_hour)
+    segment_counts = last_hour - first_hour + 1
+
+    # 記録を時間帯ごとのセグメントに展開
+    owner = np.repeat(np.arange(starts.size), segment_counts)
+    offsets = np.arange(owner.size) - np.repeat(np.cumsum(segment_counts) - segment_counts, segment_counts)
+    hours = first_hour[owner] + offsets
+    seconds = np.minimum(ends[owner], (hours + 1) * 3600.0) - np.maximum(starts[owner], hours * 3600.0)
+    seconds = np.maximum(seconds, 0)
+
+    # 曜日×時間帯
+    days = hours // 24
+    weekdays = (days + _EPOCH_WEEKDAY) % 7
+    cells = np.bincount(weekdays * 24 + hours % 24, weights=seconds, minlength=7 * 24)
+    heatmap = np.rint(cells).astype(np.int64).reshape(7, 24)
+
+    # 日別合計（時間は日付の境界で分割、件数は開始日で数える）
+    first_day = days.min()
+    day_count = int(days.max() - first_day + 1)
+    daily_seconds = np.bincount(days - first_day, weights=seconds, minlength=day_count)
+    daily_records = np.bincount(first_hour // 24 - first_day, minlength=day_count)
+    active_days = np.nonzero((daily_seconds > 0) | (daily_records > 0))[0]
+
+    daily = [
+        {
+            "date": str(np.datetime64(int(first_day + day), "D")),
+            "totalDuration": int(round(daily_seconds[day])),
+            "count": int(daily_records[day])
+        }
+        for day in active_days
+    ]
+
+    return {
+        "weekdays": WEEKDAY_LABELS,
+        "heatmap": heatmap.tolist(),
+        "daily": daily,
+        "totalDuration": int(round(seconds.sum()))
+    }
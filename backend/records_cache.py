@@ -0,0 +1,441 @@
+"""
+記録の列指向ローカルキャッシュ（集計用）
+
+recordsコンテナの集計に必要な項目（timerId, tag, date, 開始時刻, 時間）だけを
+列ごとのNumPy配列としてディスクに保存し、mmapで読み込む。
+Cosmos DBの変更フィードで差分を取り込むため、統計やレポートの範囲・グループ集計は
+RUを消費せずにローカルで計算できる。
+
+- timerId / tag は語彙（meta.json）への整数コードとして保存（tagなしは -1）
+- date はエポックからの日数、開始時刻は DEFAULT_TIMEZONE のローカル時刻のエポック秒
+- 記録の一覧（タイマーごとの記録）も返せるよう、ドキュメント（システム項目を除いたJSON）を
+  1つの連結したバイト列（docs）に保存し、行ごとに開始位置と長さを持つ
+- 変更フィードには削除が現れないため、このプロセスでの削除は records_store の削除ログから取り除く。
+  他のプロセスでの削除は SYNC_INTERVAL ごと（または強制同期）に件数を比べ、合わない場合は
+  IDを突き合わせて取り除く（記録を書き込んだ直後の同期ではクエリを実行しない）
+
+キャッシュは RECORDS_CACHE_DIR（デフォルト: analytics_cache）に保存され、
+削除しても次回の同期で全件から作り直される。
+change_feed_processor から記録の変更が通知されると、次の読み取りで同期する。
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import change_feed
+import change_feed_processor
+import records_store
+from record_analytics import DEFAULT_TIMEZONE, compute_heatmap, to_local_seconds
+
+CACHE_DIR = os.getenv("RECORDS_CACHE_DIR", "analytics_cache")
+
+# 別プロセスからの書き込みを取り込むための最大の同期間隔（秒）
+# このプロセスで記録を書き込んだ場合は次の読み取りで同期する
+SYNC_INTERVAL = int(os.getenv("RECORDS_CACHE_SYNC_INTERVAL", "60"))
+
+# 集計のグループ化の単位
+GROUP_BY_TIMER = "timer"
+GROUP_BY_TAG = "tag"
+GROUP_BY_DATE = "date"
+
+# 日付が不正な記録の日数
+_NO_DATE = np.iinfo(np.int32).min
+
+_COLUMNS = {
+    "id": None,
+    "timer": np.int32,
+    "tag": np.int32,
+    "day": np.int32,
+    "start": np.float64,
+    "duration": np.int64,
+    "doc_start": np.int64,
+    "doc_length": np.int64,
+}
+
+
+def _to_day(date: Optional[str]) -> int:
+    try:
+        return int(np.datetime64(date, "D").astype(np.int64))
+    except (TypeError, ValueError):
+        return _NO_DATE
+
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    columns = {name: np.empty(0, dtype=dtype) for name, dtype in _COLUMNS.items() if dtype is not None}
+    columns["id"] = np.empty(0, dtype="<U1")
+    return columns
+
+
+def _encode_docs(items: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """ドキュメント（システム項目を除く）を連結したUTF-8のJSONと、それぞれの長さ"""
+    encoded = [
+        json.dumps({k: v for k, v in item.items() if not k.startswith("_")}, ensure_ascii=False).encode("utf-8")
+        for item in items
+    ]
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), np.array([len(e) for e in encoded], dtype=np.int64)
+
+
+def _compact_docs(docs: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """残す行のドキュメントだけを詰め直す（新しいバイト列と開始位置）"""
+    new_starts = np.cumsum(lengths) - lengths
+    index = np.repeat(starts - new_starts, lengths) + np.arange(int(lengths.sum()), dtype=np.int64)
+    return np.asarray(docs)[index], new_starts
+
+
+class RecordsCache:
+    """記録の列指向キャッシュ"""
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+        self.columns = _empty_columns()
+        self.docs = np.empty(0, dtype=np.uint8)
+        self.timer_ids: List[str] = []
+        self.tags: List[str] = []
+        self.timer_names: Dict[str, str] = {}
+        self.continuations: Dict[str, str] = {}
+        self.source: Optional[str] = None
+        self.generation = 0
+        self.synced_at = 0.0
+        # 他のプロセスでの削除をIDの突き合わせで取り除いた時刻
+        self.reconciled_at = 0.0
+        self._synced_write_generation = None
+        self._lock = threading.Lock()
+        self._load()
+
+    # ------------------------------------------------------------------
+    # 永続化
+    # ------------------------------------------------------------------
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def _column_path(self, name: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{name}.{generation}.npy")
+
+    def _load(self):
+        """保存済みのキャッシュを読み込む（列はmmapで開く）"""
+        if not os.path.exists(self._meta_path()):
+            return
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            columns = {
+                name: np.load(self._column_path(name, meta["generation"]), mmap_mode="r")
+                for name in _COLUMNS
+            }
+            docs = np.load(self._column_path("docs", meta["generation"]), mmap_mode="r")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Failed to load records cache, rebuilding: {e}")
+            return
+        self.columns = columns
+        self.docs = docs
+        self.timer_ids = meta["timerIds"]
+        self.tags = meta["tags"]
+        self.timer_names = meta.get("timerNames", {})
+        self.continuations = meta["continuations"]
+        self.source = meta.get("source")
+        self.generation = meta["generation"]
+
+    def _save(self):
+        """
+        列ファイルを新しい世代として書き出し、meta.json を置き換える
+
+        meta.json が指す世代だけが有効なため、書き込み途中で中断しても壊れない
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        generation = self.generation + 1
+        for name, values in self.columns.items():
+            np.save(self._column_path(name, generation), np.ascontiguousarray(values))
+        np.save(self._column_path("docs", generation), np.ascontiguousarray(self.docs))
+
+        meta = {
+            "generation": generation,
+            "source": self.source,
+            "timerIds": self.timer_ids,
+            "tags": self.tags,
+            "timerNames": self.timer_names,
+            "continuations": self.continuations,
+            "rows": int(self.columns["id"].size),
+            "syncedAt": time.time(),
+        }
+        tmp_path = f"{self._meta_path()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path())
+
+        previous = self.generation
+        self.generation = generation
+        # 古い世代はmmapで開かれていなければ削除する（Windowsでは開いていると消せない）
+        for name in [*_COLUMNS, "docs"]:
+            try:
+                os.remove(self._column_path(name, previous))
+            except OSError:
+                pass
+
+    # ------------------------------------------------------------------
+    # 同期
+    # ------------------------------------------------------------------
+
+    def _code(self, vocabulary: List[str], lookup: Dict[str, int], value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        if value not in lookup:
+            lookup[value] = len(vocabulary)
+            vocabulary.append(value)
+        return lookup[value]
+
+    def _merge(self, changes: Dict[str, dict]):
+        """変更されたドキュメントを既存の行に上書き・追加する"""
+        timer_lookup = {value: code for code, value in enumerate(self.timer_ids)}
+        tag_lookup = {value: code for code, value in enumerate(self.tags)}
+
+        items = list(changes.values())
+        incoming = {
+            "id": np.array([item["id"] for item in items]),
+            "timer": np.array([self._code(self.timer_ids, timer_lookup, item.get("timerId")) for item in items], dtype=np.int32),
+            "tag": np.array([self._code(self.tags, tag_lookup, item.get("tag") or None) for item in items], dtype=np.int32),
+            "day": np.array([_to_day(item.get("date")) for item in items], dtype=np.int32),
+            "start": to_local_seconds((item.get("startTime") for item in items), DEFAULT_TIMEZONE),
+            "duration": np.array([item.get("duration") or 0 for item in items], dtype=np.int64),
+        }
+        for item in items:
+            if item.get("timerId") and item.get("timerName"):
+                self.timer_names[item["timerId"]] = item["timerName"]
+
+        # 変更された記録の古い行を除いてから末尾に追加する
+        self._keep_rows(~np.isin(self.columns["id"], incoming["id"]))
+        blob, lengths = _encode_docs(items)
+        incoming["doc_start"] = self.docs.size + np.cumsum(lengths) - lengths
+        incoming["doc_length"] = lengths
+        self.docs = np.concatenate([np.asarray(self.docs), blob])
+        self.columns = {
+            name: np.concatenate([self.columns[name], incoming[name]])
+            for name in _COLUMNS
+        }
+
+    def _keep_rows(self, keep: np.ndarray):
+        """keep が True の行だけを残す（ドキュメントも詰め直す）"""
+        columns = {name: np.asarray(values)[keep] for name, values in self.columns.items()}
+        self.docs, columns["doc_start"] = _compact_docs(self.docs, columns["doc_start"], columns["doc_length"])
+        self.columns = columns
+
+    def _remove_ids(self, ids: List[str]) -> int:
+        """このプロセスで削除した記録の行を取り除く（Cosmos DBには問い合わせない）"""
+        if not ids:
+            return 0
+        keep = ~np.isin(self.columns["id"], np.array(ids))
+        removed = int((~keep).sum())
+        if removed:
+            self._keep_rows(keep)
+        return removed
+
+    def _remove_deleted(self, container) -> int:
+        """
+        他のプロセスで削除された記録の行を取り除く
+
+        件数が一致する場合はIDの取得を省略する
+
+        Returns:
+            取り除いた行数
+        """
+        counts = list(container.query_items(
+            query="SELECT VALUE COUNT(1) FROM c",
+            enable_cross_partition_query=True
+        ))
+        if sum(counts) == self.columns["id"].size:
+            return 0
+
+        ids = np.array(list(container.query_items(
+            query="SELECT VALUE c.id FROM c",
+            enable_cross_partition_query=True
+        )))
+        keep = np.isin(self.columns["id"], ids)
+        removed = int((~keep).sum())
+        if removed:
+            self._keep_rows(keep)
+        return removed
+
+    def invalidate(self):
+        """次の読み取りで同期させる（同期間隔を待たない）"""
+        self.synced_at = 0.0
+
+    def sync(self, force: bool = False) -> Dict:
+        """
+        変更フィードの差分を取り込む
+
+        このプロセスで記録が書き込まれていない場合は SYNC_INTERVAL ごとにのみ同期する。
+        他のプロセスでの削除を調べるクエリは SYNC_INTERVAL ごと（または force）にのみ実行する
+
+        Args:
+            force: 同期間隔に関わらず同期する
+
+        Returns:
+            {"synced": 同期したか, "changed": 取り込んだ件数, "deleted": 取り除いた件数, "rows": 行数}
+        """
+        with self._lock:
+            now = time.time()
+            write_generation = records_store.write_generation()
+            if (not force
+                    and write_generation == self._synced_write_generation
+                    and now - self.synced_at < SYNC_INTERVAL):
+                return {"synced": False, "changed": 0, "deleted": 0, "rows": int(self.columns["id"].size)}
+
+            container = records_store.query_container()
+            source = container.id
+            if source != self.source:
+                # パーティション移行で読み取り先が変わった場合は作り直す
+                self.columns = _empty_columns()
+                self.docs = np.empty(0, dtype=np.uint8)
+                self.timer_ids, self.tags, self.timer_names = [], [], {}
+                self.continuations = {}
+                self.source = source
+
+            # 同じ記録が複数回変更された場合は最後の状態だけを使う
+            changes = {}
+            continuations = dict(self.continuations)
+            for range_id, items, continuation in change_feed.read_changes(container, continuations):
+                for item in items:
+                    changes[item["id"]] = item
+                if continuation:
+                    continuations[range_id] = continuation
+
+            if changes:
+                self._merge(changes)
+            local_deleted = records_store.deleted_since(self._synced_write_generation)
+            deleted = self._remove_ids(local_deleted or [])
+            if force or local_deleted is None or now - self.reconciled_at >= SYNC_INTERVAL:
+                deleted += self._remove_deleted(container)
+                self.reconciled_at = now
+            self.continuations = continuations
+
+            if changes or deleted or not os.path.exists(self._meta_path()):
+                self._save()
+            self.synced_at = now
+            self._synced_write_generation = write_generation
+            return {"synced": True, "changed": len(changes), "deleted": deleted, "rows": int(self.columns["id"].size)}
+
+    # ------------------------------------------------------------------
+    # 集計
+    # ------------------------------------------------------------------
+
+    def _select(
+        self,
+        columns: Dict[str, np.ndarray],
+        timer_id: Optional[str] = None,
+        tag: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> np.ndarray:
+        """条件に合う行のマスク（build_records_query と同じ条件）"""
+        mask = np.ones(columns["id"].size, dtype=bool)
+        if timer_id:
+            code = self.timer_ids.index(timer_id) if timer_id in self.timer_ids else -2
+            mask &= columns["timer"] == code
+        if tag:
+            code = self.tags.index(tag) if tag in self.tags else -2
+            mask &= columns["tag"] == code
+        if start_date:
+            mask &= columns["day"] >= _to_day(start_date)
+        if end_date:
+            mask &= (columns["day"] <= _to_day(end_date)) & (columns["day"] != _NO_DATE)
+        return mask
+
+    def timer_records(self, timer_id: str) -> List[dict]:
+        """タイマーの記録（開始時刻の新しい順。システム項目は含まない）"""
+        # ドキュメントと開始位置を同じ世代で読むため、同期と同時には読まない
+        with self._lock:
+            columns, docs = self.columns, self.docs
+            rows = np.nonzero(self._select(columns, timer_id=timer_id))[0]
+            records = [
+                json.loads(bytes(docs[start:start + length]))
+                for start, length in zip(columns["doc_start"][rows], columns["doc_length"][rows])
+            ]
+        records.sort(key=lambda record: record.get("startTime") or "", reverse=True)
+        return records
+
+    def heatmap(self, **filters) -> Dict:
+        """曜日×時間帯のヒートマップと日別合計（record_analytics.compute_heatmap と同じ形式）"""
+        # 同期で列が置き換えられても集計中の配列が変わらないよう参照を固定する
+        columns = self.columns
+        mask = self._select(columns, **filters)
+        return compute_heatmap(columns["start"][mask], columns["duration"][mask])
+
+    def breakdown(self, group_by: str, **filters) -> List[dict]:
+        """
+        タイマー別・タグ別・日別の件数と合計時間
+
+        Args:
+            group_by: GROUP_BY_TIMER / GROUP_BY_TAG / GROUP_BY_DATE
+            **filters: timer_id, tag, start_date, end_date
+
+        Returns:
+            [{"timerId" | "tag" | "date", "count", "totalDuration"}, ...]
+        """
+        columns = self.columns
+        mask = self._select(columns, **filters)
+        durations = columns["duration"][mask]
+
+        if group_by == GROUP_BY_DATE:
+            days = columns["day"][mask]
+            valid = days != _NO_DATE
+            keys, codes = np.unique(days[valid], return_inverse=True)
+            durations = durations[valid]
+        else:
+            # tagなし（-1）も1つのグループとして数えるため1ずらす
+            column = "timer" if group_by == GROUP_BY_TIMER else "tag"
+            codes = columns[column][mask] + 1
+            keys = None
+
+        counts = np.bincount(codes, minlength=0 if keys is None else keys.size)
+        totals = np.bincount(codes, weights=durations, minlength=counts.size)
+        groups = np.nonzero(counts)[0]
+
+        if group_by == GROUP_BY_DATE:
+            return [
+                {"date": str(np.datetime64(int(keys[g]), "D")), "count": int(counts[g]), "totalDuration": int(totals[g])}
+                for g in groups
+            ]
+        if group_by == GROUP_BY_TIMER:
+            return [
+                {
+                    "timerId": self.timer_ids[g - 1] if g > 0 else None,
+                    "timerName": self.timer_names.get(self.timer_ids[g - 1]) if g > 0 else None,
+                    "count": int(counts[g]),
+                    "totalDuration": int(totals[g])
+                }
+                for g in groups
+            ]
+        return [
+            {"tag": self.tags[g - 1] if g > 0 else None, "count": int(counts[g]), "totalDuration": int(totals[g])}
+            for g in groups
+        ]
+
+
+# グローバルインスタンス
+_records_cache = None
+
+
+def get_records_cache() -> RecordsCache:
+    """記録キャッシュのシングルトンインスタンスを取得"""
+    global _records_cache
+    if _records_cache is None:
+        _records_cache = RecordsCache()
+    return _records_cache
+
+
+def get_synced_records_cache() -> RecordsCache:
+    """変更フィードの差分を取り込んだ記録キャッシュを取得（スレッドで実行する）"""
+    cache = get_records_cache()
+    cache.sync()
+    return cache
+
+
+def _on_records_changed(items: List[dict]):
+    # 他のプロセスからの書き込みも次の読み取りで取り込む
+    if _records_cache is not None:
+        _records_cache.invalidate()
+
+
+change_feed_processor.subscribe("records", _on_records_changed)
@@ -0,0 +1,320 @@
+"""
+記録の読み書き（パーティション移行対応）
+
+recordsコンテナは /id パーティションのため、timerIdや日付での絞り込みが
+すべてクロスパーティションクエリになる。/timerId でパーティション分割した
+records_by_timer コンテナへ移行するため、RECORDS_PARTITION_MODE で
+読み書き先を切り替える。
+
+- legacy: records のみを使用（デフォルト）
+- dual: 両方に書き込む。ポイント読み取りは records_by_timer → records の順に探し、
+        クエリは移行元の records から読む（repartition_records.py でのコピー中）
+- partitioned: records_by_timer のみを使用。timerId指定のクエリは単一パーティションになる
+
+移行手順:
+    1. RECORDS_PARTITION_MODE=dual でアプリを再起動
+    2. python repartition_records.py でコピー（中断しても再実行で続きから）
+    3. python repartition_records.py --verify で差分がないことを確認
+    4. RECORDS_PARTITION_MODE=partitioned でアプリを再起動
+"""
+import asyncio
+from collections import deque
+from itertools import groupby
+from typing import Deque, List, Optional, Tuple
+from azure.cosmos import exceptions
+from database import (
+    RECORDS_BY_TIMER_CONTAINER,
+    RECORDS_CONTAINER,
+    RECORDS_PARTITION_MODE
+)
+from storage import get_container, get_sync_container
+
+LEGACY = "legacy"
+DUAL = "dual"
+PARTITIONED = "partitioned"
+
+# 一括作成時の同時書き込み数
+BULK_CONCURRENCY = 16
+
+# トランザクションバッチ1回あたりの操作数の上限（Cosmos DBの制限）
+MAX_BATCH_OPERATIONS = 100
+
+if RECORDS_PARTITION_MODE not in (LEGACY, DUAL, PARTITIONED):
+    raise ValueError(f"Invalid RECORDS_PARTITION_MODE: {RECORDS_PARTITION_MODE}")
+
+# このプロセスでの書き込み回数（records_cache が同期が必要かを判断するために使う）
+_write_generation = 0
+
+# このプロセスで削除した記録の (書き込み回数, 記録ID)（変更フィードに削除は現れないため、
+# records_cache が全件のIDを読まずに削除を反映するために使う）
+DELETED_LOG_SIZE = 10000
+_deleted_log: Deque[Tuple[int, str]] = deque(maxlen=DELETED_LOG_SIZE)
+# あふれて捨てた削除のうち最後のものの書き込み回数
+_deleted_log_evicted = 0
+
+
+def write_generation() -> int:
+    """このプロセスで記録が書き込まれるたびに増える番号"""
+    return _write_generation
+
+
+def deleted_since(generation: Optional[int]) -> Optional[List[str]]:
+    """
+    write_generation() が generation だった時点より後に、このプロセスで削除した記録ID
+
+    古い削除がすでに捨てられていて分からない場合（generation が None の場合も）は None
+    """
+    if generation is None or generation < _deleted_log_evicted:
+        return None
+    return [record_id for written, record_id in list(_deleted_log) if written > generation]
+
+
+def _mark_written():
+    global _write_generation
+    _write_generation += 1
+
+
+def _writes_legacy() -> bool:
+    return RECORDS_PARTITION_MODE in (LEGACY, DUAL)
+
+
+def _writes_partitioned() -> bool:
+    return RECORDS_PARTITION_MODE in (DUAL, PARTITIONED)
+
+
+def query_container():
+    """
+    クエリの読み取り先（移行中は全件そろっている移行元から読む）
+
+    同期クライアントのコンテナを返す（変更フィードの読み取りなど、スレッドで実行する処理用）
+    """
+    if RECORDS_PARTITION_MODE == PARTITIONED:
+        return get_sync_container(RECORDS_BY_TIMER_CONTAINER)
+    return get_sync_container(RECORDS_CONTAINER)
+
+
+def _legacy_container():
+    return get_container(RECORDS_CONTAINER)
+
+
+def _partitioned_container():
+    return get_container(RECORDS_BY_TIMER_CONTAINER)
+
+
+def _async_query_container():
+    if RECORDS_PARTITION_MODE == PARTITIONED:
+        return _partitioned_container()
+    return _legacy_container()
+
+
+def query_records(query: str, parameters: Optional[list] = None, timer_id: Optional[str] = None, **kwargs):
+    """
+    記録を検索
+
+    Args:
+        query: Cosmos DB SQL
+        parameters: クエリパラメータ
+        timer_id: 指定すると、パーティション移行後は単一パーティションクエリになる
+                  （クエリ自体にも c.timerId の条件を含めること）
+        **kwargs: max_item_count などの query_items のオプション
+
+    Returns:
+        query_items の戻り値（async for で読む。by_page() 可能）
+    """
+    container = _async_query_container()
+    if timer_id and RECORDS_PARTITION_MODE == PARTITIONED:
+        return container.query_items(query=query, parameters=parameters or [], partition_key=timer_id, **kwargs)
+    return container.query_items(query=query, parameters=parameters or [], **kwargs)
+
+
+async def _read_partitioned(record_id: str, timer_id: Optional[str]) -> dict:
+    container = _partitioned_container()
+    if timer_id:
+        return await container.read_item(item=record_id, partition_key=timer_id)
+    # timerIdが分からない場合はIDで検索（クロスパーティション）
+    items = [item async for item in container.query_items(
+        query="SELECT * FROM c WHERE c.id = @id",
+        parameters=[{"name": "@id", "value": record_id}]
+    )]
+    if not items:
+        raise exceptions.CosmosResourceNotFoundError(message=f"Record not found: {record_id}")
+    return items[0]
+
+
+async def read_record(record_id: str, timer_id: Optional[str] = None) -> dict:
+    """
+    記録を1件取得
+
+    Raises:
+        exceptions.CosmosResourceNotFoundError: 記録が存在しない場合
+    """
+    if RECORDS_PARTITION_MODE == LEGACY:
+        return await _legacy_container().read_item(item=record_id, partition_key=record_id)
+    try:
+        return await _read_partitioned(record_id, timer_id)
+    except exceptions.CosmosResourceNotFoundError:
+        if RECORDS_PARTITION_MODE == PARTITIONED:
+            raise
+    # まだコピーされていない記録は移行元から読む
+    return await _legacy_container().read_item(item=record_id, partition_key=record_id)
+
+
+async def create_record(record: dict) -> dict:
+    """記録を作成"""
+    created = None
+    if _writes_legacy():
+        created = await _legacy_container().create_item(body=record)
+    if _writes_partitioned():
+        if created is None:
+            created = await _partitioned_container().create_item(body=record)
+        else:
+            await _partitioned_container().upsert_item(body=_strip_system_fields(created))
+    _mark_written()
+    return created
+
+
+async def replace_record(record: dict) -> dict:
+    """記録を更新"""
+    body = _strip_system_fields(record)
+    replaced = None
+    if _writes_legacy():
+        replaced = await _legacy_container().replace_item(item=body["id"], body=body)
+    if _writes_partitioned():
+        container = _partitioned_container()
+        if replaced is None:
+            replaced = await container.replace_item(item=body["id"], body=body)
+        else:
+            # 移行中はコピー前の記録もあるためupsertで書き込む
+            await container.upsert_item(body=body)
+    _mark_written()
+    return replaced
+
+
+async def delete_record(record: dict):
+    """記録を削除（パーティションキーを得るため記録ドキュメントを渡す）"""
+    record_id = record["id"]
+    if _writes_legacy():
+        await _legacy_container().delete_item(item=record_id, partition_key=record_id)
+    if _writes_partitioned():
+        try:
+            await _partitioned_container().delete_item(item=record_id, partition_key=record.get("timerId"))
+        except exceptions.CosmosResourceNotFoundError:
+            if RECORDS_PARTITION_MODE == PARTITIONED:
+                raise
+    _mark_deleted(record_id)
+
+
+def _mark_deleted(record_id: str):
+    """削除を記録してから書き込み回数を増やす（回数だけが増えて削除を取りこぼす瞬間をなくす）"""
+    global _deleted_log_evicted
+    if len(_deleted_log) == _deleted_log.maxlen:
+        _deleted_log_evicted = _deleted_log[0][0]
+    _deleted_log.append((_write_generation + 1, record_id))
+    _mark_written()
+
+
+async def _create_one(index: int, record: dict) -> dict:
+    if RECORDS_PARTITION_MODE == DUAL:
+        return await _create_one_dual(index, record)
+    try:
+        created = await create_record(record)
+        return {"index": index, "id": record["id"], "status": "created", "record": created}
+    except exceptions.CosmosHttpResponseError as e:
+        return {"index": index, "id": record["id"], "status": "failed", "error": e.message}
+
+
+async def _create_one_dual(index: int, record: dict) -> dict:
+    """
+    移行中（dual）の1件の作成
+
+    移行元（records）への作成が成功していれば記録は存在するため、移行先への書き込みだけが
+    失敗した場合も created として返す（failed にするとクライアントの再送が 409 になる）。
+    移行先に足りない記録は移行スクリプト（repartition_records.py）のコピーで補われる
+    """
+    try:
+        created = await _legacy_container().create_item(body=record)
+    except exceptions.CosmosHttpResponseError as e:
+        return {"index": index, "id": record["id"], "status": "failed", "error": e.message}
+    result = {"index": index, "id": record["id"], "status": "created", "record": created}
+    try:
+        await _partitioned_container().upsert_item(body=_strip_system_fields(created))
+    except exceptions.CosmosHttpResponseError as e:
+        print(f"Warning: Failed to copy record {record['id']} to {RECORDS_BY_TIMER_CONTAINER}: {e.message}")
+        result["warning"] = f"Created, but not copied to {RECORDS_BY_TIMER_CONTAINER}: {e.message}"
+    _mark_written()
+    return result
+
+
+async def _create_batch(chunk: List[tuple]) -> List[dict]:
+    """
+    同じtimerIdの記録をトランザクションバッチで作成
+
+    バッチはすべて成功するかすべて失敗するため、失敗した場合は
+    どの記録が原因かを返せるよう1件ずつの書き込みにやり直す
+    """
+    timer_id = chunk[0][1]["timerId"]
+    operations = [("create", (record,)) for _, record in chunk]
+    try:
+        responses = await _partitioned_container().execute_item_batch(
+            batch_operations=operations,
+            partition_key=timer_id
+        )
+        _mark_written()
+        return [
+            {"index": index, "id": record["id"], "status": "created", "record": response.get("resourceBody", record)}
+            for (index, record), response in zip(chunk, responses)
+        ]
+    except (exceptions.CosmosBatchOperationError, exceptions.CosmosHttpResponseError):
+        # バッチ内の失敗だけでなく、スロットリング（429）や一時的な障害（503）でも
+        # 1件ずつやり直し、記録ごとの結果を返す
+        return [await _create_one(index, record) for index, record in chunk]
+
+
+async def create_records(records: List[dict]) -> List[dict]:
+    """
+    記録を一括作成
+
+    パーティション移行後は同じtimerIdの記録をトランザクションバッチにまとめ、
+    それ以外（記録ごとに別パーティション）は上限付きの並列書き込みで作成する
+
+    Returns:
+        入力順の結果 [{"index", "id", "status": "created" | "failed", "record" | "error"}, ...]
+        （移行中に移行先へのコピーだけが失敗した記録は created に "warning" が付く）
+    """
+    indexed = list(enumerate(records))
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    if RECORDS_PARTITION_MODE == PARTITIONED:
+        indexed.sort(key=lambda item: item[1]["timerId"])
+        chunks = []
+        for _, group in groupby(indexed, key=lambda item: item[1]["timerId"]):
+            group = list(group)
+            for start in range(0, len(group), MAX_BATCH_OPERATIONS):
+                chunks.append(group[start:start + MAX_BATCH_OPERATIONS])
+        batch_results = await asyncio.gather(
+            *(limited(_create_batch(chunk)) for chunk in chunks),
+            return_exceptions=True
+        )
+        # 予期しない例外で終わったバッチも、他のバッチの結果は返す（そのバッチの記録は failed）
+        results = []
+        for chunk, batch in zip(chunks, batch_results):
+            if isinstance(batch, Exception):
+                results.extend(
+                    {"index": index, "id": record["id"], "status": "failed", "error": str(batch)}
+                    for index, record in chunk
+                )
+            else:
+                results.extend(batch)
+    else:
+        results = list(await asyncio.gather(*(limited(_create_one(index, record)) for index, record in indexed)))
+    results.sort(key=lambda result: result["index"])
+    return results
+
+
+def _strip_system_fields(record: dict) -> dict:
+    """Cosmos DBのシステム項目（_rid, _etagなど）を除いたコピー"""
+    return {k: v for k, v in record.items() if not k.startswith("_")}
@@ -0,0 +1,166 @@
+"""
+recordsコンテナを /timerId パーティションのコンテナへコピーするスクリプト
+
+移行元の変更フィードをパーティションキー範囲ごとに読み、移行先へupsertする。
+読み終えた位置はチェックポイントファイルに保存するため、中断しても再実行で続きから再開できる。
+アプリを止めずに実行でき（RECORDS_PARTITION_MODE=dual）、--follow で追従し続けることもできる。
+移行手順は records_store.py を参照。
+
+使い方:
+    python repartition_records.py                  # 前回のチェックポイントから最後までコピー
+    python repartition_records.py --follow         # コピー後も変更を追従し続ける
+    python repartition_records.py --verify         # 件数とIDを突き合わせて差分を修正
+    python repartition_records.py --source pomodoro_sessions --target pomodoro_sessions_by_timer
+"""
+import argparse
+import json
+import os
+import time
+from dotenv import load_dotenv
+from azure.cosmos import CosmosClient, PartitionKey, exceptions
+import change_feed
+
+# 環境変数読み込み
+load_dotenv()
+
+# 1回の変更フィード読み取りで取得する件数
+PAGE_SIZE = 500
+
+# --follow 時のポーリング間隔（秒）
+POLL_INTERVAL = 5
+
+
+def get_containers(source_name: str, target_name: str, partition_key_path: str):
+    """移行元・移行先のコンテナを取得（移行先は存在しなければ作成）"""
+    endpoint = os.getenv("COSMOS_ENDPOINT")
+    key = os.getenv("COSMOS_KEY")
+    database_name = os.getenv("COSMOS_DATABASE_NAME", "my-app-db")
+
+    client = CosmosClient(endpoint, key)
+    database = client.get_database_client(database_name)
+    source = database.get_container_client(source_name)
+    target = database.create_container_if_not_exists(
+        id=target_name,
+        partition_key=PartitionKey(path=partition_key_path)
+    )
+    return source, target
+
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"ranges": {}, "copied": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    # 書き込み途中で中断してもチェックポイントが壊れないよう一時ファイル経由で置き換える
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def strip_system_fields(item: dict) -> dict:
+    """Cosmos DBのシステム項目（_rid, _etagなど）を除いたコピー"""
+    return {k: v for k, v in item.items() if not k.startswith("_")}
+
+
+def copy_changes(source, target, checkpoint: dict, checkpoint_path: str) -> int:
+    """
+    変更フィードを現在位置まで読み、移行先にupsertする
+
+    Returns:
+        今回コピーした件数
+    """
+    copied = 0
+    for range_id, items, continuation in change_feed.read_changes(source, checkpoint["ranges"], PAGE_SIZE):
+        for item in items:
+            target.upsert_item(body=strip_system_fields(item))
+        copied += len(items)
+
+        # ページ単位でチェックポイントを保存
+        if continuation:
+            checkpoint["ranges"][range_id] = continuation
+        checkpoint["copied"] = checkpoint.get("copied", 0) + len(items)
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        if items:
+            print(f"  range {range_id}: +{len(items)} (total {checkpoint['copied']})")
+    return copied
+
+
+def verify(source, target, partition_key_field: str) -> dict:
+    """
+    移行元と移行先のIDを突き合わせ、不足分をコピーし余分を削除する
+
+    コピー中にアプリから削除された記録は変更フィードに現れないため、
+    切り替え前にこの検証で移行先から取り除く
+    """
+    source_ids = {
+        item["id"] for item in source.query_items(
+            query="SELECT c.id FROM c",
+            enable_cross_partition_query=True
+        )
+    }
+    target_items = {
+        item["id"]: item.get("pk") for item in target.query_items(
+            query=f"SELECT c.id, c.{partition_key_field} AS pk FROM c",
+            enable_cross_partition_query=True
+        )
+    }
+
+    missing = source_ids - set(target_items)
+    extra = set(target_items) - source_ids
+
+    for record_id in missing:
+        item = source.read_item(item=record_id, partition_key=record_id)
+        target.upsert_item(body=strip_system_fields(item))
+    for record_id in extra:
+        try:
+            target.delete_item(item=record_id, partition_key=target_items[record_id])
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+
+    return {"source": len(source_ids), "target": len(target_items), "copied": len(missing), "deleted": len(extra)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recordsコンテナを別のパーティションキーのコンテナへコピー")
+    parser.add_argument("--source", default="records", help="移行元コンテナ")
+    parser.add_argument("--target", default="records_by_timer", help="移行先コンテナ")
+    parser.add_argument("--partition-key", default="/timerId", help="移行先のパーティションキーのパス")
+    parser.add_argument("--checkpoint", default=None, help="チェックポイントファイル（デフォルト: repartition_<target>.json）")
+    parser.add_argument("--follow", action="store_true", help="コピー後も変更を追従し続ける")
+    parser.add_argument("--verify", action="store_true", help="IDを突き合わせて差分を修正する")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or f"repartition_{args.target}.json"
+    source, target = get_containers(args.source, args.target, args.partition_key)
+
+    print(f"=== {args.source} → {args.target} ({args.partition_key}) ===\n")
+
+    if args.verify:
+        result = verify(source, target, args.partition_key.lstrip("/"))
+        print(f"移行元: {result['source']}件 / 移行先: {result['target']}件")
+        print(f"不足分をコピー: {result['copied']}件 / 余分を削除: {result['deleted']}件")
+        return
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    copied = copy_changes(source, target, checkpoint, checkpoint_path)
+    print(f"\nCopied {copied} items (checkpoint: {checkpoint_path})")
+
+    if args.follow:
+        print("変更を追従しています（Ctrl+Cで終了）...")
+        try:
+            while True:
+                time.sleep(POLL_INTERVAL)
+                copy_changes(source, target, checkpoint, checkpoint_path)
+        except KeyboardInterrupt:
+            print("\n追従を終了しました")
+
+    print("=== コピー完了 ===")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+記録のロールアップ（事前集計）
+日別 × タイマー × タグ のバケットごとに件数と合計時間を保持し、
+統計サマリーを記録数ではなくバケット数に比例するコストで返す
+"""
+import asyncio
+import hashlib
+from typing import Dict, List, Optional
+from azure.cosmos import exceptions
+from database import RECORD_ROLLUPS_CONTAINER
+from storage import get_container
+import records_store
+
+# タグ未設定の記録を集計する際の表示名
+UNTAGGED_LABEL = "タグなし"
+
+# バケット作成の競合時の再試行回数
+MAX_RETRIES = 3
+
+
+def bucket_id(date: str, timer_id: str, tag: Optional[str]) -> str:
+    """
+    バケットのIDを生成
+
+    タグやタイマーIDにはCosmos DBのIDに使えない文字が含まれうるため、
+    日付以外の部分はハッシュ化する
+    """
+    key = f"{timer_id}\x1f{tag or ''}".encode("utf-8")
+    return f"rollup-{date}-{hashlib.sha1(key).hexdigest()[:16]}"
+
+
+def bucket_key(record: dict) -> str:
+    """記録が属するバケットのIDを返す"""
+    return bucket_id(record.get("date", ""), record.get("timerId", ""), record.get("tag"))
+
+
+def _new_bucket(record: dict) -> dict:
+    return {
+        "id": bucket_key(record),
+        "date": record.get("date", ""),
+        "timerId": record.get("timerId"),
+        "timerName": record.get("timerName"),
+        "tag": record.get("tag"),
+        "recordCount": 0,
+        "totalDuration": 0
+    }
+
+
+async def _apply_delta(bucket: dict):
+    """
+    バケットに件数と合計時間の増分を反映
+
+    Args:
+        bucket: 対象バケット（recordCount / totalDuration に増分を入れたもの）
+    """
+    container = get_container(RECORD_ROLLUPS_CONTAINER)
+    rollup_id = bucket["id"]
+    operations = [
+        {"op": "incr", "path": "/recordCount", "value": bucket["recordCount"]},
+        {"op": "incr", "path": "/totalDuration", "value": bucket["totalDuration"]}
+    ]
+    if bucket["recordCount"] > 0 and bucket.get("timerName"):
+        operations.append({"op": "set", "path": "/timerName", "value": bucket["timerName"]})
+
+    for _ in range(MAX_RETRIES):
+        try:
+            # incrはサーバー側でアトミックに適用されるため、同時書き込みでも件数がずれない
+            await container.patch_item(item=rollup_id, partition_key=rollup_id, patch_operations=operations)
+            return
+        except exceptions.CosmosResourceNotFoundError:
+            if bucket["recordCount"] < 0:
+                # 存在しないバケットからの減算は無視（再構築前のデータ）
+                return
+            try:
+                await container.create_item(body=bucket)
+                return
+            except exceptions.CosmosResourceExistsError:
+                # 他のリクエストが先にバケットを作成した場合はpatchからやり直す
+                continue
+    raise RuntimeError(f"Failed to update rollup bucket: {rollup_id}")
+
+
+async def apply_record(record: dict, sign: int = 1):
+    """
+    記録1件分をバケットに反映
+
+    Args:
+        record: 記録ドキュメント
+        sign: 1で加算（作成）、-1で減算（削除）
+    """
+    bucket = _new_bucket(record)
+    bucket["recordCount"] = sign
+    bucket["totalDuration"] = sign * (record.get("duration") or 0)
+    await _apply_delta(bucket)
+
+
+async def apply_record_safely(record: dict, sign: int = 1):
+    """
+    ロールアップ更新（失敗しても記録の書き込み自体は成功として扱う）
+
+    ずれた集計は init_rollups.py で再構築できる
+    """
+    try:
+        await apply_record(record, sign)
+    except Exception as e:
+        print(f"Warning: Failed to update record rollup: {e}")
+
+
+async def apply_records_safely(records: List[dict]):
+    """
+    複数の記録をバケットごとにまとめて反映（一括作成用）
+
+    記録数ではなくバケット数のパッチで済む（バケットごとに並列に反映する）
+    """
+    results = await asyncio.gather(
+        *(_apply_delta(bucket) for bucket in build_buckets(records)),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Warning: Failed to update record rollup: {result}")
+
+
+async def replace_record(old_record: dict, new_record: dict):
+    """記録の更新をバケットに反映（集計に影響する項目が変わった場合のみ）"""
+    if (bucket_key(old_record) == bucket_key(new_record)
+            and (old_record.get("duration") or 0) == (new_record.get("duration") or 0)):
+        return
+    await apply_record_safely(old_record, -1)
+    await apply_record_safely(new_record, 1)
+
+
+async def get_summary(timer_id: Optional[str] = None, tag: Optional[str] = None) -> Dict:
+    """
+    ロールアップから統計サマリーを計算
+
+    Returns:
+        /api/records/stats/summary と同じ形式の辞書
+    """
+    container = get_container(RECORD_ROLLUPS_CONTAINER)
+    query = "SELECT * FROM c"
+    conditions = ["c.recordCount > 0"]
+    parameters = []
+
+    if timer_id:
+        conditions.append("c.timerId = @timerId")
+        parameters.append({"name": "@timerId", "value": timer_id})
+    if tag:
+        conditions.append("c.tag = @tag")
+        parameters.append({"name": "@tag", "value": tag})
+
+    query += " WHERE " + " AND ".join(conditions)
+
+    buckets = [bucket async for bucket in container.query_items(
+        query=query,
+        parameters=parameters
+    )]
+    return summarize_buckets(buckets)
+
+
+def summarize_buckets(buckets) -> Dict:
+    """バケットの一覧をタイマー別・タグ別に集計"""
+    total_count = 0
+    total_duration = 0
+    timer_stats = {}
+    timer_name_dates = {}
+    tag_stats = {}
+
+    for bucket in buckets:
+        count = bucket.get("recordCount", 0)
+        duration = bucket.get("totalDuration", 0)
+        total_count += count
+        total_duration += duration
+
+        # タイマーごとの集計（タイマー名は最新日付のバケットのものを採用）
+        timer_id = bucket.get("timerId")
+        if timer_id not in timer_stats:
+            timer_stats[timer_id] = {
+                "timerId": timer_id,
+                "timerName": bucket.get("timerName"),
+                "count": 0,
+                "totalDuration": 0
+            }
+            timer_name_dates[timer_id] = bucket.get("date", "")
+        elif bucket.get("date", "") > timer_name_dates[timer_id]:
+            timer_stats[timer_id]["timerName"] = bucket.get("timerName")
+            timer_name_dates[timer_id] = bucket.get("date", "")
+        timer_stats[timer_id]["count"] += count
+        timer_stats[timer_id]["totalDuration"] += duration
+
+        # タグごとの集計
+        tag_name = bucket.get("tag") or UNTAGGED_LABEL
+        if tag_name not in tag_stats:
+            tag_stats[tag_name] = {
+                "tag": tag_name,
+                "count": 0,
+                "totalDuration": 0
+            }
+        tag_stats[tag_name]["count"] += count
+        tag_stats[tag_name]["totalDuration"] += duration
+
+    return {
+        "totalCount": total_count,
+        "totalDuration": total_duration,
+        "averageDuration": total_duration / total_count if total_count > 0 else 0,
+        "byTimer": list(timer_stats.values()),
+        "byTag": list(tag_stats.values())
+    }
+
+
+def build_buckets(records) -> List[dict]:
+    """記録の一覧からバケットを組み立てる（再構築用）"""
+    buckets = {}
+    for record in records:
+        rollup_id = bucket_key(record)
+        if rollup_id not in buckets:
+            buckets[rollup_id] = _new_bucket(record)
+        bucket = buckets[rollup_id]
+        bucket["recordCount"] += 1
+        bucket["totalDuration"] += record.get("duration") or 0
+        if record.get("timerName"):
+            bucket["timerName"] = record.get("timerName")
+    return list(buckets.values())
+
+
+async def rebuild_rollups() -> Dict:
+    """
+    recordsコンテナの全記録からロールアップを作り直す
+
+    Returns:
+        作成・削除したバケット数
+    """
+    rollups_container = get_container(RECORD_ROLLUPS_CONTAINER)
+
+    records = records_store.query_records("SELECT c.timerId, c.timerName, c.tag, c.date, c.duration FROM c")
+    buckets = build_buckets([record async for record in records])
+    bucket_ids = {b["id"] for b in buckets}
+
+    # 記録が存在しなくなったバケットを削除
+    deleted = 0
+    existing = rollups_container.query_items(query="SELECT c.id FROM c")
+    async for item in existing:
+        if item["id"] not in bucket_ids:
+            await rollups_container.delete_item(item=item["id"], partition_key=item["id"])
+            deleted += 1
+
+    for bucket in buckets:
+        await rollups_container.upsert_item(body=bucket)
+
+    return {"bucketsWritten": len(buckets), "bucketsDeleted": deleted}
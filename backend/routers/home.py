@@ -4,8 +4,10 @@ from typing import Optional, List
 from datetime import datetime, timedelta
 import random
 import os
-import requests
-from database import settings_container
+import httpx
+import http_client
+from database import SETTINGS_CONTAINER
+from storage import get_container
 from azure.cosmos import exceptions as cosmos_exceptions
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
@@ -47,7 +49,7 @@ async def get_weather():
         url = f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current_weather=true&timezone=Asia/Tokyo"
         print(f"[DEBUG] Requesting weather from Open-Meteo (free, no API key)")
         
-        response = requests.get(url, timeout=10)
+        response = await http_client.get(url)
         print(f"[DEBUG] Response status: {response.status_code}")
         response.raise_for_status()
         data = response.json()
@@ -111,7 +113,7 @@ async def get_weather():
             "windSpeed": current_weather["windspeed"]
         }
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"[ERROR] Request exception: {e}")
         return {
             "temperature": None,
@@ -147,7 +149,7 @@ async def get_calendar_events():
     try:
         # 設定からカレンダーURLを取得
         try:
-            settings = settings_container.read_item(item="app-settings", partition_key="app-settings")
+            settings = await get_container(SETTINGS_CONTAINER).read_item(item="app-settings", partition_key="app-settings")
             calendar_url = settings.get("googleCalendarId")
         except cosmos_exceptions.CosmosResourceNotFoundError:
             calendar_url = None
@@ -226,7 +228,7 @@ async def get_calendar_events():
                 return {"events": []}
             
             print(f"[DEBUG] Fetching calendar from: {ical_url}")
-            response = requests.get(ical_url, timeout=10)
+            response = await http_client.get(ical_url)
             
             if response.status_code == 404:
                 print("[WARNING] Calendar not found or not accessible. Returning empty events.")
@@ -292,7 +294,7 @@ async def get_calendar_events():
             print(f"[DEBUG] Found {len(events)} events")
             return {"events": events}
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"[ERROR] Failed to fetch calendar: {e}")
             return {"events": []}
         
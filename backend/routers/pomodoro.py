@@ -6,7 +6,9 @@ from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 import uuid
-from database import get_pomodoro_sessions_container, get_timers_container
+from database import POMODORO_SESSIONS_CONTAINER, TIMERS_CONTAINER
+from storage import get_container
+import aggregations
 
 router = APIRouter()
 
@@ -46,7 +48,7 @@ class PomodoroStats(BaseModel):
 async def create_pomodoro_session(session: PomodoroSessionCreate):
     """ポモドーロセッション開始"""
     try:
-        container = get_pomodoro_sessions_container()
+        container = get_container(POMODORO_SESSIONS_CONTAINER)
         
         new_session = {
             "id": str(uuid.uuid4()),
@@ -61,7 +63,7 @@ async def create_pomodoro_session(session: PomodoroSessionCreate):
             "note": None
         }
         
-        container.create_item(body=new_session)
+        await container.create_item(body=new_session)
         return {"data": new_session}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -74,7 +76,7 @@ async def get_pomodoro_sessions(
 ):
     """ポモドーロセッション一覧取得"""
     try:
-        container = get_pomodoro_sessions_container()
+        container = get_container(POMODORO_SESSIONS_CONTAINER)
         
         # クエリ構築
         query = "SELECT * FROM c WHERE 1=1"
@@ -84,10 +86,7 @@ async def get_pomodoro_sessions(
             query += f" AND c.status = '{status}'"
         query += " ORDER BY c.startedAt DESC"
         
-        sessions = list(container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        sessions = [item async for item in container.query_items(query=query)]
         
         return {"data": sessions[:limit]}
     except Exception as e:
@@ -97,8 +96,8 @@ async def get_pomodoro_sessions(
 async def get_pomodoro_session(session_id: str):
     """ポモドーロセッション詳細取得"""
     try:
-        container = get_pomodoro_sessions_container()
-        session = container.read_item(item=session_id, partition_key=session_id)
+        container = get_container(POMODORO_SESSIONS_CONTAINER)
+        session = await container.read_item(item=session_id, partition_key=session_id)
         return {"data": session}
     except Exception as e:
         if "404" in str(e):
@@ -109,24 +108,26 @@ async def get_pomodoro_session(session_id: str):
 async def update_pomodoro_session(session_id: str, update: PomodoroSessionUpdate):
     """ポモドーロセッション更新"""
     try:
-        container = get_pomodoro_sessions_container()
+        container = get_container(POMODORO_SESSIONS_CONTAINER)
         
-        session = container.read_item(item=session_id, partition_key=session_id)
-        
-        # 更新
-        session["status"] = update.status
+        # 変更する項目だけを送る（読み取りを挟まない）
+        operations = [{"op": "set", "path": "/status", "value": update.status}]
         if update.completedPomodoros is not None:
-            session["completedPomodoros"] = update.completedPomodoros
+            operations.append({"op": "set", "path": "/completedPomodoros", "value": update.completedPomodoros})
         if update.actualDuration is not None:
-            session["actualDuration"] = update.actualDuration
+            operations.append({"op": "set", "path": "/actualDuration", "value": update.actualDuration})
         if update.note is not None:
-            session["note"] = update.note
+            operations.append({"op": "set", "path": "/note", "value": update.note})
         
         # 完了時刻を記録
         if update.status in ["completed", "interrupted"]:
-            session["completedAt"] = datetime.utcnow().isoformat()
+            operations.append({"op": "set", "path": "/completedAt", "value": datetime.utcnow().isoformat()})
         
-        container.replace_item(item=session_id, body=session)
+        session = await container.patch_item(
+            item=session_id,
+            partition_key=session_id,
+            patch_operations=operations
+        )
         return {"data": session}
     except Exception as e:
         if "404" in str(e):
@@ -137,8 +138,8 @@ async def update_pomodoro_session(session_id: str, update: PomodoroSessionUpdate
 async def delete_pomodoro_session(session_id: str):
     """ポモドーロセッション削除"""
     try:
-        container = get_pomodoro_sessions_container()
-        container.delete_item(item=session_id, partition_key=session_id)
+        container = get_container(POMODORO_SESSIONS_CONTAINER)
+        await container.delete_item(item=session_id, partition_key=session_id)
         return {"message": "Session deleted successfully"}
     except Exception as e:
         if "404" in str(e):
@@ -147,21 +148,18 @@ async def delete_pomodoro_session(session_id: str):
 
 @router.get("/stats")
 async def get_pomodoro_stats(timerId: Optional[str] = None):
-    """ポモドーロ統計取得"""
+    """ポモドーロ統計取得（Cosmos DB側で集計）"""
     try:
-        container = get_pomodoro_sessions_container()
+        container = get_container(POMODORO_SESSIONS_CONTAINER)
         
-        # 全セッション取得
-        query = "SELECT * FROM c WHERE c.status = 'completed'"
+        # 完了セッションのみ対象
+        conditions = ["c.status = 'completed'"]
+        parameters = []
         if timerId:
-            query += f" AND c.timerId = '{timerId}'"
+            conditions.append("c.timerId = @timerId")
+            parameters.append({"name": "@timerId", "value": timerId})
         
-        sessions = list(container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
-        
-        # 統計計算
+        # 期間の開始時刻（startedAtはUTCのISO形式文字列なので文字列比較できる）
         from datetime import timedelta
         now = datetime.utcnow()
         today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -169,48 +167,49 @@ async def get_pomodoro_stats(timerId: Optional[str] = None):
         week_start = week_start.replace(hour=0, minute=0, second=0, microsecond=0)
         month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
-        total_pomodoros = sum(s.get("completedPomodoros", 0) for s in sessions)
-        total_duration = sum(s.get("actualDuration", 0) for s in sessions) // 60  # 分に変換
-        
-        today_pomodoros = sum(
-            s.get("completedPomodoros", 0) 
-            for s in sessions 
-            if datetime.fromisoformat(s["startedAt"]) >= today_start
-        )
-        
-        week_pomodoros = sum(
-            s.get("completedPomodoros", 0) 
-            for s in sessions 
-            if datetime.fromisoformat(s["startedAt"]) >= week_start
-        )
-        
-        month_pomodoros = sum(
-            s.get("completedPomodoros", 0) 
-            for s in sessions 
-            if datetime.fromisoformat(s["startedAt"]) >= month_start
-        )
+        def since(start: datetime):
+            return (
+                conditions + ["c.startedAt >= @since"],
+                parameters + [{"name": "@since", "value": start.isoformat()}]
+            )
+        
+        pomodoros = {"pomodoros": ("SUM", "completedPomodoros")}
+        totals = await aggregations.aggregate_many(container, {
+            "all": (
+                {"pomodoros": ("SUM", "completedPomodoros"), "duration": ("SUM", "actualDuration")},
+                conditions,
+                parameters
+            ),
+            "today": (pomodoros, *since(today_start)),
+            "week": (pomodoros, *since(week_start)),
+            "month": (pomodoros, *since(month_start)),
+        })
         
         # 作業内容別集計
-        task_breakdown = {}
-        for s in sessions:
-            task = s.get("taskDescription", "不明")
-            if task not in task_breakdown:
-                task_breakdown[task] = {
-                    "task": task,
-                    "pomodoros": 0,
-                    "duration": 0
-                }
-            task_breakdown[task]["pomodoros"] += s.get("completedPomodoros", 0)
-            task_breakdown[task]["duration"] += s.get("actualDuration", 0) // 60
+        task_rows = await aggregations.aggregate_by(
+            container,
+            "taskDescription",
+            {"pomodoros": ("SUM", "completedPomodoros"), "duration": ("SUM", "actualDuration")},
+            conditions,
+            parameters
+        )
+        task_breakdown = [
+            {
+                "task": row["taskDescription"] or "不明",
+                "pomodoros": row["pomodoros"],
+                "duration": row["duration"] // 60
+            }
+            for row in task_rows
+        ]
         
         return {
             "data": {
-                "totalPomodoros": total_pomodoros,
-                "totalDuration": total_duration,
-                "todayPomodoros": today_pomodoros,
-                "weekPomodoros": week_pomodoros,
-                "monthPomodoros": month_pomodoros,
-                "taskBreakdown": list(task_breakdown.values())
+                "totalPomodoros": totals["all"]["pomodoros"],
+                "totalDuration": totals["all"]["duration"] // 60,  # 分に変換
+                "todayPomodoros": totals["today"]["pomodoros"],
+                "weekPomodoros": totals["week"]["pomodoros"],
+                "monthPomodoros": totals["month"]["pomodoros"],
+                "taskBreakdown": task_breakdown
             }
         }
     except Exception as e:
@@ -220,9 +219,9 @@ async def get_pomodoro_stats(timerId: Optional[str] = None):
 async def create_pomodoro_timer(timer_id: str):
     """既存タイマーをポモドーロモードに設定"""
     try:
-        timers_container = get_timers_container()
+        timers_container = get_container(TIMERS_CONTAINER)
         
-        timer = timers_container.read_item(item=timer_id, partition_key=timer_id)
+        timer = await timers_container.read_item(item=timer_id, partition_key=timer_id)
         timer["isPomodoroMode"] = True
         timer["pomodoroSettings"] = {
             "workDuration": 25,  # 分
@@ -231,7 +230,7 @@ async def create_pomodoro_timer(timer_id: str):
             "sessionsUntilLongBreak": 4
         }
         
-        timers_container.replace_item(item=timer_id, body=timer)
+        await timers_container.replace_item(item=timer_id, body=timer)
         return {"data": timer}
     except Exception as e:
         if "404" in str(e):
@@ -1,16 +1,28 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
+import json
 import uuid
-from database import get_recipes_container, settings_container
-from recipe_scraper import RecipeScraper
+from database import RECIPES_CONTAINER, SETTINGS_CONTAINER
+from storage import get_container
+from recipe_scraper import RecipeScraper, IMPORT_DEADLINE
+from recipe_index import get_recipe_index
+import http_client
+from pagination import encode_cursor, decode_cursor, encode_offset, decode_offset
 # RAG機能は無効化（メモリ制約のため）
 # from recommendation_engine import get_recommendation_engine
 # from vector_store import get_vector_store
 
 router = APIRouter()
 
+# 1ページの件数の上限
+MAX_PAGE_SIZE = 100
+
+# まとめて取り込めるURLの件数の上限
+MAX_IMPORT_URLS = 500
+
 # Pydanticモデル
 class RecipeCreate(BaseModel):
     name: str
@@ -42,62 +54,132 @@ class Recipe(BaseModel):
     timesCooked: int
     createdAt: str
 
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """fields=name,tags を検証して項目名のリストにする（id は常に含める）"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in Recipe.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [name for name in dict.fromkeys(names) if name != "id"]
+
+
+def project(recipe: dict, fields: Optional[List[str]]) -> dict:
+    """インデックスから返すレシピを fields の項目だけにする（SELECT c.a, c.b と同じく、ない項目は含めない）"""
+    if fields is None:
+        return recipe
+    return {name: recipe[name] for name in fields if name in recipe}
+
+
+def build_recipes_query(favorite: Optional[bool], tag: Optional[str], fields: Optional[List[str]]):
+    """
+    レシピ一覧のクエリを組み立てる
+
+    絞り込み・並べ替え・射影をクエリに含め、データベース側で処理させる。
+    createdAt の範囲インデックス（Cosmos DB の既定のインデックス、SQLite は式インデックス）の順に
+    読むため、limit を指定した1ページ目は全件を読まずに返せる
+    """
+    select = ", ".join(f"c.{name}" for name in fields) if fields else "*"
+    query = f"SELECT {select} FROM c"
+    conditions = []
+    parameters = []
+    
+    if favorite is not None:
+        conditions.append("c.isFavorite = @favorite")
+        parameters.append({"name": "@favorite", "value": favorite})
+    if tag:
+        conditions.append("ARRAY_CONTAINS(c.tags, @tag)")
+        parameters.append({"name": "@tag", "value": tag})
+    
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    
+    query += " ORDER BY c.createdAt DESC"
+    return query, parameters
+
+
 @router.get("/")
 async def get_recipes(
     favorite: Optional[bool] = None, 
     tag: Optional[str] = None,
-    search: Optional[str] = None  # 検索キーワード
+    search: Optional[str] = None,  # 検索キーワード
+    sort: str = Query("createdAt", pattern="^(createdAt|relevance)$"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
 ):
-    """レシピ一覧取得（フィルタリング・検索対応）"""
+    """
+    レシピ一覧取得（フィルタリング・検索対応）
+    
+    Parameters:
+    - search: 名前、材料、タグ、手順から検索
+    - sort: createdAt（新しい順、search は部分一致）または relevance（search の関連度順。BM25）
+    - limit: 指定するとページ単位で取得し、続きがあれば nextCursor を返す
+    - cursor: 前のページのレスポンスで返された nextCursor
+    - fields: 返す項目（カンマ区切り。例: name,tags,isFavorite,timesCooked）。id は常に含める
+    """
+    if sort == "relevance" and not search:
+        raise HTTPException(status_code=400, detail="sort=relevance requires search")
+    if cursor and limit is None:
+        raise HTTPException(status_code=400, detail="cursor requires limit")
+    projected_fields = parse_fields(fields)
+    # 検索はインデックスの結果のオフセット、それ以外は継続トークンをカーソルにする
+    offset = decode_offset(cursor) if search else 0
+    continuation_token = None if search else decode_cursor(cursor)
     try:
-        container = get_recipes_container()
-        query = "SELECT * FROM c"
-        recipes = list(container.query_items(query=query, enable_cross_partition_query=True))
-        
-        # フィルタリング
-        if favorite is not None:
-            recipes = [r for r in recipes if r.get("isFavorite") == favorite]
-        
-        if tag:
-            recipes = [r for r in recipes if tag in r.get("tags", [])]
-        
-        # 検索（名前、材料、タグから部分一致）
         if search:
-            search_lower = search.lower()
-            filtered_recipes = []
-            for r in recipes:
-                # 名前での検索
-                if search_lower in r.get("name", "").lower():
-                    filtered_recipes.append(r)
-                    continue
-                
-                # 材料での検索
-                ingredients = r.get("ingredients", [])
-                if any(search_lower in ing.lower() for ing in ingredients):
-                    filtered_recipes.append(r)
-                    continue
-                
-                # タグでの検索
-                tags = r.get("tags", [])
-                if any(search_lower in t.lower() for t in tags):
-                    filtered_recipes.append(r)
-                    continue
-                
-                # 手順での検索
-                steps = r.get("steps", [])
-                if any(search_lower in s.lower() for s in steps):
-                    filtered_recipes.append(r)
-                    continue
-            
-            recipes = filtered_recipes
-        
-        if tag:
-            recipes = [r for r in recipes if tag in r.get("tags", [])]
+            # 転置インデックスで検索（recipe_index.py を参照）。データベースには問い合わせない
+            recipe_index = get_recipe_index()
+            await recipe_index.ensure_built()
+            if sort == "relevance":
+                # 関連度の高い順（絞り込みはスコア計算の後、ヒープに入れる前に行う）
+                recipes = recipe_index.search_ranked(
+                    search,
+                    limit=offset + limit + 1 if limit is not None else None,
+                    accept=lambda r: (favorite is None or r.get("isFavorite") == favorite)
+                    and (not tag or tag in r.get("tags", []))
+                )
+            else:
+                # 名前、材料、タグ、手順から部分一致
+                recipes = [
+                    r for r in recipe_index.search(search)
+                    if (favorite is None or r.get("isFavorite") == favorite)
+                    and (not tag or tag in r.get("tags", []))
+                ]
+                # 作成日時でソート（新しい順）
+                recipes.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
+            next_cursor = None
+            if limit is not None:
+                next_cursor = encode_offset(offset + limit) if len(recipes) > offset + limit else None
+                recipes = recipes[offset:offset + limit]
+            return ORJSONResponse({
+                "data": [project(r, projected_fields) for r in recipes],
+                "nextCursor": next_cursor
+            })
         
-        # 作成日時でソート（新しい順）
-        recipes.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
+        container = get_container(RECIPES_CONTAINER)
+        query, parameters = build_recipes_query(favorite, tag, projected_fields)
+        if limit is None:
+            recipes = [item async for item in container.query_items(query=query, parameters=parameters)]
+            # ドキュメントはJSONの型だけなので jsonable_encoder を通さずに変換する
+            return ORJSONResponse({"data": recipes, "nextCursor": None})
         
-        return {"data": recipes}
+        # 継続トークンを使って1ページ分だけ取得
+        pager = container.query_items(
+            query=query,
+            parameters=parameters,
+            max_item_count=limit
+        ).by_page(continuation_token=continuation_token)
+        try:
+            page = await pager.__anext__()
+        except StopAsyncIteration:
+            return ORJSONResponse({"data": [], "nextCursor": None})
+        recipes = [item async for item in page]
+        return ORJSONResponse({
+            "data": recipes,
+            "nextCursor": encode_cursor(pager.continuation_token)
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -105,7 +187,7 @@ async def get_recipes(
 async def create_recipe(recipe: RecipeCreate):
     """レシピ作成"""
     try:
-        container = get_recipes_container()
+        container = get_container(RECIPES_CONTAINER)
         
         new_recipe = {
             "id": str(uuid.uuid4()),
@@ -120,7 +202,13 @@ async def create_recipe(recipe: RecipeCreate):
             "createdAt": datetime.utcnow().isoformat() + "Z"
         }
         
-        container.create_item(body=new_recipe)
+        await container.create_item(body=new_recipe)
+        
+        # 検索インデックスに追加
+        try:
+            get_recipe_index().add_recipe(new_recipe)
+        except Exception as e:
+            print(f"Warning: Failed to add recipe to search index: {e}")
         
         # RAG機能は無効化（メモリ制約のため）
         # # ベクトルストアに追加
@@ -140,7 +228,7 @@ async def import_recipe(url: str):
     """外部サイトからレシピをスクレイピング"""
     try:
         # URLからレシピ情報を取得
-        recipe_data = RecipeScraper.scrape(url)
+        recipe_data = await RecipeScraper.scrape(url)
         
         if not recipe_data:
             raise HTTPException(status_code=400, detail="レシピ情報を取得できませんでした")
@@ -154,6 +242,44 @@ async def import_recipe(url: str):
         print(f"Import error: {e}")
         raise HTTPException(status_code=500, detail=f"レシピの取り込みに失敗しました: {str(e)}")
 
+class BatchImportRequest(BaseModel):
+    urls: List[str]
+    deadline: Optional[float] = None  # 全体の制限時間（秒）。IMPORT_DEADLINE まで
+
+
+async def iter_import_ndjson(urls: List[str], deadline: float):
+    """取り込みの結果を、URLごとに取得できた順でNDJSON行として生成（最後に件数の行）"""
+    succeeded = 0
+    async for index, url, recipe_data, error in RecipeScraper.scrape_many(urls, deadline):
+        if recipe_data:
+            succeeded += 1
+            line = {"index": index, "url": url, "status": "ok", "data": recipe_data}
+        else:
+            line = {"index": index, "url": url, "status": "error", "error": error}
+        yield (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+    summary = {"done": True, "total": len(urls), "succeeded": succeeded, "failed": len(urls) - succeeded}
+    yield (json.dumps(summary, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@router.post("/import/batch")
+async def import_recipes(request: BatchImportRequest):
+    """
+    複数のURLからまとめてレシピをスクレイピング
+    
+    URLは並行して取得し（同じドメインへの同時取得数は制限する）、1件取得できるたびに
+    {"index", "url", "status": "ok" | "error", "data" | "error"} の行を返す（NDJSON）。
+    最後の行は {"done": true, "total", "succeeded", "failed"}。
+    保存は単体の取り込みと同じくフロントエンドで確認後に行う
+    """
+    urls = [url.strip() for url in request.urls if url.strip()]
+    if not urls:
+        raise HTTPException(status_code=400, detail="URLを指定してください")
+    if len(urls) > MAX_IMPORT_URLS:
+        raise HTTPException(status_code=400, detail=f"一度に取り込めるURLは{MAX_IMPORT_URLS}件までです")
+    deadline = IMPORT_DEADLINE if request.deadline is None else max(0.0, min(request.deadline, IMPORT_DEADLINE))
+    
+    return StreamingResponse(iter_import_ndjson(urls, deadline), media_type="application/x-ndjson")
+
 # AI提案機能
 class SuggestRequest(BaseModel):
     ingredients: List[str]
@@ -163,12 +289,11 @@ async def suggest_recipe(request: SuggestRequest):
     """材料からレシピを提案（AI機能）"""
     try:
         import os
-        from openai import OpenAI
         from azure.cosmos import exceptions as cosmos_exceptions
         
         # 設定からAPIキーを取得
         try:
-            settings = settings_container.read_item(item="app-settings", partition_key="app-settings")
+            settings = await get_container(SETTINGS_CONTAINER).read_item(item="app-settings", partition_key="app-settings")
             api_key = settings.get("openaiApiKey")
         except cosmos_exceptions.CosmosResourceNotFoundError:
             api_key = None
@@ -183,7 +308,7 @@ async def suggest_recipe(request: SuggestRequest):
                 detail="AI機能は現在利用できません（APIキーが設定されていません）"
             )
         
-        client = OpenAI(api_key=api_key)
+        client = http_client.get_openai_client(api_key)
         
         # プロンプト作成
         ingredients_text = "、".join(request.ingredients)
@@ -203,7 +328,7 @@ async def suggest_recipe(request: SuggestRequest):
 JSONのみを返してください。説明文は不要です。"""
 
         # OpenAI API呼び出し
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "あなたは料理のプロフェッショナルです。"},
@@ -294,8 +419,8 @@ JSONのみを返してください。説明文は不要です。"""
 async def get_recipe(recipe_id: str):
     """レシピ詳細取得"""
     try:
-        container = get_recipes_container()
-        recipe = container.read_item(item=recipe_id, partition_key=recipe_id)
+        container = get_container(RECIPES_CONTAINER)
+        recipe = await container.read_item(item=recipe_id, partition_key=recipe_id)
         return {"data": recipe}
     except Exception as e:
         if "404" in str(e):
@@ -306,10 +431,10 @@ async def get_recipe(recipe_id: str):
 async def update_recipe(recipe_id: str, update: RecipeUpdate):
     """レシピ更新"""
     try:
-        container = get_recipes_container()
+        container = get_container(RECIPES_CONTAINER)
         
         # 既存のレシピを取得
-        existing_recipe = container.read_item(item=recipe_id, partition_key=recipe_id)
+        existing_recipe = await container.read_item(item=recipe_id, partition_key=recipe_id)
         
         # 更新
         if update.name is not None:
@@ -327,7 +452,13 @@ async def update_recipe(recipe_id: str, update: RecipeUpdate):
         if update.isFavorite is not None:
             existing_recipe["isFavorite"] = update.isFavorite
         
-        container.replace_item(item=recipe_id, body=existing_recipe)
+        await container.replace_item(item=recipe_id, body=existing_recipe)
+        
+        # 検索インデックスを更新
+        try:
+            get_recipe_index().add_recipe(existing_recipe)
+        except Exception as e:
+            print(f"Warning: Failed to update recipe in search index: {e}")
         
         # RAG機能は無効化（メモリ制約のため）
         # # ベクトルストアを更新
@@ -347,8 +478,14 @@ async def update_recipe(recipe_id: str, update: RecipeUpdate):
 async def delete_recipe(recipe_id: str):
     """レシピ削除"""
     try:
-        container = get_recipes_container()
-        container.delete_item(item=recipe_id, partition_key=recipe_id)
+        container = get_container(RECIPES_CONTAINER)
+        await container.delete_item(item=recipe_id, partition_key=recipe_id)
+        
+        # 検索インデックスから削除
+        try:
+            get_recipe_index().delete_recipe(recipe_id)
+        except Exception as e:
+            print(f"Warning: Failed to delete recipe from search index: {e}")
         
         # RAG機能は無効化（メモリ制約のため）
         # # ベクトルストアから削除
@@ -368,10 +505,15 @@ async def delete_recipe(recipe_id: str):
 async def record_cooking(recipe_id: str):
     """調理記録（回数をインクリメント）"""
     try:
-        container = get_recipes_container()
-        recipe = container.read_item(item=recipe_id, partition_key=recipe_id)
-        recipe["timesCooked"] = recipe.get("timesCooked", 0) + 1
-        container.replace_item(item=recipe_id, body=recipe)
+        container = get_container(RECIPES_CONTAINER)
+        # サーバー側でインクリメントするため、同時に記録しても回数が失われない
+        recipe = await container.patch_item(
+            item=recipe_id,
+            partition_key=recipe_id,
+            patch_operations=[{"op": "incr", "path": "/timesCooked", "value": 1}]
+        )
+        # 検索インデックスが持つレシピのコピーも更新
+        get_recipe_index().add_recipe(recipe)
         return {"data": recipe}
     except Exception as e:
         if "404" in str(e):
@@ -383,10 +525,14 @@ async def record_cooking(recipe_id: str):
 async def toggle_favorite(recipe_id: str, is_favorite: bool):
     """お気に入り切り替え"""
     try:
-        container = get_recipes_container()
-        recipe = container.read_item(item=recipe_id, partition_key=recipe_id)
-        recipe["isFavorite"] = is_favorite
-        container.replace_item(item=recipe_id, body=recipe)
+        container = get_container(RECIPES_CONTAINER)
+        recipe = await container.patch_item(
+            item=recipe_id,
+            partition_key=recipe_id,
+            patch_operations=[{"op": "set", "path": "/isFavorite", "value": is_favorite}]
+        )
+        # 検索インデックスが持つレシピのコピーも更新
+        get_recipe_index().add_recipe(recipe)
         return {"data": recipe}
     except Exception as e:
         if "404" in str(e):
@@ -2,12 +2,23 @@
 Records router - 全体の記録を管理するAPI
 """
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import time
-from database import records_container
+import uuid
+import csv
+import io
+import json
+import records_store
+from pagination import encode_cursor, decode_cursor
 from azure.cosmos import exceptions
+import rollups
+import record_analytics
+import records_cache
 
 router = APIRouter(prefix="/api/records", tags=["records"])
 
@@ -34,6 +45,10 @@ class ManualRecordCreate(BaseModel):
     comment: Optional[str] = None
 
 
+class BulkRecordCreate(BaseModel):
+    records: List[RecordCreate]
+
+
 class Record(BaseModel):
     id: str
     timerId: str
@@ -55,12 +70,66 @@ class RecordUpdate(BaseModel):
     comment: Optional[str] = None
 
 
+# ページサイズの上限
+MAX_PAGE_SIZE = 1000
+
+# 一括作成で1リクエストに含められる記録数の上限
+MAX_BULK_RECORDS = 5000
+
+# エクスポート時に1回のラウンドトリップで読む件数
+EXPORT_PAGE_SIZE = 500
+
+# エクスポートする項目（Cosmos DBのシステム項目は含めない）
+EXPORT_FIELDS = ["id", "timerId", "timerName", "startTime", "endTime", "duration", "date", "tag", "stamp", "comment"]
+
+
+def build_records_query(
+    timer_id: Optional[str] = None,
+    tag: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    fields: str = "*",
+    ordered: bool = True
+):
+    """
+    記録検索クエリを構築
+    
+    Returns:
+        (クエリ文字列, パラメータのリスト)
+    """
+    query = f"SELECT {fields} FROM c"
+    conditions = []
+    parameters = []
+    
+    if timer_id:
+        conditions.append("c.timerId = @timerId")
+        parameters.append({"name": "@timerId", "value": timer_id})
+    if tag:
+        conditions.append("c.tag = @tag")
+        parameters.append({"name": "@tag", "value": tag})
+    if start_date:
+        conditions.append("c.date >= @startDate")
+        parameters.append({"name": "@startDate", "value": start_date})
+    if end_date:
+        conditions.append("c.date <= @endDate")
+        parameters.append({"name": "@endDate", "value": end_date})
+    
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    
+    if ordered:
+        query += " ORDER BY c.startTime DESC"
+    return query, parameters
+
+
 @router.get("/")
 async def get_all_records(
     timer_id: Optional[str] = Query(None, alias="timerId"),
     tag: Optional[str] = None,
     start_date: Optional[str] = Query(None, alias="startDate"),
-    end_date: Optional[str] = Query(None, alias="endDate")
+    end_date: Optional[str] = Query(None, alias="endDate"),
+    page_size: Optional[int] = Query(None, alias="pageSize", ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
 ):
     """
     全記録を取得（フィルタリング可能）
@@ -70,44 +139,117 @@ async def get_all_records(
     - tag: 特定のタグの記録のみ取得
     - start_date: 開始日（YYYY-MM-DD）
     - end_date: 終了日（YYYY-MM-DD）
+    - page_size: 指定するとページ単位で取得し {"data": [...], "nextCursor": ...} を返す
+    - cursor: 前のページのレスポンスで返された nextCursor
     """
     try:
-        # クエリの構築
-        query = "SELECT * FROM c"
-        conditions = []
-        
-        if timer_id:
-            conditions.append(f"c.timerId = '{timer_id}'")
-        if tag:
-            conditions.append(f"c.tag = '{tag}'")
-        if start_date:
-            conditions.append(f"c.date >= '{start_date}'")
-        if end_date:
-            conditions.append(f"c.date <= '{end_date}'")
-        
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
+        query, parameters = build_records_query(timer_id, tag, start_date, end_date)
         
-        query += " ORDER BY c.startTime DESC"
+        if page_size is None:
+            if cursor:
+                raise HTTPException(status_code=400, detail="cursor requires pageSize")
+            records = [record async for record in records_store.query_records(query, parameters, timer_id=timer_id)]
+            # ドキュメントはJSONの型だけなので jsonable_encoder を通さずに変換する
+            return ORJSONResponse(records)
         
-        records = list(records_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        # 継続トークンを使って1ページ分だけ取得
+        pager = records_store.query_records(
+            query,
+            parameters,
+            timer_id=timer_id,
+            max_item_count=page_size
+        ).by_page(continuation_token=decode_cursor(cursor))
+        try:
+            page = await pager.__anext__()
+        except StopAsyncIteration:
+            return {"data": [], "nextCursor": None}
+        records = [record async for record in page]
         
-        return records
+        return ORJSONResponse({
+            "data": records,
+            "nextCursor": encode_cursor(pager.continuation_token)
+        })
     
     except exceptions.CosmosHttpResponseError as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch records: {str(e)}")
 
 
+async def iter_export_ndjson(pages):
+    """ページごとにNDJSON行を生成"""
+    async for page in pages:
+        chunk = "".join([
+            json.dumps({field: record.get(field) for field in EXPORT_FIELDS}, ensure_ascii=False) + "\n"
+            async for record in page
+        ])
+        if chunk:
+            yield chunk.encode("utf-8")
+
+
+async def iter_export_csv(pages):
+    """ヘッダー行の後、ページごとにCSV行を生成"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # Excelで文字化けしないようBOM付きで出力
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue().encode("utf-8")
+    
+    async for page in pages:
+        buffer.seek(0)
+        buffer.truncate(0)
+        async for record in page:
+            writer.writerow(["" if record.get(field) is None else record.get(field) for field in EXPORT_FIELDS])
+        chunk = buffer.getvalue()
+        if chunk:
+            yield chunk.encode("utf-8")
+
+
+@router.get("/export")
+async def export_records(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    timer_id: Optional[str] = Query(None, alias="timerId"),
+    tag: Optional[str] = None,
+    start_date: Optional[str] = Query(None, alias="startDate"),
+    end_date: Optional[str] = Query(None, alias="endDate")
+):
+    """
+    記録をNDJSONまたはCSVでストリーミングエクスポート
+    
+    Cosmos DBからページ単位で読みながら送信するため、
+    記録数に関わらずメモリ使用量は一定で、最初のページから送信が始まる
+    """
+    query, parameters = build_records_query(timer_id, tag, start_date, end_date, fields=", ".join(f"c.{f}" for f in EXPORT_FIELDS))
+    pages = records_store.query_records(
+        query,
+        parameters,
+        timer_id=timer_id,
+        max_item_count=EXPORT_PAGE_SIZE
+    ).by_page()
+    
+    filename = f"records-{datetime.now().strftime('%Y%m%d')}.{format}"
+    if format == "csv":
+        body = iter_export_csv(pages)
+        media_type = "text/csv; charset=utf-8"
+    else:
+        body = iter_export_ndjson(pages)
+        media_type = "application/x-ndjson"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @router.get("/{record_id}")
-async def get_record(record_id: str):
+async def get_record(record_id: str, timer_id: Optional[str] = Query(None, alias="timerId")):
     """
     特定の記録を取得
+    
+    timerIdを指定するとパーティション移行後も1回のポイント読み取りで取得できる
     """
     try:
-        record = records_container.read_item(item=record_id, partition_key=record_id)
+        record = await records_store.read_record(record_id, timer_id)
         return record
     except exceptions.CosmosResourceNotFoundError:
         raise HTTPException(status_code=404, detail="Record not found")
@@ -137,13 +279,58 @@ async def create_record(record: RecordCreate):
             "comment": record.comment
         }
         
-        created_record = records_container.create_item(body=new_record)
+        created_record = await records_store.create_record(new_record)
+        await rollups.apply_record_safely(created_record)
         return created_record
     
     except exceptions.CosmosHttpResponseError as e:
         raise HTTPException(status_code=500, detail=f"Failed to create record: {str(e)}")
 
 
+@router.post("/bulk")
+async def create_records_bulk(request: BulkRecordCreate):
+    """
+    記録を一括作成（他アプリからの取り込みなど）
+    
+    並列書き込み（パーティション移行後はtimerIdごとのトランザクションバッチ）で作成し、
+    記録ごとの結果を入力順に返す
+    """
+    if len(request.records) > MAX_BULK_RECORDS:
+        raise HTTPException(status_code=400, detail=f"一度に登録できる記録は{MAX_BULK_RECORDS}件までです")
+    
+    # 同じミリ秒に大量に作成するため、タイムスタンプにランダムな接尾辞を付けて一意にする
+    timestamp = int(time.time() * 1000)
+    new_records = [
+        {
+            "id": f"record-{timestamp}-{uuid.uuid4().hex[:8]}",
+            "timerId": record.timerId,
+            "timerName": record.timerName,
+            "startTime": record.startTime,
+            "endTime": record.endTime,
+            "duration": record.duration,
+            "date": record.date,
+            "tag": record.tag,
+            "stamp": record.stamp,
+            "comment": record.comment
+        }
+        for record in request.records
+    ]
+    
+    results = await records_store.create_records(new_records)
+    
+    created_records = [result["record"] for result in results if result["status"] == "created"]
+    await rollups.apply_records_safely(created_records)
+    
+    return {
+        "created": len(created_records),
+        "failed": len(results) - len(created_records),
+        "results": [
+            {key: value for key, value in result.items() if key != "record"}
+            for result in results
+        ]
+    }
+
+
 @router.post("/manual")
 async def create_manual_record(record: ManualRecordCreate):
     """
@@ -176,7 +363,8 @@ async def create_manual_record(record: ManualRecordCreate):
             "comment": record.comment
         }
         
-        created_record = records_container.create_item(body=new_record)
+        created_record = await records_store.create_record(new_record)
+        await rollups.apply_record_safely(created_record)
         return created_record
     
     except exceptions.CosmosHttpResponseError as e:
@@ -184,13 +372,14 @@ async def create_manual_record(record: ManualRecordCreate):
 
 
 @router.put("/{record_id}")
-async def update_record(record_id: str, update: RecordUpdate):
+async def update_record(record_id: str, update: RecordUpdate, timer_id: Optional[str] = Query(None, alias="timerId")):
     """
     記録を更新（時間、日付、タグ）
     """
     try:
         # 既存の記録を取得
-        existing_record = records_container.read_item(item=record_id, partition_key=record_id)
+        existing_record = await records_store.read_record(record_id, timer_id)
+        old_record = dict(existing_record)
         
         # 更新可能なフィールドを変更
         if update.duration is not None:
@@ -223,7 +412,8 @@ async def update_record(record_id: str, update: RecordUpdate):
             existing_record["comment"] = update.comment if update.comment else None
         
         # 更新を保存
-        updated_record = records_container.replace_item(item=record_id, body=existing_record)
+        updated_record = await records_store.replace_record(existing_record)
+        await rollups.replace_record(old_record, updated_record)
         return updated_record
         
     except exceptions.CosmosResourceNotFoundError:
@@ -233,12 +423,15 @@ async def update_record(record_id: str, update: RecordUpdate):
 
 
 @router.delete("/{record_id}")
-async def delete_record(record_id: str):
+async def delete_record(record_id: str, timer_id: Optional[str] = Query(None, alias="timerId")):
     """
     記録を削除
     """
     try:
-        records_container.delete_item(item=record_id, partition_key=record_id)
+        # ロールアップからの減算とパーティションキーの特定のため削除前に取得
+        existing_record = await records_store.read_record(record_id, timer_id)
+        await records_store.delete_record(existing_record)
+        await rollups.apply_record_safely(existing_record, -1)
         return {"message": "Record deleted successfully"}
     except exceptions.CosmosResourceNotFoundError:
         raise HTTPException(status_code=404, detail="Record not found")
@@ -253,64 +446,80 @@ async def get_records_summary(
 ):
     """
     記録の統計サマリーを取得
+    
+    日別×タイマー×タグのロールアップから集計するため、
+    コストは記録数ではなくバケット数に比例する
     """
     try:
-        # フィルタ条件
-        query = "SELECT * FROM c"
-        conditions = []
-        
-        if timer_id:
-            conditions.append(f"c.timerId = '{timer_id}'")
-        if tag:
-            conditions.append(f"c.tag = '{tag}'")
-        
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        records = list(records_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
-        
-        # 統計計算
-        total_count = len(records)
-        total_duration = sum(r.get("duration", 0) for r in records)
-        average_duration = total_duration / total_count if total_count > 0 else 0
-        
-        # タイマーごとの集計
-        timer_stats = {}
-        for record in records:
-            timer_id = record.get("timerId")
-            if timer_id not in timer_stats:
-                timer_stats[timer_id] = {
-                    "timerId": timer_id,
-                    "timerName": record.get("timerName"),
-                    "count": 0,
-                    "totalDuration": 0
-                }
-            timer_stats[timer_id]["count"] += 1
-            timer_stats[timer_id]["totalDuration"] += record.get("duration", 0)
+        return await rollups.get_summary(timer_id=timer_id, tag=tag)
+    
+    except exceptions.CosmosHttpResponseError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch summary: {str(e)}")
+
+
+@router.get("/stats/heatmap")
+async def get_records_heatmap(
+    timer_id: Optional[str] = Query(None, alias="timerId"),
+    tag: Optional[str] = None,
+    start_date: Optional[str] = Query(None, alias="startDate"),
+    end_date: Optional[str] = Query(None, alias="endDate"),
+    tz: str = record_analytics.DEFAULT_TIMEZONE
+):
+    """
+    曜日×時間帯のヒートマップと日別合計を取得
+    
+    時間帯をまたぐ記録は時間帯ごとに分割して集計する。
+    グラフ描画用に、生の記録ではなく集計済みの値だけを返す。
+    デフォルトのタイムゾーンではローカルの列指向キャッシュから計算する
+    """
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid timezone")
+    
+    try:
+        if tz == record_analytics.DEFAULT_TIMEZONE:
+            try:
+                cache = await run_in_threadpool(records_cache.get_synced_records_cache)
+                return cache.heatmap(timer_id=timer_id, tag=tag, start_date=start_date, end_date=end_date)
+            except OSError as e:
+                print(f"Warning: Records cache unavailable, querying Cosmos DB: {e}")
         
-        # タグごとの集計
-        tag_stats = {}
-        for record in records:
-            tag_name = record.get("tag") or "タグなし"
-            if tag_name not in tag_stats:
-                tag_stats[tag_name] = {
-                    "tag": tag_name,
-                    "count": 0,
-                    "totalDuration": 0
-                }
-            tag_stats[tag_name]["count"] += 1
-            tag_stats[tag_name]["totalDuration"] += record.get("duration", 0)
+        query, parameters = build_records_query(
+            timer_id, tag, start_date, end_date,
+            fields="c.startTime, c.duration",
+            ordered=False
+        )
+        items = [item async for item in records_store.query_records(query, parameters, timer_id=timer_id)]
         
-        return {
-            "totalCount": total_count,
-            "totalDuration": total_duration,
-            "averageDuration": average_duration,
-            "byTimer": list(timer_stats.values()),
-            "byTag": list(tag_stats.values())
-        }
+        starts = record_analytics.to_local_seconds((item.get("startTime") for item in items), tz)
+        durations = [item.get("duration") or 0 for item in items]
+        return record_analytics.compute_heatmap(starts, durations)
     
     except exceptions.CosmosHttpResponseError as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch summary: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch heatmap: {str(e)}")
+
+
+@router.get("/stats/breakdown")
+async def get_records_breakdown(
+    group_by: str = Query(records_cache.GROUP_BY_DATE, alias="groupBy"),
+    timer_id: Optional[str] = Query(None, alias="timerId"),
+    tag: Optional[str] = None,
+    start_date: Optional[str] = Query(None, alias="startDate"),
+    end_date: Optional[str] = Query(None, alias="endDate")
+):
+    """
+    タイマー別・タグ別・日別の件数と合計時間を取得
+    
+    groupBy: timer / tag / date（デフォルト: date）
+    ローカルの列指向キャッシュから計算するため、期間を変えた再集計でもRUを消費しない
+    """
+    if group_by not in (records_cache.GROUP_BY_TIMER, records_cache.GROUP_BY_TAG, records_cache.GROUP_BY_DATE):
+        raise HTTPException(status_code=400, detail="groupBy must be one of: timer, tag, date")
+    
+    try:
+        cache = await run_in_threadpool(records_cache.get_synced_records_cache)
+        return cache.breakdown(group_by, timer_id=timer_id, tag=tag, start_date=start_date, end_date=end_date)
+    
+    except exceptions.CosmosHttpResponseError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch breakdown: {str(e)}")
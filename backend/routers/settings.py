@@ -2,7 +2,8 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 from azure.cosmos import exceptions
-from database import settings_container
+from database import SETTINGS_CONTAINER
+from storage import get_container
 
 router = APIRouter()
 
@@ -22,7 +23,7 @@ SETTINGS_ID = "app-settings"
 async def get_settings():
     """設定取得"""
     try:
-        settings = settings_container.read_item(item=SETTINGS_ID, partition_key=SETTINGS_ID)
+        settings = await get_container(SETTINGS_CONTAINER).read_item(item=SETTINGS_ID, partition_key=SETTINGS_ID)
         return {
             "theme": settings.get("theme", "purple"),
             "soundEnabled": settings.get("soundEnabled", True),
@@ -47,9 +48,10 @@ async def get_settings():
 @router.put("/")
 async def update_settings(settings: Settings):
     """設定更新"""
+    settings_container = get_container(SETTINGS_CONTAINER)
     try:
         # 既存の設定を取得
-        existing_settings = settings_container.read_item(item=SETTINGS_ID, partition_key=SETTINGS_ID)
+        existing_settings = await settings_container.read_item(item=SETTINGS_ID, partition_key=SETTINGS_ID)
         existing_settings["theme"] = settings.theme
         if settings.soundEnabled is not None:
             existing_settings["soundEnabled"] = settings.soundEnabled
@@ -63,7 +65,7 @@ async def update_settings(settings: Settings):
             existing_settings["googleCalendarId"] = settings.googleCalendarId
         if settings.weatherApiKey is not None:
             existing_settings["weatherApiKey"] = settings.weatherApiKey
-        updated_settings = settings_container.upsert_item(body=existing_settings)
+        updated_settings = await settings_container.upsert_item(body=existing_settings)
         return {
             "theme": updated_settings.get("theme"),
             "soundEnabled": updated_settings.get("soundEnabled", True),
@@ -85,7 +87,7 @@ async def update_settings(settings: Settings):
             "googleCalendarId": settings.googleCalendarId if settings.googleCalendarId is not None else "",
             "weatherApiKey": settings.weatherApiKey if settings.weatherApiKey is not None else ""
         }
-        created_settings = settings_container.create_item(body=new_settings)
+        created_settings = await settings_container.create_item(body=new_settings)
         return {
             "theme": created_settings.get("theme"),
             "soundEnabled": created_settings.get("soundEnabled", True),
@@ -1,10 +1,15 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 from azure.cosmos import exceptions
-from database import timers_container, tags_container, records_container
+from database import TAGS_CONTAINER, TIMERS_CONTAINER
+from storage import get_container
+import records_cache
+import records_store
 import time
+import rollups
 
 router = APIRouter()
 
@@ -35,6 +40,9 @@ class TimerCreate(BaseModel):
 # ストップウォッチの固定ID
 STOPWATCH_ID = "stopwatch-fixed"
 
+# お気に入り切り替えで、同時更新と競合した場合に読み直す回数
+TOGGLE_MAX_ATTEMPTS = 5
+
 # アクティブなタイマーの開始時刻を保存（インメモリ）
 active_timers: dict = {}
 
@@ -44,10 +52,8 @@ async def get_timers():
     try:
         # すべてのタイマーを取得（ORDER BYは使わない）
         query = "SELECT * FROM c"
-        items = list(timers_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        timers_container = get_container(TIMERS_CONTAINER)
+        items = [item async for item in timers_container.query_items(query=query)]
         # orderフィールドでソート（ない場合は0として扱う）
         items.sort(key=lambda x: x.get('order', 0))
         return items
@@ -62,10 +68,8 @@ async def create_timer(timer: TimerCreate):
         timer_id = f"timer-{int(datetime.now().timestamp() * 1000)}"
         
         # 現在の最大order値を取得（すべてのタイマーを取得してPython側で計算）
-        all_timers = list(timers_container.query_items(
-            query="SELECT * FROM c",
-            enable_cross_partition_query=True
-        ))
+        timers_container = get_container(TIMERS_CONTAINER)
+        all_timers = [t async for t in timers_container.query_items(query="SELECT * FROM c")]
         max_order = max([t.get('order', 0) for t in all_timers], default=-1)
         
         new_timer = {
@@ -78,7 +82,7 @@ async def create_timer(timer: TimerCreate):
             "isFavorite": timer.isFavorite or False
         }
         
-        created_item = timers_container.create_item(body=new_timer)
+        created_item = await timers_container.create_item(body=new_timer)
         return created_item
     except exceptions.CosmosHttpResponseError as e:
         print(f"❌ Cosmos DB Error: {e.message}")
@@ -96,7 +100,7 @@ async def create_timer(timer: TimerCreate):
 async def start_timer(timer_id: str):
     """タイマー開始"""
     try:
-        timer = timers_container.read_item(item=timer_id, partition_key=timer_id)
+        timer = await get_container(TIMERS_CONTAINER).read_item(item=timer_id, partition_key=timer_id)
     except exceptions.CosmosResourceNotFoundError:
         raise HTTPException(status_code=404, detail="Timer not found")
     
@@ -109,7 +113,7 @@ async def start_timer(timer_id: str):
 async def stop_timer(timer_id: str, tag: Optional[str] = None, stamp: Optional[str] = None, comment: Optional[str] = None):
     """タイマー停止と記録保存"""
     try:
-        timer = timers_container.read_item(item=timer_id, partition_key=timer_id)
+        timer = await get_container(TIMERS_CONTAINER).read_item(item=timer_id, partition_key=timer_id)
     except exceptions.CosmosResourceNotFoundError:
         raise HTTPException(status_code=404, detail="Timer not found")
     
@@ -140,7 +144,8 @@ async def stop_timer(timer_id: str, tag: Optional[str] = None, stamp: Optional[s
         }
         
         # Cosmos DBのrecordsコンテナに保存
-        records_container.create_item(body=record)
+        created_record = await records_store.create_record(record)
+        await rollups.apply_record_safely(created_record)
     
     return {
         "message": "Timer stopped" + (" and saved" if tag is not None else " without saving"),
@@ -152,14 +157,25 @@ async def stop_timer(timer_id: str, tag: Optional[str] = None, stamp: Optional[s
 
 @router.get("/{timer_id}/records")
 async def get_timer_records(timer_id: str):
-    """特定のタイマーの記録取得（recordsコンテナから）"""
+    """
+    特定のタイマーの記録取得
+
+    ローカルの記録キャッシュ（records_cache.py）から返すため、RUを消費しない
+    """
     try:
-        # recordsコンテナから該当タイマーの記録を取得
-        query = f"SELECT * FROM c WHERE c.timerId = '{timer_id}' ORDER BY c.startTime DESC"
-        records = list(records_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        try:
+            cache = await run_in_threadpool(records_cache.get_synced_records_cache)
+            return await run_in_threadpool(cache.timer_records, timer_id)
+        except OSError as e:
+            print(f"Warning: Records cache unavailable, querying Cosmos DB: {e}")
+        
+        # recordsコンテナから該当タイマーの記録を取得（移行後は単一パーティションクエリ）
+        query = "SELECT * FROM c WHERE c.timerId = @timerId ORDER BY c.startTime DESC"
+        records = [record async for record in records_store.query_records(
+            query,
+            [{"name": "@timerId", "value": timer_id}],
+            timer_id=timer_id
+        )]
         return records
     except exceptions.CosmosHttpResponseError as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch records: {e.message}")
@@ -176,7 +192,7 @@ async def delete_timer(timer_id: str):
         raise HTTPException(status_code=400, detail="Cannot delete running timer")
     
     try:
-        timers_container.delete_item(item=timer_id, partition_key=timer_id)
+        await get_container(TIMERS_CONTAINER).delete_item(item=timer_id, partition_key=timer_id)
         return {"message": "Timer deleted", "timer_id": timer_id}
     except exceptions.CosmosResourceNotFoundError:
         raise HTTPException(status_code=404, detail="Timer not found")
@@ -187,14 +203,11 @@ async def get_all_tags():
     try:
         # タグコンテナから全タグを取得
         query = "SELECT c.name FROM c"
-        items = list(tags_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        items = [item async for item in get_container(TAGS_CONTAINER).query_items(query=query)]
         tags = [item["name"] for item in items]
         return {"tags": tags}
     except exceptions.CosmosHttpResponseError as e:
-        return {"tags": []}
+        raise HTTPException(status_code=500, detail=f"Failed to fetch tags: {e.message}")
 
 @router.post("/tags")
 async def add_tag(tag: str):
@@ -205,10 +218,8 @@ async def add_tag(tag: str):
     try:
         # タグが既に存在するか確認
         query = f"SELECT * FROM c WHERE c.name = '{tag}'"
-        existing = list(tags_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        tags_container = get_container(TAGS_CONTAINER)
+        existing = [item async for item in tags_container.query_items(query=query)]
         
         if existing:
             return {"message": "Tag already exists", "tag": tag}
@@ -219,7 +230,7 @@ async def add_tag(tag: str):
             "id": tag_id,
             "name": tag
         }
-        tags_container.create_item(body=new_tag)
+        await tags_container.create_item(body=new_tag)
         return {"message": "Tag added", "tag": tag}
     except exceptions.CosmosHttpResponseError as e:
         raise HTTPException(status_code=500, detail=f"Failed to add tag: {e.message}")
@@ -232,8 +243,9 @@ class TimerUpdate(BaseModel):
 @router.put("/{timer_id}")
 async def update_timer(timer_id: str, update: TimerUpdate):
     """タイマー更新"""
+    timers_container = get_container(TIMERS_CONTAINER)
     try:
-        timer = timers_container.read_item(item=timer_id, partition_key=timer_id)
+        timer = await timers_container.read_item(item=timer_id, partition_key=timer_id)
     except exceptions.CosmosResourceNotFoundError:
         raise HTTPException(status_code=404, detail="Timer not found")
     
@@ -251,7 +263,7 @@ async def update_timer(timer_id: str, update: TimerUpdate):
             timer["image"] = update.image
     
     # Cosmos DBを更新
-    updated_timer = timers_container.upsert_item(body=timer)
+    updated_timer = await timers_container.upsert_item(body=timer)
     return updated_timer
 
 class TimerReorder(BaseModel):
@@ -262,11 +274,12 @@ async def reorder_timers(reorder: TimerReorder):
     """タイマーの並び順を更新"""
     try:
         # 各タイマーのorderを更新
+        timers_container = get_container(TIMERS_CONTAINER)
         for index, timer_id in enumerate(reorder.timerIds):
             try:
-                timer = timers_container.read_item(item=timer_id, partition_key=timer_id)
+                timer = await timers_container.read_item(item=timer_id, partition_key=timer_id)
                 timer["order"] = index
-                timers_container.upsert_item(body=timer)
+                await timers_container.upsert_item(body=timer)
             except exceptions.CosmosResourceNotFoundError:
                 continue
         
@@ -276,12 +289,26 @@ async def reorder_timers(reorder: TimerReorder):
 
 @router.put("/{timer_id}/favorite")
 async def toggle_favorite(timer_id: str):
-    """タイマーのお気に入り状態を切り替え"""
+    """
+    タイマーのお気に入り状態を切り替え
+
+    読み取った時点のETagを条件にisFavoriteだけを書き換える。
+    間に他の更新があった場合は読み直して切り替え直す
+    """
     try:
-        timer = timers_container.read_item(item=timer_id, partition_key=timer_id)
-        timer["isFavorite"] = not timer.get("isFavorite", False)
-        updated_timer = timers_container.upsert_item(body=timer)
-        return updated_timer
+        timers_container = get_container(TIMERS_CONTAINER)
+        for _ in range(TOGGLE_MAX_ATTEMPTS):
+            timer = await timers_container.read_item(item=timer_id, partition_key=timer_id)
+            try:
+                return await timers_container.patch_item(
+                    item=timer_id,
+                    partition_key=timer_id,
+                    patch_operations=[{"op": "set", "path": "/isFavorite", "value": not timer.get("isFavorite", False)}],
+                    etag=timer.get("_etag")
+                )
+            except exceptions.CosmosAccessConditionFailedError:
+                continue
+        raise HTTPException(status_code=409, detail="Timer was updated concurrently, please retry")
     except exceptions.CosmosResourceNotFoundError:
         raise HTTPException(status_code=404, detail="Timer not found")
     except exceptions.CosmosHttpResponseError as e:
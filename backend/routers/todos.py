@@ -2,11 +2,13 @@
 Todos router - やることリスト機能
 """
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, timedelta
 import uuid
-from database import get_todos_container
+from database import TODOS_CONTAINER
+from storage import get_container
 
 router = APIRouter()
 
@@ -66,7 +68,7 @@ async def get_todos(
 ):
     """やることリスト一覧取得"""
     try:
-        container = get_todos_container()
+        container = get_container(TODOS_CONTAINER)
         
         # クエリ構築
         query = "SELECT * FROM c WHERE 1=1"
@@ -82,12 +84,10 @@ async def get_todos(
         # 注: ORDER BYは複合インデックスが必要なため、フロントエンド側でソート
         # query += " ORDER BY c.completed ASC, c.dueDate ASC"
         
-        todos = list(container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        todos = [item async for item in container.query_items(query=query)]
         
-        return {"data": todos[:limit]}
+        # ドキュメントはJSONの型だけなので jsonable_encoder を通さずに変換する
+        return ORJSONResponse({"data": todos[:limit]})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -95,8 +95,8 @@ async def get_todos(
 async def get_todo(todo_id: str):
     """やること詳細取得"""
     try:
-        container = get_todos_container()
-        todo = container.read_item(item=todo_id, partition_key=todo_id)
+        container = get_container(TODOS_CONTAINER)
+        todo = await container.read_item(item=todo_id, partition_key=todo_id)
         return {"data": todo}
     except Exception as e:
         if "404" in str(e):
@@ -107,7 +107,7 @@ async def get_todo(todo_id: str):
 async def create_todo(todo: TodoCreate):
     """やること新規作成"""
     try:
-        container = get_todos_container()
+        container = get_container(TODOS_CONTAINER)
         
         new_todo = {
             "id": str(uuid.uuid4()),
@@ -124,7 +124,7 @@ async def create_todo(todo: TodoCreate):
             "recurring": todo.recurring.dict() if todo.recurring else None
         }
         
-        container.create_item(body=new_todo)
+        await container.create_item(body=new_todo)
         return {"data": new_todo}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -133,9 +133,9 @@ async def create_todo(todo: TodoCreate):
 async def update_todo(todo_id: str, update: TodoUpdate):
     """やること更新"""
     try:
-        container = get_todos_container()
+        container = get_container(TODOS_CONTAINER)
         
-        todo = container.read_item(item=todo_id, partition_key=todo_id)
+        todo = await container.read_item(item=todo_id, partition_key=todo_id)
         
         # 更新
         if update.title is not None:
@@ -161,7 +161,7 @@ async def update_todo(todo_id: str, update: TodoUpdate):
         if update.recurring is not None:
             todo["recurring"] = update.recurring.dict() if update.recurring else None
         
-        container.replace_item(item=todo_id, body=todo)
+        await container.replace_item(item=todo_id, body=todo)
         return {"data": todo}
     except Exception as e:
         if "404" in str(e):
@@ -172,8 +172,8 @@ async def update_todo(todo_id: str, update: TodoUpdate):
 async def delete_todo(todo_id: str):
     """やること削除"""
     try:
-        container = get_todos_container()
-        container.delete_item(item=todo_id, partition_key=todo_id)
+        container = get_container(TODOS_CONTAINER)
+        await container.delete_item(item=todo_id, partition_key=todo_id)
         return {"message": "Todo deleted successfully"}
     except Exception as e:
         if "404" in str(e):
@@ -184,13 +184,16 @@ async def delete_todo(todo_id: str):
 async def complete_todo(todo_id: str):
     """やること完了マーク"""
     try:
-        container = get_todos_container()
+        container = get_container(TODOS_CONTAINER)
         
-        todo = container.read_item(item=todo_id, partition_key=todo_id)
-        todo["completed"] = True
-        todo["completedAt"] = datetime.utcnow().isoformat()
-        
-        container.replace_item(item=todo_id, body=todo)
+        todo = await container.patch_item(
+            item=todo_id,
+            partition_key=todo_id,
+            patch_operations=[
+                {"op": "set", "path": "/completed", "value": True},
+                {"op": "set", "path": "/completedAt", "value": datetime.utcnow().isoformat()}
+            ]
+        )
         
         # 繰り返し設定がある場合、次のタスクを生成
         if todo.get("recurring"):
@@ -234,7 +237,7 @@ async def generate_next_recurring_todo(completed_todo: dict):
             return
     
     # 新しいタスクを作成
-    container = get_todos_container()
+    container = get_container(TODOS_CONTAINER)
     new_todo = {
         "id": str(uuid.uuid4()),
         "title": completed_todo["title"],
@@ -253,20 +256,17 @@ async def generate_next_recurring_todo(completed_todo: dict):
         "recurring": recurring
     }
     
-    container.create_item(body=new_todo)
+    await container.create_item(body=new_todo)
 
 @router.post("/todos/recurring/generate")
 async def generate_recurring_todos():
     """期限切れの繰り返しタスクを自動生成"""
     try:
-        container = get_todos_container()
+        container = get_container(TODOS_CONTAINER)
         
         # 繰り返し設定があり、完了済みのタスクを取得
         query = "SELECT * FROM c WHERE c.recurring != null AND c.completed = true"
-        completed_recurring_todos = list(container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        completed_recurring_todos = [item async for item in container.query_items(query=query)]
         
         generated_count = 0
         for todo in completed_recurring_todos:
@@ -299,13 +299,10 @@ def should_generate_next(todo: dict) -> bool:
 async def get_categories():
     """カテゴリ一覧取得"""
     try:
-        container = get_todos_container()
+        container = get_container(TODOS_CONTAINER)
         
         query = "SELECT DISTINCT c.category FROM c WHERE c.category != null"
-        categories = list(container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        categories = [item async for item in container.query_items(query=query)]
         
         category_list = [c["category"] for c in categories if c.get("category")]
         return {"data": category_list}
@@ -316,14 +313,11 @@ async def get_categories():
 async def get_tags():
     """タグ一覧取得"""
     try:
-        container = get_todos_container()
+        container = get_container(TODOS_CONTAINER)
         
         # すべてのTodoを取得してタグを集計
         query = "SELECT c.tags FROM c"
-        todos = list(container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        todos = [item async for item in container.query_items(query=query)]
         
         tags_set = set()
         for todo in todos:
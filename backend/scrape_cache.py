@@ -0,0 +1,256 @@
+"""
+レシピのスクレイピング用のディスクキャッシュ
+
+同じURLを取り込み直す・プレビューし直すたびに、ページ全体を取得してパースしていた。
+このモジュールは取得したページと、パースしたレシピ情報をディスクに保存する。
+
+- ページの本文は ETag / Last-Modified と一緒にURLごとに保存し、SCRAPE_CACHE_FRESH 秒を
+  過ぎたら条件付きリクエスト（If-None-Match / If-Modified-Since）で再検証する。
+  304 なら保存済みの本文を使う（本文は再送されない）
+- パースしたレシピ情報は本文のハッシュとパーサーの名前をキーに保存する。
+  本文が同じならパースを省略する（URLが違っても同じページなら使い回す）
+- 全体のサイズが SCRAPE_CACHE_MAX_BYTES を超えたら、最近使っていないファイルから削除する
+
+キャッシュは SCRAPE_CACHE_DIR（デフォルト: scrape_cache）に保存され、削除しても次の取得で作り直される。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+import http_client
+
+CACHE_DIR = os.getenv("SCRAPE_CACHE_DIR", "scrape_cache")
+
+# キャッシュ全体のサイズの上限（バイト、0で無効）
+MAX_BYTES = int(os.getenv("SCRAPE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# 取得してからこの秒数のあいだは再検証せずに保存済みの本文を使う
+FRESH_SECONDS = float(os.getenv("SCRAPE_CACHE_FRESH", "300"))
+
+# 上限を超えたときに、このサイズ（上限に対する割合）まで削除する
+_EVICT_TO = 0.9
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class ScrapeCache:
+    """ページの本文・検証子（ETag / Last-Modified）・パース結果のディスクキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = MAX_BYTES, fresh_seconds: float = FRESH_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self._lock = threading.Lock()
+        # ディレクトリ内のファイルの合計サイズ（最初に使うときに数える）
+        self._size: Optional[int] = None
+        self._stats = {"fresh": 0, "revalidated": 0, "fetched": 0, "parsedHits": 0, "parsedMisses": 0, "evicted": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    # ------------------------------------------------------------------
+    # ファイル
+    # ------------------------------------------------------------------
+
+    def _response_path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest()[:32] + ".response.json")
+
+    def _body_path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.body")
+
+    def _parsed_path(self, parser: str, digest: str) -> str:
+        return os.path.join(self.directory, f"{parser}.{digest}.parsed.json")
+
+    def _read(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        # 最近使ったファイルとして削除の順番を後ろにする
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write(self, path: str, data: bytes):
+        """一時ファイル経由で置き換える（書き込み途中で中断しても壊れない）"""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._ensure_size_locked()
+            try:
+                previous = os.path.getsize(path)
+            except OSError:
+                previous = 0
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._size += len(data) - previous
+            if self._size > self.max_bytes:
+                self._evict_locked()
+
+    def _ensure_size_locked(self):
+        if self._size is None:
+            self._size = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def _evict_locked(self):
+        """最近使っていないファイルから削除する"""
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        target = self.max_bytes * _EVICT_TO
+        for entry in entries:
+            if self._size <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._size -= size
+            self._stats["evicted"] += 1
+
+    # ------------------------------------------------------------------
+    # ページ
+    # ------------------------------------------------------------------
+
+    def lookup(self, url: str) -> Optional[Tuple[dict, bytes]]:
+        """保存済みの (検証子などのメタデータ, 本文)。なければ（削除済みを含む） None"""
+        raw = self._read(self._response_path(url))
+        if raw is None:
+            return None
+        try:
+            meta = json.loads(raw)
+        except ValueError:
+            return None
+        compressed = self._read(self._body_path(meta.get("contentHash", "")))
+        if compressed is None:
+            return None
+        try:
+            return meta, zlib.decompress(compressed)
+        except zlib.error:
+            return None
+
+    def store(self, url: str, body: bytes, etag: Optional[str], last_modified: Optional[str]) -> str:
+        """本文と検証子を保存し、本文のハッシュを返す"""
+        digest = content_hash(body)
+        if not os.path.exists(self._body_path(digest)):
+            self._write(self._body_path(digest), zlib.compress(body))
+        self._write_meta(url, {
+            "url": url,
+            "etag": etag,
+            "lastModified": last_modified,
+            "contentHash": digest,
+            "fetchedAt": time.time(),
+        })
+        return digest
+
+    def refresh(self, url: str, meta: dict):
+        """304 で再検証できたので、取得日時を更新する"""
+        self._write_meta(url, {**meta, "fetchedAt": time.time()})
+
+    def _write_meta(self, url: str, meta: dict):
+        self._write(self._response_path(url), json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+    def is_fresh(self, meta: dict) -> bool:
+        return time.time() - meta.get("fetchedAt", 0) < self.fresh_seconds
+
+    # ------------------------------------------------------------------
+    # パース結果
+    # ------------------------------------------------------------------
+
+    def get_parsed(self, parser: str, digest: str) -> Optional[dict]:
+        raw = self._read(self._parsed_path(parser, digest)) if self.enabled else None
+        if raw is None:
+            self._count("parsedMisses")
+            return None
+        try:
+            parsed = json.loads(raw)
+        except ValueError:
+            self._count("parsedMisses")
+            return None
+        self._count("parsedHits")
+        return parsed
+
+    def put_parsed(self, parser: str, digest: str, parsed: dict):
+        if not self.enabled:
+            return
+        try:
+            self._write(self._parsed_path(parser, digest), json.dumps(parsed, ensure_ascii=False).encode("utf-8"))
+        except OSError as e:
+            print(f"Warning: Failed to save scrape cache: {e}")
+
+    # ------------------------------------------------------------------
+    # 取得
+    # ------------------------------------------------------------------
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[bytes, str]:
+        """
+        ページの本文を取得（キャッシュが新しければ通信しない。古ければ条件付きリクエストで再検証）
+
+        失敗した場合は httpx.HTTPError（4xx/5xx を含む）
+
+        Returns:
+            (本文, 本文のハッシュ)
+        """
+        cached = self.lookup(url) if self.enabled else None
+        headers = dict(headers or {})
+        if cached is not None:
+            meta, body = cached
+            if self.is_fresh(meta):
+                self._count("fresh")
+                return body, meta["contentHash"]
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("lastModified"):
+                headers["If-Modified-Since"] = meta["lastModified"]
+
+        response = await http_client.get(url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            self._count("revalidated")
+            try:
+                self.refresh(url, meta)
+            except OSError as e:
+                print(f"Warning: Failed to save scrape cache: {e}")
+            return body, meta["contentHash"]
+        response.raise_for_status()
+
+        self._count("fetched")
+        body = response.content
+        if not self.enabled or "no-store" in response.headers.get("cache-control", "").lower():
+            return body, content_hash(body)
+        try:
+            digest = self.store(url, body, response.headers.get("etag"), response.headers.get("last-modified"))
+        except OSError as e:
+            print(f"Warning: Failed to save scrape cache: {e}")
+            digest = content_hash(body)
+        return body, digest
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "bytes": self._size or 0, "maxBytes": self.max_bytes}
+
+
+# グローバルインスタンス
+_scrape_cache = None
+
+
+def get_scrape_cache() -> ScrapeCache:
+    """スクレイピングキャッシュのシングルトンインスタンスを取得"""
+    global _scrape_cache
+    if _scrape_cache is None:
+        _scrape_cache = ScrapeCache()
+    return _scrape_cache
@@ -0,0 +1,944 @@
+"""
+埋め込みSQLiteのストレージ実装（STORAGE_BACKEND=sqlite、storage.py を参照）
+
+コンテナごとに1テーブルを作り、ドキュメントはJSONのまま doc 列に保存する。
+クエリはアプリで使っている範囲の Cosmos DB SQL を JSON1 関数
+（json_extract / json_each / json_type）を使ったSQLに変換して実行する。
+よく絞り込み・並べ替えに使う項目には json_extract の式インデックスを張る。
+
+- 1つの接続をロックで共有する（ローカルファイルのため1回の処理はミリ秒未満で終わる）
+- 非同期のメソッドはスレッドプールで実行し、イベントループをブロックしない
+- 変更フィードの代わりに、書き込みごとに増える lsn 列の位置を継続トークンにする
+  （Cosmos DBと同じく削除は変更として現れない）
+- ページングの継続トークンは結果の先頭からの件数
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from azure.cosmos import exceptions
+from fastapi.concurrency import run_in_threadpool
+import db_metrics
+from database import (
+    CONTAINER_PARTITION_KEYS,
+    DEFAULT_ITEMS,
+    POMODORO_SESSIONS_CONTAINER,
+    RECIPES_CONTAINER,
+    RECORD_ROLLUPS_CONTAINER,
+    RECORDS_BY_TIMER_CONTAINER,
+    RECORDS_CONTAINER,
+    TODOS_CONTAINER
+)
+from storage import Container
+
+# データベースファイル
+SQLITE_PATH = os.getenv("SQLITE_PATH", "app.db")
+
+# json_extract の式インデックスを張る項目（絞り込み・並べ替えに使うもの）
+INDEXED_FIELDS = {
+    RECORDS_CONTAINER: ["timerId", "date", "tag", "startTime"],
+    RECORDS_BY_TIMER_CONTAINER: ["timerId", "date", "tag", "startTime"],
+    RECORD_ROLLUPS_CONTAINER: ["timerId", "date", "tag"],
+    POMODORO_SESSIONS_CONTAINER: ["timerId", "startedAt"],
+    RECIPES_CONTAINER: ["createdAt"],
+    TODOS_CONTAINER: ["createdAt"],
+}
+
+# ページ単位で読まない場合に1回で取得する件数
+SCAN_PAGE_SIZE = 1000
+
+# by_page() で max_item_count を指定しない場合の1ページの件数
+DEFAULT_PAGE_SIZE = 100
+
+_connection: Optional[sqlite3.Connection] = None
+_lock = threading.RLock()
+_containers: Dict[str, "SQLiteContainer"] = {}
+
+
+@contextmanager
+def _measured(operation: str):
+    """ロックを取得して処理し、ロック待ちを含む所要時間を db_metrics に記録する"""
+    started = time.perf_counter()
+    try:
+        with _lock:
+            yield
+    finally:
+        db_metrics.record(operation, time.perf_counter() - started)
+
+
+def _connect() -> sqlite3.Connection:
+    global _connection
+    with _lock:
+        if _connection is None:
+            connection = sqlite3.connect(SQLITE_PATH, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            _connection = connection
+            _create_tables(connection)
+    return _connection
+
+
+def _create_tables(connection: sqlite3.Connection):
+    for name in CONTAINER_PARTITION_KEYS:
+        connection.execute(
+            f'CREATE TABLE IF NOT EXISTS "{name}" ('
+            "id TEXT NOT NULL, pk TEXT NOT NULL, doc TEXT NOT NULL, lsn INTEGER NOT NULL, "
+            "PRIMARY KEY (pk, id))"
+        )
+        connection.execute(f'CREATE INDEX IF NOT EXISTS "{name}_id" ON "{name}" (id)')
+        connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{name}_lsn" ON "{name}" (lsn)')
+        for field in INDEXED_FIELDS.get(name, []):
+            connection.execute(
+                f'CREATE INDEX IF NOT EXISTS "{name}_{field}" '
+                f"ON \"{name}\" (json_extract(doc, '$.{field}'))"
+            )
+
+
+def close():
+    """接続を閉じる"""
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+        _containers.clear()
+
+
+def _ensure_defaults():
+    for name, item in DEFAULT_ITEMS.items():
+        try:
+            get_sync_container(name).create_item(body=dict(item))
+            print(f"Default item '{item['id']}' created")
+        except exceptions.CosmosResourceExistsError:
+            pass
+
+
+async def bootstrap() -> bool:
+    """テーブル・インデックスと初期ドキュメントを作成"""
+    await run_in_threadpool(_ensure_defaults)
+    print(f"SQLite database '{SQLITE_PATH}' initialized")
+    return True
+
+
+def get_sync_container(name: str) -> "SQLiteSyncContainer":
+    return get_container(name).sync
+
+
+def get_container(name: str) -> "SQLiteContainer":
+    with _lock:
+        if name not in _containers:
+            if name not in CONTAINER_PARTITION_KEYS:
+                raise ValueError(f"Unknown container: {name}")
+            _containers[name] = SQLiteContainer(SQLiteSyncContainer(name, CONTAINER_PARTITION_KEYS[name]))
+        return _containers[name]
+
+
+# ----------------------------------------------------------------------
+# Cosmos DB SQL → SQLite
+# ----------------------------------------------------------------------
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<number>\d+(?:\.\d+)?)
+      | (?P<param>@\w+)
+      | (?P<name>[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)
+      | (?P<op>!=|<>|<=|>=|[=<>?:(),*+\-/])
+    )""", re.VERBOSE)
+
+_KEYWORDS = {
+    "SELECT", "TOP", "DISTINCT", "VALUE", "FROM", "WHERE", "ORDER", "BY", "ASC", "DESC",
+    "OFFSET", "LIMIT", "AND", "OR", "NOT", "IN", "AS", "TRUE", "FALSE", "NULL"
+}
+
+_AGGREGATES = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
+
+# 結果の形
+DOCUMENT = "document"   # SELECT * / SELECT c.a, c.b（ドキュメントを取得してPython側で射影）
+PATH_VALUE = "path"     # SELECT VALUE c.a（未定義の値は結果に含めない）
+EXPRESSION = "expression"  # SELECT VALUE COUNT(1) など
+
+
+def _tokenize(query: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = _TOKEN_PATTERN.match(query, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Unsupported query syntax near: {query[position:position + 20]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "name" and value.upper() in _KEYWORDS:
+            kind, value = "keyword", value.upper()
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+class _Expression:
+    """変換後のSQL式（path はドキュメント内の項目を指す場合のJSONパス）"""
+
+    def __init__(self, sql: str, path: Optional[str] = None, aggregate: bool = False):
+        self.sql = sql
+        self.path = path
+        self.aggregate = aggregate
+
+
+class TranslatedQuery:
+    """変換済みのクエリ（ページングはページャーがLIMIT/OFFSETを付けて行う）"""
+
+    def __init__(self):
+        self.select = "doc"
+        self.where: List[str] = []
+        self.order_by: List[str] = []
+        self.parameters: Dict[str, Any] = {}
+        self.shape = DOCUMENT
+        self.fields: Optional[List[Tuple[str, str]]] = None
+        self.distinct = False
+        self.aggregate = False
+        self.offset = 0
+        self.limit: Optional[int] = None
+        # 変換前のクエリ（計測のラベル用）
+        self.query = ""
+
+    @property
+    def paged(self) -> bool:
+        """LIMIT/OFFSETでページングできるか（集計と、Python側で重複除去する射影は1ページで返す）"""
+        return not (self.aggregate or (self.distinct and self.shape == DOCUMENT))
+
+    def sql(self, table: str, paged: bool, where: List[str]) -> str:
+        distinct = "DISTINCT " if self.distinct and self.shape != DOCUMENT else ""
+        sql = f'SELECT {distinct}{self.select} FROM "{table}"'
+        if where:
+            sql += " WHERE " + " AND ".join(f"({condition})" for condition in where)
+        if self.order_by:
+            sql += " ORDER BY " + ", ".join(self.order_by)
+        elif paged:
+            # ページングの結果を安定させる
+            sql += " ORDER BY rowid"
+        if paged:
+            sql += " LIMIT :_limit OFFSET :_offset"
+        return sql
+
+
+class _Parser:
+    """Cosmos DB SQL の SELECT 文を TranslatedQuery に変換"""
+
+    def __init__(self, query: str, parameters: Optional[List[dict]]):
+        self.query = query
+        self.tokens = _tokenize(query)
+        self.position = 0
+        self.result = TranslatedQuery()
+        for parameter in parameters or []:
+            self.result.parameters[parameter["name"].lstrip("@")] = _bind_value(parameter["value"])
+        self.alias = self._find_alias()
+
+    # --- トークン操作 ---
+
+    def _peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def _accept(self, kind: str, value: Optional[str] = None) -> Optional[str]:
+        token_kind, token_value = self._peek()
+        if token_kind == kind and (value is None or token_value == value):
+            self.position += 1
+            return token_value
+        return None
+
+    def _expect(self, kind: str, value: Optional[str] = None) -> str:
+        accepted = self._accept(kind, value)
+        if accepted is None:
+            raise ValueError(f"Unsupported query (expected {value or kind}): {self.query}")
+        return accepted
+
+    def _find_alias(self) -> str:
+        for index, (kind, value) in enumerate(self.tokens[:-1]):
+            if kind == "keyword" and value == "FROM" and self.tokens[index + 1][0] == "name":
+                return self.tokens[index + 1][1]
+        raise ValueError(f"Unsupported query (FROM not found): {self.query}")
+
+    # --- 文 ---
+
+    def parse(self) -> TranslatedQuery:
+        result = self.result
+        self._expect("keyword", "SELECT")
+        if self._accept("keyword", "TOP"):
+            result.limit = self._integer()
+        result.distinct = self._accept("keyword", "DISTINCT") is not None
+        if self._accept("keyword", "VALUE"):
+            expression = self._expression()
+            if expression.path and not expression.aggregate:
+                result.shape = PATH_VALUE
+                result.select = (
+                    f"json_quote({expression.sql}), json_type(doc, '{expression.path}')"
+                )
+            else:
+                result.shape = EXPRESSION
+                result.select = expression.sql
+                result.aggregate = expression.aggregate
+        elif self._accept("op", "*"):
+            result.shape = DOCUMENT
+        else:
+            result.fields = [self._projection()]
+            while self._accept("op", ","):
+                result.fields.append(self._projection())
+
+        self._expect("keyword", "FROM")
+        self._expect("name")
+        if self._accept("keyword", "WHERE"):
+            result.where.append(self._expression().sql)
+        if self._accept("keyword", "ORDER"):
+            self._expect("keyword", "BY")
+            result.order_by.append(self._order_item())
+            while self._accept("op", ","):
+                result.order_by.append(self._order_item())
+        if self._accept("keyword", "OFFSET"):
+            result.offset = self._integer()
+            self._expect("keyword", "LIMIT")
+            limit = self._integer()
+            result.limit = limit if result.limit is None else min(result.limit, limit)
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unsupported query syntax near {self._peek()[1]!r}: {self.query}")
+        return result
+
+    def _integer(self) -> int:
+        parameter = self._accept("param")
+        if parameter:
+            return int(self.result.parameters[parameter.lstrip("@")])
+        return int(self._expect("number"))
+
+    def _projection(self) -> Tuple[str, str]:
+        expression = self._primary()
+        if not expression.path:
+            raise ValueError(f"Unsupported projection (only c.field is supported): {self.query}")
+        name = expression.path.rsplit(".", 1)[-1]
+        if self._accept("keyword", "AS"):
+            name = self._expect("name")
+        return name, expression.path
+
+    def _order_item(self) -> str:
+        expression = self._primary()
+        direction = self._accept("keyword", "DESC") or self._accept("keyword", "ASC") or "ASC"
+        return f"{expression.sql} {direction}"
+
+    # --- 式 ---
+
+    def _expression(self) -> _Expression:
+        condition = self._or()
+        if self._accept("op", "?"):
+            when_true = self._expression()
+            self._expect("op", ":")
+            when_false = self._expression()
+            return _Expression(
+                f"CASE WHEN {condition.sql} THEN {when_true.sql} ELSE {when_false.sql} END",
+                aggregate=condition.aggregate or when_true.aggregate or when_false.aggregate
+            )
+        return condition
+
+    def _or(self) -> _Expression:
+        left = self._and()
+        while self._accept("keyword", "OR"):
+            right = self._and()
+            left = _Expression(f"({left.sql} OR {right.sql})", aggregate=left.aggregate or right.aggregate)
+        return left
+
+    def _and(self) -> _Expression:
+        left = self._not()
+        while self._accept("keyword", "AND"):
+            right = self._not()
+            left = _Expression(f"({left.sql} AND {right.sql})", aggregate=left.aggregate or right.aggregate)
+        return left
+
+    def _not(self) -> _Expression:
+        if self._accept("keyword", "NOT"):
+            operand = self._not()
+            return _Expression(f"(NOT {operand.sql})", aggregate=operand.aggregate)
+        return self._comparison()
+
+    def _comparison(self) -> _Expression:
+        left = self._arithmetic()
+        if self._accept("keyword", "IN"):
+            self._expect("op", "(")
+            values = [self._arithmetic().sql]
+            while self._accept("op", ","):
+                values.append(self._arithmetic().sql)
+            self._expect("op", ")")
+            return _Expression(f"{left.sql} IN ({', '.join(values)})")
+        kind, operator = self._peek()
+        if kind != "op" or operator not in ("=", "!=", "<>", "<", "<=", ">", ">="):
+            return left
+        self.position += 1
+        right = self._arithmetic()
+        if "NULL" in (left.sql, right.sql) and operator in ("=", "!=", "<>"):
+            operand = right if left.sql == "NULL" else left
+            return _Expression(f"{operand.sql} IS {'NOT ' if operator != '=' else ''}NULL")
+        if operator == "<>":
+            operator = "!="
+        return _Expression(f"{left.sql} {operator} {right.sql}", aggregate=left.aggregate or right.aggregate)
+
+    def _arithmetic(self) -> _Expression:
+        left = self._primary()
+        while self._peek() in (("op", "+"), ("op", "-"), ("op", "*"), ("op", "/")):
+            operator = self._peek()[1]
+            self.position += 1
+            right = self._primary()
+            left = _Expression(f"({left.sql} {operator} {right.sql})", aggregate=left.aggregate or right.aggregate)
+        return left
+
+    def _primary(self) -> _Expression:
+        kind, value = self._peek()
+        if kind is None:
+            raise ValueError(f"Unexpected end of query: {self.query}")
+        self.position += 1
+        if kind == "op" and value == "(":
+            expression = self._expression()
+            self._expect("op", ")")
+            return _Expression(f"({expression.sql})", aggregate=expression.aggregate)
+        if kind == "op" and value == "-":
+            operand = self._primary()
+            return _Expression(f"(-{operand.sql})")
+        if kind == "number":
+            return _Expression(value)
+        if kind == "string":
+            return _Expression(_sql_string(_unescape(value[1:-1])))
+        if kind == "param":
+            name = value.lstrip("@")
+            if name not in self.result.parameters:
+                raise ValueError(f"Missing query parameter: {value}")
+            return _Expression(f":{name}")
+        if kind == "keyword" and value in ("TRUE", "FALSE"):
+            return _Expression("1" if value == "TRUE" else "0")
+        if kind == "keyword" and value == "NULL":
+            return _Expression("NULL")
+        if kind == "name" and self._peek() == ("op", "("):
+            return self._function(value.upper())
+        if kind == "name":
+            return self._path(value)
+        raise ValueError(f"Unsupported query syntax near {value!r}: {self.query}")
+
+    def _path(self, name: str) -> _Expression:
+        alias, _, field = name.partition(".")
+        if alias != self.alias or not field:
+            raise ValueError(f"Unsupported reference {name!r}: {self.query}")
+        path = f"$.{field}"
+        if field == "id":
+            return _Expression("id", path)
+        return _Expression(f"json_extract(doc, '{path}')", path)
+
+    def _arguments(self) -> List[_Expression]:
+        self._expect("op", "(")
+        arguments = []
+        if not self._accept("op", ")"):
+            arguments.append(self._expression())
+            while self._accept("op", ","):
+                arguments.append(self._expression())
+            self._expect("op", ")")
+        return arguments
+
+    def _require_path(self, function: str, argument: _Expression) -> str:
+        if not argument.path:
+            raise ValueError(f"{function} supports only c.field arguments: {self.query}")
+        return argument.path
+
+    def _function(self, function: str) -> _Expression:
+        arguments = self._arguments()
+        sqls = [argument.sql for argument in arguments]
+
+        if function in _AGGREGATES:
+            if function == "SUM":
+                # 対象がない場合もCosmos DBと同じく0を返す
+                return _Expression(f"COALESCE(SUM({sqls[0]}), 0)", aggregate=True)
+            return _Expression(f"{function}({sqls[0]})", aggregate=True)
+
+        if function == "IS_DEFINED":
+            return _Expression(f"json_type(doc, '{self._require_path(function, arguments[0])}') IS NOT NULL")
+        if function == "IS_NULL":
+            return _Expression(f"json_type(doc, '{self._require_path(function, arguments[0])}') = 'null'")
+        if function == "IS_NUMBER":
+            return _Expression(
+                f"json_type(doc, '{self._require_path(function, arguments[0])}') IN ('integer', 'real')"
+            )
+        if function == "IS_STRING":
+            return _Expression(f"json_type(doc, '{self._require_path(function, arguments[0])}') = 'text'")
+        if function == "IS_BOOL":
+            return _Expression(
+                f"json_type(doc, '{self._require_path(function, arguments[0])}') IN ('true', 'false')"
+            )
+        if function == "ARRAY_CONTAINS" and len(arguments) == 2:
+            path = self._require_path(function, arguments[0])
+            return _Expression(f"EXISTS (SELECT 1 FROM json_each(doc, '{path}') WHERE value = {sqls[1]})")
+        if function == "ARRAY_LENGTH":
+            return _Expression(f"json_array_length(doc, '{self._require_path(function, arguments[0])}')")
+        if function in ("CONTAINS", "STARTSWITH", "ENDSWITH") and len(arguments) in (2, 3):
+            text, search = sqls[0], sqls[1]
+            if len(arguments) == 3 and sqls[2] == "1":
+                text, search = f"lower({text})", f"lower({search})"
+            if function == "CONTAINS":
+                return _Expression(f"instr({text}, {search}) > 0")
+            if function == "STARTSWITH":
+                return _Expression(f"substr({text}, 1, length({search})) = {search}")
+            return _Expression(f"substr({text}, -length({search})) = {search}")
+        if function in ("LOWER", "UPPER", "LENGTH", "TRIM") and len(arguments) == 1:
+            return _Expression(f"{function.lower()}({sqls[0]})")
+        raise ValueError(f"Unsupported function {function}: {self.query}")
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+def _bind_value(value: Any) -> Any:
+    """クエリパラメータをSQLiteに渡せる値に変換（json_extract の戻り値と比較できるようにする）"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def translate(query: str, parameters: Optional[List[dict]] = None) -> TranslatedQuery:
+    """Cosmos DB SQL を変換（対応していない構文は ValueError）"""
+    translated = _Parser(query, parameters).parse()
+    translated.query = db_metrics.normalize_query(query)
+    return translated
+
+
+# ----------------------------------------------------------------------
+# コンテナ
+# ----------------------------------------------------------------------
+
+# Cosmos DBが付けるシステム項目（保存時に付け直す）
+_SYSTEM_FIELDS = {"_rid", "_self", "_etag", "_attachments", "_ts", "_lsn"}
+
+
+def _pk(value: Any) -> str:
+    # 型の違う同じ表記の値を区別するためJSONで保存する
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _not_found(item: str) -> exceptions.CosmosResourceNotFoundError:
+    return exceptions.CosmosResourceNotFoundError(
+        status_code=404,
+        message=f"Entity with the specified id does not exist in the system: {item}"
+    )
+
+
+def _apply_patch(document: dict, operations: List[dict]) -> dict:
+    for operation in operations:
+        op = operation["op"]
+        keys = operation["path"].strip("/").split("/")
+        parent = document
+        for key in keys[:-1]:
+            parent = parent.setdefault(key, {})
+        if op in ("add", "set", "replace"):
+            parent[keys[-1]] = operation["value"]
+        elif op == "incr":
+            parent[keys[-1]] = parent.get(keys[-1], 0) + operation["value"]
+        elif op == "remove":
+            parent.pop(keys[-1], None)
+        else:
+            raise exceptions.CosmosHttpResponseError(status_code=400, message=f"Unsupported patch operation: {op}")
+    return document
+
+
+class SQLiteSyncContainer:
+    """SQLiteのテーブル1つ分（同期）。スレッドから呼んでよい"""
+
+    def __init__(self, name: str, partition_key_path: str):
+        self.id = name
+        self.partition_key_field = partition_key_path.lstrip("/")
+
+    # --- 書き込み ---
+
+    def _stamp(self, connection: sqlite3.Connection, body: dict) -> Tuple[dict, int]:
+        """システム項目（_etag, _ts）を付けた保存用のドキュメントと lsn を作る"""
+        document = {key: value for key, value in body.items() if key not in _SYSTEM_FIELDS}
+        document["_etag"] = f'"{uuid.uuid4()}"'
+        document["_ts"] = int(time.time())
+        lsn = connection.execute(f'SELECT COALESCE(MAX(lsn), 0) + 1 FROM "{self.id}"').fetchone()[0]
+        return document, lsn
+
+    def _write(self, connection: sqlite3.Connection, mode: str, body: dict, item: Optional[str] = None) -> dict:
+        if "id" not in body:
+            raise exceptions.CosmosHttpResponseError(status_code=400, message="The input content is invalid: id is required")
+        if item is not None and item != body["id"]:
+            raise exceptions.CosmosHttpResponseError(status_code=400, message="The id in the body does not match the item")
+        document, lsn = self._stamp(connection, body)
+        row = (document["id"], _pk(document.get(self.partition_key_field)), json.dumps(document, ensure_ascii=False), lsn)
+        if mode == "create":
+            try:
+                connection.execute(f'INSERT INTO "{self.id}" (id, pk, doc, lsn) VALUES (?, ?, ?, ?)', row)
+            except sqlite3.IntegrityError:
+                raise exceptions.CosmosResourceExistsError(
+                    status_code=409,
+                    message=f"Entity with the specified id already exists in the system: {document['id']}"
+                )
+        elif mode == "upsert":
+            connection.execute(
+                f'INSERT INTO "{self.id}" (id, pk, doc, lsn) VALUES (?, ?, ?, ?) '
+                "ON CONFLICT (pk, id) DO UPDATE SET doc = excluded.doc, lsn = excluded.lsn",
+                row
+            )
+        else:
+            cursor = connection.execute(
+                f'UPDATE "{self.id}" SET doc = ?, lsn = ? WHERE pk = ? AND id = ?',
+                (row[2], lsn, row[1], row[0])
+            )
+            if cursor.rowcount == 0:
+                raise _not_found(document["id"])
+        return document
+
+    def _read(self, connection: sqlite3.Connection, item: str, partition_key: Any) -> dict:
+        row = connection.execute(
+            f'SELECT doc FROM "{self.id}" WHERE pk = ? AND id = ?', (_pk(partition_key), item)
+        ).fetchone()
+        if row is None:
+            raise _not_found(item)
+        return json.loads(row[0])
+
+    def _delete(self, connection: sqlite3.Connection, item: str, partition_key: Any):
+        cursor = connection.execute(f'DELETE FROM "{self.id}" WHERE pk = ? AND id = ?', (_pk(partition_key), item))
+        if cursor.rowcount == 0:
+            raise _not_found(item)
+
+    def _patch(
+        self,
+        connection: sqlite3.Connection,
+        item: str,
+        partition_key: Any,
+        operations: List[dict],
+        etag: Optional[str] = None
+    ) -> dict:
+        document = self._read(connection, item, partition_key)
+        if etag is not None and document.get("_etag") != etag:
+            raise exceptions.CosmosAccessConditionFailedError(
+                status_code=412,
+                message="Operation cannot be performed because one of the specified precondition is not met."
+            )
+        return self._write(connection, "replace", _apply_patch(document, operations), item)
+
+    def read_item(self, item: str, partition_key: Any) -> dict:
+        with _measured("GET docs"):
+            return self._read(_connect(), item, partition_key)
+
+    def read_item_if_modified(self, item: str, partition_key: Any, etag: str) -> Optional[dict]:
+        document = self.read_item(item, partition_key)
+        return None if document.get("_etag") == etag else document
+
+    def create_item(self, body: dict) -> dict:
+        with _measured("POST docs"):
+            return self._write(_connect(), "create", body)
+
+    def upsert_item(self, body: dict) -> dict:
+        with _measured("POST docs"):
+            return self._write(_connect(), "upsert", body)
+
+    def replace_item(self, item: str, body: dict) -> dict:
+        with _measured("PUT docs"):
+            return self._write(_connect(), "replace", body, item)
+
+    def patch_item(self, item: str, partition_key: Any, patch_operations: List[dict], etag: Optional[str] = None) -> dict:
+        with _measured("PATCH docs"):
+            connection = _connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                document = self._patch(connection, item, partition_key, patch_operations, etag)
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return document
+
+    def delete_item(self, item: str, partition_key: Any):
+        with _measured("DELETE docs"):
+            self._delete(_connect(), item, partition_key)
+
+    def execute_item_batch(self, batch_operations: List[tuple], partition_key: Any) -> List[dict]:
+        """
+        操作を1つのトランザクションで実行
+
+        batch_operations: [("create", (body,)), ("upsert", (body,)), ("replace", (item, body)),
+                           ("patch", (item, operations)), ("read", (item,)), ("delete", (item,))]
+        """
+        responses = []
+        with _measured("POST batch"):
+            connection = _connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for index, operation in enumerate(batch_operations):
+                    name, args = operation[0], operation[1]
+                    try:
+                        if name in ("create", "upsert"):
+                            if _pk(args[0].get(self.partition_key_field)) != _pk(partition_key):
+                                raise exceptions.CosmosHttpResponseError(
+                                    status_code=400, message="Partition key in the item does not match the batch"
+                                )
+                            document = self._write(connection, name, args[0])
+                            responses.append({"statusCode": 201 if name == "create" else 200, "resourceBody": document})
+                        elif name == "replace":
+                            document = self._write(connection, "replace", args[1], args[0])
+                            responses.append({"statusCode": 200, "resourceBody": document})
+                        elif name == "patch":
+                            document = self._patch(connection, args[0], partition_key, args[1])
+                            responses.append({"statusCode": 200, "resourceBody": document})
+                        elif name == "read":
+                            responses.append({"statusCode": 200, "resourceBody": self._read(connection, args[0], partition_key)})
+                        elif name == "delete":
+                            self._delete(connection, args[0], partition_key)
+                            responses.append({"statusCode": 204})
+                        else:
+                            raise exceptions.CosmosHttpResponseError(status_code=400, message=f"Unsupported batch operation: {name}")
+                    except exceptions.CosmosHttpResponseError as e:
+                        raise exceptions.CosmosBatchOperationError(
+                            error_index=index,
+                            headers={},
+                            status_code=e.status_code,
+                            message=e.message,
+                            operation_responses=responses + [{"statusCode": e.status_code}]
+                        )
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        return responses
+
+    def bulk_upsert(self, documents: List[dict]) -> int:
+        """
+        大量のドキュメントを1つのトランザクションで作成または置き換え（ベンチマークの初期データ用）
+
+        パーティションキーの制約はない（Cosmos DBの API にはない、SQLite実装だけのメソッド）
+
+        Returns:
+            書き込んだ件数
+        """
+        with _measured("POST bulk"):
+            connection = _connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for document in documents:
+                    self._write(connection, "upsert", document)
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        return len(documents)
+
+    # --- 読み取り ---
+
+    def fetch(
+        self,
+        translated: TranslatedQuery,
+        partition_key: Any = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Tuple[List[Any], bool]:
+        """
+        変換済みのクエリを実行
+
+        Args:
+            offset: 結果の先頭から読み飛ばす件数（ページング）
+            limit: 取得する件数（Noneなら残りすべて）
+
+        Returns:
+            (結果, 続きがあるか)
+        """
+        parameters = dict(translated.parameters)
+        where = list(translated.where)
+        if partition_key is not None:
+            where.append("pk = :_pk")
+            parameters["_pk"] = _pk(partition_key)
+
+        paged = translated.paged
+        remaining = None if translated.limit is None else max(0, translated.limit - offset)
+        if paged:
+            if limit is None or (remaining is not None and remaining <= limit):
+                page_size = remaining
+            else:
+                page_size = limit
+            # 続きがあるかを判定するため1件多く取得する
+            parameters["_limit"] = -1 if page_size is None else page_size + 1
+            parameters["_offset"] = translated.offset + offset
+
+        sql = translated.sql(self.id, paged, where)
+
+        with _measured(translated.query):
+            rows = _connect().execute(sql, parameters).fetchall()
+
+        has_more = False
+        if paged and page_size is not None and len(rows) > page_size:
+            rows = rows[:page_size]
+            has_more = remaining is None or page_size < remaining
+        return self._decode(translated, rows), has_more
+
+    def _decode(self, translated: TranslatedQuery, rows: List[tuple]) -> List[Any]:
+        if translated.shape == EXPRESSION:
+            return [row[0] for row in rows if row[0] is not None]
+        if translated.shape == PATH_VALUE:
+            return [json.loads(row[0]) for row in rows if row[1] is not None]
+        documents = [json.loads(row[0]) for row in rows]
+        if translated.fields is None:
+            return documents
+        results = []
+        seen = set()
+        for document in documents:
+            projected = {}
+            for name, path in translated.fields:
+                value = document
+                for key in path[2:].split("."):
+                    if not isinstance(value, dict) or key not in value:
+                        break
+                    value = value[key]
+                else:
+                    projected[name] = value
+            if translated.distinct:
+                key = json.dumps(projected, sort_keys=True)
+                if key in seen:
+                    continue
+                seen.add(key)
+            results.append(projected)
+        return results
+
+    def query_items(self, query: str, parameters: Optional[List[dict]] = None, partition_key: Any = None, **kwargs) -> Iterator[Any]:
+        """同期のクエリ（enable_cross_partition_query などのオプションは無視する）"""
+        translated = translate(query, parameters)
+        offset = 0
+        while True:
+            items, has_more = self.fetch(translated, partition_key, offset, SCAN_PAGE_SIZE)
+            yield from items
+            if not has_more:
+                return
+            offset += len(items)
+
+    def read_changes(
+        self,
+        continuations: Dict[str, str],
+        page_size: int,
+        start_from_beginning: bool
+    ) -> Iterator[Tuple[str, List[dict], Optional[str]]]:
+        """
+        change_feed.read_changes() のSQLite版（範囲IDは常に "0"、継続トークンは lsn）
+        """
+        continuation = continuations.get("0")
+        if continuation is None and not start_from_beginning:
+            with _measured("GET changes"):
+                latest = _connect().execute(f'SELECT COALESCE(MAX(lsn), 0) FROM "{self.id}"').fetchone()[0]
+            yield "0", [], str(latest)
+            return
+        position = int(continuation or 0)
+        while True:
+            with _measured("GET changes"):
+                rows = _connect().execute(
+                    f'SELECT doc, lsn FROM "{self.id}" WHERE lsn > ? ORDER BY lsn LIMIT ?',
+                    (position, page_size)
+                ).fetchall()
+            if rows:
+                position = rows[-1][1]
+            yield "0", [json.loads(doc) for doc, _ in rows], str(position)
+            if len(rows) < page_size:
+                return
+
+
+class _PageIterator:
+    """by_page() の戻り値。ページごとに async for で読めるイテレーターを返す"""
+
+    def __init__(self, container: SQLiteSyncContainer, translated: TranslatedQuery, partition_key, page_size: int, continuation_token: Optional[str]):
+        self._container = container
+        self._translated = translated
+        self._partition_key = partition_key
+        self._page_size = page_size
+        self._offset = int(continuation_token) if continuation_token else 0
+        self._done = False
+        self.continuation_token = continuation_token
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        items, has_more = await run_in_threadpool(
+            self._container.fetch, self._translated, self._partition_key, self._offset, self._page_size
+        )
+        self._offset += len(items)
+        self._done = not has_more
+        self.continuation_token = str(self._offset) if has_more else None
+        return _iterate(items)
+
+
+async def _iterate(items: List[Any]):
+    for item in items:
+        yield item
+
+
+class _ItemPaged:
+    """query_items() の戻り値（azure.cosmos.aio の AsyncItemPaged と同じ使い方ができる）"""
+
+    def __init__(self, container: SQLiteSyncContainer, translated: TranslatedQuery, partition_key, max_item_count: Optional[int]):
+        self._container = container
+        self._translated = translated
+        self._partition_key = partition_key
+        self._max_item_count = max_item_count
+
+    def by_page(self, continuation_token: Optional[str] = None) -> _PageIterator:
+        return _PageIterator(
+            self._container, self._translated, self._partition_key,
+            self._max_item_count or DEFAULT_PAGE_SIZE, continuation_token
+        )
+
+    async def _items(self):
+        pages = _PageIterator(
+            self._container, self._translated, self._partition_key,
+            self._max_item_count or SCAN_PAGE_SIZE, None
+        )
+        async for page in pages:
+            async for item in page:
+                yield item
+
+    def __aiter__(self):
+        return self._items()
+
+
+class SQLiteContainer(Container):
+    """SQLiteのテーブル1つ分（非同期。処理はスレッドプールで実行）"""
+
+    def __init__(self, sync: SQLiteSyncContainer):
+        self.sync = sync
+        self.id = sync.id
+
+    def query_items(self, query, parameters=None, partition_key=None, max_item_count=None):
+        return _ItemPaged(self.sync, translate(query, parameters), partition_key, max_item_count)
+
+    async def read_item(self, item, partition_key):
+        return await run_in_threadpool(self.sync.read_item, item, partition_key)
+
+    async def read_item_if_modified(self, item, partition_key, etag):
+        return await run_in_threadpool(self.sync.read_item_if_modified, item, partition_key, etag)
+
+    async def create_item(self, body):
+        return await run_in_threadpool(self.sync.create_item, body)
+
+    async def upsert_item(self, body):
+        return await run_in_threadpool(self.sync.upsert_item, body)
+
+    async def replace_item(self, item, body):
+        return await run_in_threadpool(self.sync.replace_item, item, body)
+
+    async def patch_item(self, item, partition_key, patch_operations, etag=None):
+        return await run_in_threadpool(self.sync.patch_item, item, partition_key, patch_operations, etag)
+
+    async def delete_item(self, item, partition_key):
+        await run_in_threadpool(self.sync.delete_item, item, partition_key)
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        return await run_in_threadpool(self.sync.execute_item_batch, batch_operations, partition_key)
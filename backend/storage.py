@@ -0,0 +1,215 @@
+"""
+ストレージの抽象化（Cosmos DB / 埋め込みSQLite）
+
+ルーターなどはコンテナを get_container(name) で取得し、Container のメソッドだけを使う。
+STORAGE_BACKEND で実装を切り替える。
+
+- cosmos: Azure Cosmos DB（デフォルト）
+- sqlite: 埋め込みSQLite（sqlite_storage.py を参照）。1台構成での運用や、
+          Cosmos DBのアカウントなしでのベンチマーク・開発用
+
+クエリはどちらの実装でも Cosmos DB SQL で書く（SQLite実装はアプリで使っている範囲を
+SQLに変換する）。エラーもどちらの実装でも azure.cosmos.exceptions の例外を送出するため、
+呼び出し側の例外処理はそのまま使える。
+"""
+import os
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional
+from azure.core import MatchConditions
+import database
+
+COSMOS = "cosmos"
+SQLITE = "sqlite"
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", COSMOS)
+
+if STORAGE_BACKEND not in (COSMOS, SQLITE):
+    raise ValueError(f"Invalid STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+
+class Container(ABC):
+    """
+    コンテナの共通インターフェース（非同期）
+
+    メソッド名・引数は azure.cosmos.aio の ContainerProxy に合わせている
+    """
+
+    id: str
+
+    @abstractmethod
+    def query_items(
+        self,
+        query: str,
+        parameters: Optional[List[dict]] = None,
+        partition_key: Any = None,
+        max_item_count: Optional[int] = None
+    ):
+        """
+        Cosmos DB SQL のクエリを実行
+
+        Args:
+            query: Cosmos DB SQL
+            parameters: [{"name": "@name", "value": 値}, ...]
+            partition_key: 指定すると単一パーティションのクエリになる
+            max_item_count: 1ページの件数
+
+        Returns:
+            async for で読めるページャー。by_page(continuation_token) でページ単位に読め、
+            ページイテレーターの continuation_token で続きを取得できる
+        """
+
+    @abstractmethod
+    async def read_item(self, item: str, partition_key: Any) -> dict:
+        """ポイント読み取り（存在しない場合は CosmosResourceNotFoundError）"""
+
+    @abstractmethod
+    async def read_item_if_modified(self, item: str, partition_key: Any, etag: str) -> Optional[dict]:
+        """ETagが etag と異なる場合だけ本文を返す（変更がなければ None）"""
+
+    @abstractmethod
+    async def create_item(self, body: dict) -> dict:
+        """作成（既に存在する場合は CosmosResourceExistsError）"""
+
+    @abstractmethod
+    async def upsert_item(self, body: dict) -> dict:
+        """作成または置き換え"""
+
+    @abstractmethod
+    async def replace_item(self, item: str, body: dict) -> dict:
+        """置き換え（存在しない場合は CosmosResourceNotFoundError）"""
+
+    @abstractmethod
+    async def patch_item(
+        self,
+        item: str,
+        partition_key: Any,
+        patch_operations: List[dict],
+        etag: Optional[str] = None
+    ) -> dict:
+        """
+        部分更新（op: add / set / replace / remove / incr）
+
+        etag を指定すると、その後に他の書き込みがあった場合は CosmosAccessConditionFailedError
+        """
+
+    @abstractmethod
+    async def delete_item(self, item: str, partition_key: Any):
+        """削除（存在しない場合は CosmosResourceNotFoundError）"""
+
+    @abstractmethod
+    async def execute_item_batch(self, batch_operations: List[tuple], partition_key: Any) -> List[dict]:
+        """
+        同じパーティションキーの操作をトランザクションで実行
+
+        失敗した場合は CosmosBatchOperationError（すべての操作が取り消される）
+        """
+
+
+class CosmosContainer(Container):
+    """azure.cosmos.aio のコンテナをそのまま呼び出す実装"""
+
+    def __init__(self, container):
+        self._container = container
+        self.id = container.id
+
+    def query_items(self, query, parameters=None, partition_key=None, max_item_count=None):
+        kwargs = {}
+        if partition_key is not None:
+            kwargs["partition_key"] = partition_key
+        if max_item_count is not None:
+            kwargs["max_item_count"] = max_item_count
+        return self._container.query_items(query=query, parameters=parameters or [], **kwargs)
+
+    async def read_item(self, item, partition_key):
+        return await self._container.read_item(item=item, partition_key=partition_key)
+
+    async def read_item_if_modified(self, item, partition_key, etag):
+        # 変更がなければ 304 Not Modified となり、本文なし（None）が返る
+        return await self._container.read_item(
+            item=item,
+            partition_key=partition_key,
+            etag=etag,
+            match_condition=MatchConditions.IfModified
+        )
+
+    async def create_item(self, body):
+        return await self._container.create_item(body=body)
+
+    async def upsert_item(self, body):
+        return await self._container.upsert_item(body=body)
+
+    async def replace_item(self, item, body):
+        return await self._container.replace_item(item=item, body=body)
+
+    async def patch_item(self, item, partition_key, patch_operations, etag=None):
+        kwargs = {}
+        if etag is not None:
+            kwargs = {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+        return await self._container.patch_item(
+            item=item,
+            partition_key=partition_key,
+            patch_operations=patch_operations,
+            **kwargs
+        )
+
+    async def delete_item(self, item, partition_key):
+        await self._container.delete_item(item=item, partition_key=partition_key)
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        return await self._container.execute_item_batch(
+            batch_operations=batch_operations,
+            partition_key=partition_key
+        )
+
+
+def get_container(name: str) -> Container:
+    """
+    Get container reference
+
+    イベントループ内（ルーターのハンドラーなど）から呼ぶこと。参照の取得自体は通信を伴わない。
+    設定・タイマー・レシピはポイント読み取りをキャッシュする（point_read_cache.py を参照）。
+    書き込みはコレクションのバージョンを上げる（collection_versions.py を参照）
+    """
+    import collection_versions
+    import point_read_cache
+    if STORAGE_BACKEND == SQLITE:
+        import sqlite_storage
+        container = sqlite_storage.get_container(name)
+    else:
+        container = CosmosContainer(database.get_async_container(name))
+    return collection_versions.wrap(name, point_read_cache.wrap(name, container))
+
+
+def get_sync_container(name: str):
+    """
+    Get sync container reference
+
+    変更フィードの読み取りなど、スレッドで実行する処理用。
+    query_items（同期のイテレーター）と change_feed.read_changes() に対応する
+    """
+    if STORAGE_BACKEND == SQLITE:
+        import sqlite_storage
+        return sqlite_storage.get_sync_container(name)
+    return database.get_database().get_container_client(name)
+
+
+async def bootstrap(force: bool = False) -> bool:
+    """
+    コンテナ（テーブル）と初期ドキュメントを作成（アプリ起動時）
+
+    Returns:
+        作成処理を実行した場合 True、プロビジョニング済みで省略した場合 False
+    """
+    if STORAGE_BACKEND == SQLITE:
+        import sqlite_storage
+        return await sqlite_storage.bootstrap()
+    return await database.bootstrap(force=force)
+
+
+async def close():
+    """接続を閉じる（アプリ終了時・スクリプト終了時）"""
+    if STORAGE_BACKEND == SQLITE:
+        import sqlite_storage
+        sqlite_storage.close()
+        return
+    await database.close_async_client()
@@ -1,5 +1,5 @@
 import api from './api';
-import type { Recipe, Timer, FashionItem, DailyOutfit, HomeImage, TimerRecord } from '../types';
+import type { Recipe, Timer, FashionItem, DailyOutfit, HomeImage, TimerRecord, TimerRecordPage } from '../types';
 import { pomodoroService } from './pomodoro';
 import { todoService } from './todos';
 
@@ -73,8 +73,13 @@ export const settingsService = {
 export const recordService = {
   getAll: (params?: { timerId?: string; tag?: string; startDate?: string; endDate?: string }) => 
     api.get<TimerRecord[]>('/records', { params }),
+  // ページ単位で取得（nextCursorがnullになるまで繰り返し呼び出す）
+  getPage: (params: { pageSize: number; cursor?: string | null; timerId?: string; tag?: string; startDate?: string; endDate?: string }) =>
+    api.get<TimerRecordPage>('/records', { params }),
   getById: (id: string) => api.get<TimerRecord>(`/records/${id}`),
   create: (record: Omit<TimerRecord, 'id'>) => api.post<TimerRecord>('/records', record),
+  createBulk: (records: Omit<TimerRecord, 'id'>[]) =>
+    api.post<{ created: number; failed: number; results: { index: number; id: string; status: 'created' | 'failed'; error?: string }[] }>('/records/bulk', { records }),
   createManual: (data: { timerId: string; timerName: string; duration: number; date: string; tag?: string; stamp?: string; comment?: string }) =>
     api.post<TimerRecord>('/records/manual', data),
   update: (id: string, updates: { duration?: number; date?: string; tag?: string; stamp?: string; comment?: string }) =>
@@ -82,4 +87,8 @@ export const recordService = {
   delete: (id: string) => api.delete(`/records/${id}`),
   getSummary: (params?: { timerId?: string; tag?: string }) =>
     api.get('/records/stats/summary', { params }),
+  getHeatmap: (params?: { timerId?: string; tag?: string; startDate?: string; endDate?: string; tz?: string }) =>
+    api.get<{ weekdays: string[]; heatmap: number[][]; daily: { date: string; totalDuration: number; count: number }[]; totalDuration: number }>('/records/stats/heatmap', { params }),
+  getBreakdown: (params: { groupBy: 'timer' | 'tag' | 'date'; timerId?: string; tag?: string; startDate?: string; endDate?: string }) =>
+    api.get<{ timerId?: string | null; timerName?: string | null; tag?: string | null; date?: string; count: number; totalDuration: number }[]>('/records/stats/breakdown', { params }),
 };
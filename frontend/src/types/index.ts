@@ -36,6 +36,11 @@ export interface TimerRecord {
   comment?: string; // コメント・メモ
 }
 
+export interface TimerRecordPage {
+  data: TimerRecord[];
+  nextCursor: string | null; // 次のページのカーソル（最終ページはnull）
+}
+
 export interface FashionItem {
   id?: string;
   imageUrl: string;